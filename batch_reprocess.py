@@ -0,0 +1,253 @@
+import os
+import sys
+import time
+import argparse
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from startup import LazyModule
+from stream_record import StreamRecording
+from dot_detect import find_dots_full, DEFAULT_DETECT_PARAMS
+from camera_config import load_detect_params, CONFIG_FILE
+from trajectory_log import TrajectoryWriter
+import triangulation
+
+cv = LazyModule("cv2")
+
+# 离线批量重新处理
+# 输入为一次记录的目录(main.py记录按钮生成): cam1/ cam2/ 原始数据流 calibration.npz 标定结果
+# 流程: 按时间切分为若干段 -> 进程池中每段独立 解码 + 检测 + 去畸变 + 配对 + 三角化 -> 按时间顺序合并
+# 配对: 以相机1的帧时刻为准 相机2的单点轨迹线性插值到该时刻(与time_sync相同的思路)
+# 每段向两侧多取margin秒的相机2数据 保证段边界处也能插值 段之间结果不重叠
+# 检测参数与实时运行相同: 各相机从camera_config.json读取(见camera_config.load_detect_params)
+ROLLING_OFFSET_WINDOW = 256  # 相机时钟偏差滚动最小值窗口(帧)
+
+
+# 每帧的时间(主机时钟 秒)
+# 有相机采集时间戳时: 采集时间 + 滚动最小(到达 - 采集) 去掉网络抖动 并跟随时钟漂移
+# 旧协议没有采集时间戳时直接使用到达时间
+def frame_times(recording):
+    arrival = np.asarray(recording.arrival, dtype=np.float64)
+    capture = np.asarray(recording.capture, dtype=np.int64)
+    if len(arrival) == 0 or not np.all(capture > 0):
+        return arrival
+    capture = capture / 1e6
+    offset = arrival - capture
+    if len(offset) > ROLLING_OFFSET_WINDOW:
+        half = ROLLING_OFFSET_WINDOW // 2
+        padded = np.pad(offset, (half, ROLLING_OFFSET_WINDOW - half - 1), mode="edge")
+        offset = np.lib.stride_tricks.sliding_window_view(padded, ROLLING_OFFSET_WINDOW).min(axis=1)
+    else:
+        offset = np.full_like(offset, offset.min())
+    return capture + offset
+
+
+# 检测一段帧 返回(时间, 点坐标(N, 2), 有效) 只保留恰好检测到一个点的帧
+# detect_params: 该相机的检测参数 见DEFAULT_DETECT_PARAMS
+def detect_frames(recording, times, first, last, detect_params):
+    stamps = []
+    points = []
+    for i in range(first, last):
+        jpeg = recording.frame(i)
+        image_points, num = find_dots_full(jpeg, **detect_params)
+        if num == 1:
+            stamps.append(times[i - first])
+            points.append(image_points[0])
+    return np.array(stamps, dtype=np.float64), np.array(points, dtype=np.float64).reshape(-1, 2)
+
+
+# 将轨迹(stamps, points)线性插值到query时刻 相邻样本间隔超过max_gap或超出范围的为无效
+def interpolate_track(stamps, points, query, max_gap):
+    if len(stamps) < 2:
+        return np.zeros((len(query), 2)), np.zeros(len(query), dtype=bool)
+    index = np.searchsorted(stamps, query)
+    inside = (index > 0) & (index < len(stamps))
+    index = np.clip(index, 1, len(stamps) - 1)
+    valid = inside & (stamps[index] - stamps[index - 1] <= max_gap)
+    result = np.stack([np.interp(query, stamps, points[:, 0]), np.interp(query, stamps, points[:, 1])], axis=1)
+    return result, valid
+
+
+# 进程池任务: 处理一段
+# task: paths/ranges/times 各相机的记录路径 帧序号范围 帧时间; start/stop 本段相机1的时间范围
+def process_chunk(task):
+    begin = time.perf_counter()
+    tracks = []
+    for path, (first, last), times, params in zip(task["paths"], task["ranges"], task["times"], task["detect_params"]):
+        tracks.append(detect_frames(StreamRecording(path), times, first, last, params))
+    stamps1, points1 = tracks[0]
+    keep = (stamps1 >= task["start"]) & (stamps1 < task["stop"])
+    stamps1, points1 = stamps1[keep], points1[keep]
+    points2, valid = interpolate_track(tracks[1][0], tracks[1][1], stamps1, task["max_gap"])
+    stamps1, points1, points2 = stamps1[valid], points1[valid], points2[valid]
+    result = {"timestamp": stamps1, "points1": points1, "points2": points2}
+    calibration = task["calibration"]
+    if calibration is not None and len(stamps1) > 0:
+        x1 = cv.undistortPoints(points1.reshape(-1, 1, 2), calibration["cam1_matrix"],
+                                calibration["cam1_dist"]).reshape(-1, 2)
+        x2 = cv.undistortPoints(points2.reshape(-1, 1, 2), calibration["cam2_matrix"],
+                                calibration["cam2_dist"]).reshape(-1, 2)
+        X, errors, tri_valid = triangulation.triangulate(calibration["cam1_proj"], calibration["cam2_proj"],
+                                                         x1, x2, task["method"])
+        errors = errors * np.array([calibration["cam1_matrix"][0, 0], calibration["cam2_matrix"][0, 0]])
+        result.update({"xyz": X, "error": errors.max(axis=1), "valid": tri_valid})
+    result["frames"] = sum(last - first for first, last in task["ranges"])
+    result["cost"] = time.perf_counter() - begin
+    return result
+
+
+# 把记录按相机1的时间切分为任务
+def make_tasks(session, chunk_seconds, margin, calibration, detect_params, max_gap, method):
+    paths = [os.path.join(session, "cam1"), os.path.join(session, "cam2")]
+    recordings = [StreamRecording(path) for path in paths]
+    times = [frame_times(recording) for recording in recordings]
+    if len(times[0]) == 0 or len(times[1]) == 0:
+        return []
+    tasks = []
+    start = times[0][0]
+    end = times[0][-1]
+    while start <= end:
+        stop = start + chunk_seconds
+        ranges = [(int(np.searchsorted(times[0], start)), int(np.searchsorted(times[0], stop)))]
+        ranges.append((int(np.searchsorted(times[1], start - margin)), int(np.searchsorted(times[1], stop + margin))))
+        tasks.append({
+            "paths": paths,
+            "ranges": ranges,
+            "times": [t[first:last] for t, (first, last) in zip(times, ranges)],
+            "start": start,
+            "stop": stop,
+            "calibration": calibration,
+            "detect_params": detect_params,
+            "max_gap": max_gap,
+            "method": method,
+        })
+        start = stop
+    return tasks
+
+
+# 重新处理整个记录 workers<=1时在本进程串行处理
+# config: 相机配置文件 None时使用默认检测参数 threshold: 不为None时覆盖两相机的阈值
+# 返回按时间排序的合并结果 以及统计
+def reprocess(session, calibration_path=None, chunk_seconds=10.0, workers=None,
+              threshold=None, max_gap=0.1, method="dlt", config=CONFIG_FILE):
+    if calibration_path is None and os.path.exists(os.path.join(session, "calibration.npz")):
+        calibration_path = os.path.join(session, "calibration.npz")
+    calibration = dict(np.load(calibration_path)) if calibration_path else None
+    detect_params = [load_detect_params(camera, config) if config else dict(DEFAULT_DETECT_PARAMS)
+                     for camera in (1, 2)]
+    if threshold is not None:
+        for params in detect_params:
+            params["threshold"] = threshold
+    tasks = make_tasks(session, chunk_seconds, max_gap * 2, calibration, detect_params, max_gap, method)
+    begin = time.perf_counter()
+    if workers is not None and workers <= 1:
+        results = [process_chunk(task) for task in tasks]
+    else:
+        # 主进程可能带有Qt线程 与detect_worker一致使用spawn
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+            results = list(pool.map(process_chunk, tasks))  # map保持任务顺序
+    wall = time.perf_counter() - begin
+    merged = {}
+    for key in ("timestamp", "points1", "points2", "xyz", "error", "valid"):
+        parts = [result[key] for result in results if key in result]
+        if parts:
+            merged[key] = np.concatenate(parts)
+    if "timestamp" in merged:
+        order = np.argsort(merged["timestamp"], kind="stable")  # 各段不重叠 已基本有序
+        merged = {key: value[order] for key, value in merged.items()}
+    stats = {
+        "chunks": len(tasks),
+        "frames": sum(result["frames"] for result in results),
+        "pairs": len(merged.get("timestamp", [])),
+        "wall": wall,
+        "cpu": sum(result["cost"] for result in results),
+    }
+    return merged, stats
+
+
+# 合并结果写入轨迹记录(trajectory_log格式)
+def write_trajectory(merged, path):
+    writer = TrajectoryWriter(path)
+    valid = merged["valid"]
+    writer.append_batch(merged["timestamp"][valid], 0, merged["xyz"][valid], merged["error"][valid], 0b11)
+    writer.close()
+    return writer.get_stats()
+
+
+# 生成合成记录: 模拟器两个相机拍摄已知轨迹 相机间相位不同 到达时间带网络抖动
+# 返回合成记录中相机1坐标系下的真值轨迹函数
+def make_synthetic_session(session, seconds=60.0, fps=30.0, seed=0):
+    from cam_simulator import DotPath, SimCamera, DotRenderer
+    from stream_record import StreamRecorder
+
+    rng = np.random.default_rng(seed)
+    path = DotPath()
+    cameras = [SimCamera(0, 4), SimCamera(1, 4)]  # 两相机光轴夹角90度
+    R1, t1 = cameras[0].R, cameras[0].t
+    R2, t2 = cameras[1].R, cameras[1].t
+    R = R2 @ R1.T
+    calibration = {
+        "cam1_matrix": cameras[0].K, "cam1_dist": np.zeros(5), "cam1_proj": np.hstack([np.eye(3), np.zeros((3, 1))]),
+        "cam2_matrix": cameras[1].K, "cam2_dist": np.zeros(5), "cam2_proj": np.hstack([R, (t2 - R @ t1).reshape(3, 1)]),
+    }
+    os.makedirs(session, exist_ok=True)
+    np.savez(os.path.join(session, "calibration.npz"), **calibration)
+    for index, (camera, phase) in enumerate(zip(cameras, (0.0, 0.4 / fps))):
+        renderer = DotRenderer(dot_radius=3.0, seed=index)
+        recorder = StreamRecorder(os.path.join(session, f"cam{index + 1}"), blocking=True)
+        for k in range(int(seconds * fps)):
+            t = phase + k / fps
+            pixels, visible = camera.project(path.positions(t))
+            arrival = t + 0.005 + rng.exponential(0.003)
+            recorder.append(renderer.render(pixels[visible]), arrival, int((t + 1000.0) * 1e6))
+        recorder.close()
+
+    def truth(t):
+        return np.stack([path.positions(x)[0] for x in t]) @ R1.T + t1
+
+    return truth
+
+
+# 用法:
+#   python batch_reprocess.py <记录目录> [--calibration calib.npz] [--workers N] [--out 输出目录]
+#   python batch_reprocess.py --synthetic [秒数]   生成合成记录 对比串行/并行耗时与三角化精度
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="offline batch reprocessing of recorded camera streams")
+    parser.add_argument("session", nargs="?", help="记录目录")
+    parser.add_argument("--calibration", help="标定文件 默认使用记录目录下的calibration.npz")
+    parser.add_argument("--chunk", type=float, default=10.0, help="每段时长(秒)")
+    parser.add_argument("--workers", type=int, default=None, help="进程数 默认CPU核数 1为串行")
+    parser.add_argument("--threshold", type=float, default=None, help="二值化阈值 默认使用camera_config.json")
+    parser.add_argument("--config", default=CONFIG_FILE, help="相机配置文件 各相机的检测参数")
+    parser.add_argument("--method", default="dlt", choices=list(triangulation.METHODS))
+    parser.add_argument("--out", help="结果写入的轨迹记录目录")
+    parser.add_argument("--synthetic", type=float, nargs="?", const=60.0, help="生成合成记录并测试")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        import tempfile
+        import shutil
+
+        session = os.path.join(tempfile.gettempdir(), "batch_reprocess_test")
+        shutil.rmtree(session, ignore_errors=True)
+        start = time.perf_counter()
+        truth = make_synthetic_session(session, args.synthetic)
+        print(f"synthetic session {args.synthetic:.0f} s: {time.perf_counter() - start:.1f} s to render")
+        for workers in (1, args.workers):
+            merged, stats = reprocess(session, chunk_seconds=args.chunk, workers=workers,
+                                      threshold=args.threshold, config=None)
+            # 帧时间含固定的最小网络延迟(5ms) 两相机相同 不影响配对
+            err = np.linalg.norm(merged["xyz"] - truth(merged["timestamp"] - 0.005), axis=1)
+            print(f"workers {workers or os.cpu_count()}: {stats['frames']} frames in {stats['wall']:.2f} s "
+                  f"({args.synthetic / stats['wall']:.1f}x real time, cpu {stats['cpu']:.2f} s), "
+                  f"{stats['pairs']} points, mean 3D error {err.mean():.4f}, "
+                  f"reprojection {np.median(merged['error']):.3f} px")
+        sys.exit(0)
+
+    if not args.session:
+        parser.error("session is required")
+    merged, stats = reprocess(args.session, args.calibration, args.chunk, args.workers, args.threshold,
+                              method=args.method, config=args.config)
+    print(stats)
+    if "xyz" in merged and args.out:
+        print(write_trajectory(merged, args.out))
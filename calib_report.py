@@ -0,0 +1,199 @@
+import os
+import sys
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from startup import LazyModule
+import triangulation
+
+cv = LazyModule("cv2")
+
+# 双目外参标定质量报告
+# 全部样本一次向量化计算: 逐样本重投影误差、Sampson对极误差、是否在两相机前方
+# 误差热力图: 按原始像素位置把图像划分为网格 统计每格样本数与平均误差 空格表示该区域缺少样本
+# 不确定度: 对内点有放回重采样后重新求解E与位姿(bootstrap) 统计旋转角度偏差与基线方向偏差
+#           (本质矩阵求得的基线只有方向没有尺度) 各次重采样互相独立 OpenCV求解时释放GIL 在线程池中并行
+# 样本坐标为去畸变后的理想相机像素坐标(与Calibration.get_ideal_samples一致)
+IMAGE_SIZE = (640, 480)
+HEATMAP_GRID = (8, 6)  # 热力图网格(列, 行)
+
+
+# 两个旋转矩阵之间的夹角(度) R_a/R_b: (..., 3, 3)
+def rotation_angle(R_a, R_b):
+    cos = (np.einsum("...ij,...ij->...", R_a, R_b) - 1) / 2  # trace(R_a^T R_b)
+    return np.degrees(np.arccos(np.clip(cos, -1.0, 1.0)))
+
+
+# 两个方向之间的夹角(度) a/b: (..., 3)
+def direction_angle(a, b):
+    a = a / np.linalg.norm(a, axis=-1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=-1, keepdims=True)
+    return np.degrees(np.arccos(np.clip(np.sum(a * b, axis=-1), -1.0, 1.0)))
+
+
+# 逐样本误差 返回 reprojection (N, 2) 像素, epipolar (N,) 像素, front (N,) 是否在两相机前方
+def sample_errors(cam1_array, cam2_array, R, t, cam_matrix):
+    f = cam_matrix[0, 0]
+    center = cam_matrix[:2, 2]
+    x1 = (cam1_array - center) / f
+    x2 = (cam2_array - center) / f
+    P1 = np.hstack((np.eye(3), np.zeros((3, 1))))
+    P2 = np.hstack((R, np.asarray(t, dtype=np.float64).reshape(-1, 1)))
+    _X, errors, front = triangulation.triangulate(P1, P2, x1, x2)
+    E = triangulation.essential_from_projections(P1, P2)
+    epipolar = triangulation.sampson_distance(E, x1, x2)
+    return errors * f, epipolar * f, front
+
+
+# 误差热力图 positions: (N, 2) 原始像素坐标 values: (N,) 返回(平均值 (行, 列) 无样本为nan, 样本数 (行, 列))
+def error_heatmap(positions, values, grid=HEATMAP_GRID, image_size=IMAGE_SIZE):
+    columns, rows = grid
+    cx = np.clip((positions[:, 0] * columns / image_size[0]).astype(np.int64), 0, columns - 1)
+    cy = np.clip((positions[:, 1] * rows / image_size[1]).astype(np.int64), 0, rows - 1)
+    cell = cy * columns + cx
+    count = np.bincount(cell, minlength=rows * columns)
+    total = np.bincount(cell, weights=values, minlength=rows * columns)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.where(count > 0, total / count, np.nan)
+    return mean.reshape(rows, columns), count.reshape(rows, columns)
+
+
+# 单次bootstrap求解 返回(R, t) 失败返回None
+def bootstrap_once(cam1_array, cam2_array, cam_matrix, threshold, seed):
+    rng = np.random.default_rng(seed)
+    index = rng.integers(0, len(cam1_array), len(cam1_array))
+    points1 = np.ascontiguousarray(cam1_array[index])
+    points2 = np.ascontiguousarray(cam2_array[index])
+    try:
+        E, _mask = cv.findEssentialMat(points1=points1, points2=points2, cameraMatrix=cam_matrix,
+                                       method=cv.RANSAC, threshold=threshold)
+        if E is None:
+            return None
+        _ret, R, t, _mask = cv.recoverPose(E=E[:3], points1=points1, points2=points2, cameraMatrix=cam_matrix)
+    except cv.error:
+        return None
+    return R, t.ravel()
+
+
+# 生成标定质量报告
+# cam1_array/cam2_array: 理想相机像素坐标 (N, 2); raw1/raw2: 原始像素坐标 用于热力图 默认同理想坐标
+# R, t: 待评价的相对位姿 bootstrap: 重采样次数 0为不计算不确定度
+def quality_report(cam1_array, cam2_array, R, t, cam_matrix, raw1=None, raw2=None, eval_threshold=2.0,
+                   bootstrap=200, threshold=2.0, workers=None, seed=0):
+    start = time.perf_counter()
+    cam1_array = np.asarray(cam1_array, dtype=np.float64)
+    cam2_array = np.asarray(cam2_array, dtype=np.float64)
+    raw1 = cam1_array if raw1 is None else np.asarray(raw1, dtype=np.float64)
+    raw2 = cam2_array if raw2 is None else np.asarray(raw2, dtype=np.float64)
+    reprojection, epipolar, front = sample_errors(cam1_array, cam2_array, R, t, cam_matrix)
+    inliers = front & (reprojection.max(axis=1) < eval_threshold)
+    inlier_reprojection = reprojection[inliers]
+    report = {
+        "samples": len(cam1_array),
+        "inliers": int(np.count_nonzero(inliers)),
+        "reprojection": reprojection,
+        "epipolar": epipolar,
+        "front": front,
+        "inlier_mask": inliers,
+        "reprojection_mean": float(inlier_reprojection.mean()) if len(inlier_reprojection) else np.inf,
+        "reprojection_p95": float(np.percentile(inlier_reprojection, 95)) if len(inlier_reprojection) else np.inf,
+        "epipolar_median": float(np.median(epipolar[inliers])) if np.any(inliers) else np.inf,
+        "epipolar_p95": float(np.percentile(epipolar[inliers], 95)) if np.any(inliers) else np.inf,
+        "heatmaps": [error_heatmap(raw1[inliers], reprojection[inliers, 0]),
+                     error_heatmap(raw2[inliers], reprojection[inliers, 1])],
+    }
+    report["coverage"] = [float(np.mean(count > 0)) for _mean, count in report["heatmaps"]]
+    # bootstrap 只在内点上重采样 外点已由RANSAC剔除 不应影响不确定度
+    rotation_errors = np.zeros(0)
+    baseline_errors = np.zeros(0)
+    if bootstrap > 0 and report["inliers"] >= 8:
+        points1 = cam1_array[inliers]
+        points2 = cam2_array[inliers]
+        seeds = np.random.SeedSequence(seed).generate_state(bootstrap)
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            results = [result for result in executor.map(
+                lambda s: bootstrap_once(points1, points2, cam_matrix, threshold, int(s)), seeds)
+                if result is not None]
+        if results:
+            rotation_errors = rotation_angle(np.stack([result[0] for result in results]), np.asarray(R)[None])
+            baseline_errors = direction_angle(np.stack([result[1] for result in results]),
+                                              np.asarray(t, dtype=np.float64).reshape(1, 3))
+    report["bootstrap"] = len(rotation_errors)
+    report["rotation_std_deg"] = float(np.sqrt(np.mean(rotation_errors ** 2))) if len(rotation_errors) else np.nan
+    report["rotation_p95_deg"] = float(np.percentile(rotation_errors, 95)) if len(rotation_errors) else np.nan
+    report["baseline_std_deg"] = float(np.sqrt(np.mean(baseline_errors ** 2))) if len(baseline_errors) else np.nan
+    report["baseline_p95_deg"] = float(np.percentile(baseline_errors, 95)) if len(baseline_errors) else np.nan
+    report["advice"] = make_advice(report)
+    report["time"] = time.perf_counter() - start
+    return report
+
+
+# 根据报告给出是否需要继续采样的建议
+# RANSAC返回的位姿来自最小样本集且未做优化 样本很多时不确定度也不会趋近于0 阈值留有余量
+def make_advice(report, min_inliers=50, min_coverage=0.5, max_rotation_deg=1.0, max_baseline_deg=3.0):
+    advice = []
+    if report["inliers"] < min_inliers:
+        advice.append(f"only {report['inliers']} inliers, collect at least {min_inliers}")
+    for index, coverage in enumerate(report["coverage"]):
+        if coverage < min_coverage:
+            advice.append(f"cam{index + 1} covers {coverage:.0%} of the image, move the marker into the empty cells")
+    if report["rotation_p95_deg"] > max_rotation_deg:
+        advice.append(f"rotation uncertainty p95 {report['rotation_p95_deg']:.2f} deg, collect more samples")
+    if report["baseline_p95_deg"] > max_baseline_deg:
+        advice.append(f"baseline direction uncertainty p95 {report['baseline_p95_deg']:.2f} deg, collect more samples")
+    return advice
+
+
+# 热力图文本 每格为平均误差(像素) 无样本显示 .
+def format_heatmap(mean):
+    return "\n".join(" ".join("   . " if np.isnan(value) else f"{value:5.2f}" for value in row) for row in mean)
+
+
+# 报告摘要文本
+def format_report(report, heatmaps=True):
+    lines = [
+        f"samples {report['samples']}, inliers {report['inliers']} ({report['inliers'] / max(report['samples'], 1):.1%}), "
+        f"{report['time']:.2f} s",
+        f"reprojection mean {report['reprojection_mean']:.3f} px, p95 {report['reprojection_p95']:.3f} px",
+        f"epipolar median {report['epipolar_median']:.3f} px, p95 {report['epipolar_p95']:.3f} px",
+        f"bootstrap x{report['bootstrap']}: rotation {report['rotation_std_deg']:.3f} deg rms "
+        f"(p95 {report['rotation_p95_deg']:.3f}), baseline direction {report['baseline_std_deg']:.3f} deg rms "
+        f"(p95 {report['baseline_p95_deg']:.3f})",
+        "coverage " + ", ".join(f"cam{i + 1} {coverage:.0%}" for i, coverage in enumerate(report["coverage"])),
+    ]
+    if heatmaps:
+        for index, (mean, _count) in enumerate(report["heatmaps"]):
+            lines.append(f"cam{index + 1} reprojection error heatmap (px):")
+            lines.append(format_heatmap(mean))
+    lines += [f"advice: {item}" for item in report["advice"]] or ["advice: calibration looks good"]
+    return "\n".join(lines)
+
+
+# 合成数据: 两相机看同一组随机三维点 加像素噪声与外点 样本数越多不确定度越小
+if __name__ == "__main__":
+    sample_nums = [int(arg) for arg in sys.argv[1:]] or [50, 200, 1000]
+    cam_matrix = np.array([[204.5, 0, 320], [0, 204.5, 240], [0, 0, 1]], dtype=np.float64)
+    R_true, _ = cv.Rodrigues(np.array([0.0, -0.5, 0.05]))
+    t_true = np.array([1.0, 0.0, 0.2])
+    t_true /= np.linalg.norm(t_true)
+    rng = np.random.default_rng(0)
+    for sample_num in sample_nums:
+        # 在cam1视野内均匀分布 深度2~6
+        depth = rng.uniform(2, 6, sample_num)
+        X = np.stack([rng.uniform(-1.4, 1.4, sample_num) * depth, rng.uniform(-1.0, 1.0, sample_num) * depth,
+                      depth], axis=1)
+        X = X[(X @ R_true.T + t_true)[:, 2] > 0.5]
+        sample_num = len(X)
+        p1 = (X / X[:, 2:3]) @ cam_matrix.T
+        X2 = X @ R_true.T + t_true
+        p2 = (X2 / X2[:, 2:3]) @ cam_matrix.T
+        cam1_array = p1[:, :2] + rng.normal(0, 0.5, (sample_num, 2))
+        cam2_array = p2[:, :2] + rng.normal(0, 0.5, (sample_num, 2))
+        outliers = rng.random(sample_num) < 0.05
+        cam2_array[outliers] = rng.uniform(0, 480, (np.count_nonzero(outliers), 2))
+        E, _mask = cv.findEssentialMat(cam1_array, cam2_array, cam_matrix, cv.RANSAC, 0.999, 2.0)
+        _ret, R, t, _mask = cv.recoverPose(E[:3], cam1_array, cam2_array, cam_matrix)
+        report = quality_report(cam1_array, cam2_array, R, t, cam_matrix)
+        print(f"--- {sample_num} samples: true rotation error {rotation_angle(R, R_true):.3f} deg, "
+              f"true baseline error {direction_angle(t.ravel(), t_true):.3f} deg")
+        print(format_report(report, heatmaps=sample_num == sample_nums[-1]))
@@ -1,12 +1,43 @@
-import cv2 as cv
 import numpy as np
-from collections import deque
 import os
+from concurrent.futures import ThreadPoolExecutor
 from PyQt5.QtCore import pyqtSignal, QObject
+from startup import LazyModule
+import triangulation
+import calib_report
+
+cv = LazyModule("cv2")  # OpenCV在首次标定/三角化时才加载
+
+
+# 标定采样点存储 预分配numpy数组(容量, 相机数, 2) 容量不足时倍增
+# 求解时只读取 不消耗样本 可更换参数重复求解
+class SampleStore:
+    def __init__(self, cam_num, capacity=256):
+        self.data = np.zeros((capacity, cam_num, 2), dtype=np.float64)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, points):
+        if self.count == len(self.data):
+            grown = np.zeros((len(self.data) * 2,) + self.data.shape[1:], dtype=np.float64)
+            grown[:self.count] = self.data
+            self.data = grown
+        self.data[self.count] = points
+        self.count += 1
+
+    def clear(self):
+        self.count = 0
+
+    # 某个相机的全部采样点(N, 2) 返回视图
+    def camera(self, index):
+        return self.data[:self.count, index]
 
 # cam_num: 使用的相机数量
 class Calibration(QObject):
     log_signal = pyqtSignal(str)  # logger
+    quality_signal = pyqtSignal(object, int)  # 后台线程完成的质量报告 (报告, 请求序号)
 
     def __init__(self, cam_num):
         super(QObject, self).__init__()
@@ -19,12 +50,19 @@ class Calibration(QObject):
         self.cam1_proj = np.array([[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, 0]])
         self.cam2_proj = np.array([[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, 0]])
 
-        # deque
-        self.cam_points = [deque() for _ in range(self.cam_num)]
-        # numpy array
-        self.cam_array = [np.array(None) for _ in range(self.cam_num)]
+        # 采样点
+        self.sample_store = SampleStore(self.cam_num)
         self.valid_points_num = 0  # 有效采集点数量
         self.calibration_ok = False  # 是否已经成功校准
+        self.quality = None  # 最近一次标定质量报告 见calib_report.py
+        self.quality_generation = 0  # 质量报告请求序号 位姿更新后旧请求的结果丢弃
+        self.quality_signal.connect(self.apply_quality)
+        # 求解参数扫描与质量报告共用的线程池 OpenCV求解时释放GIL 报告在后台计算不阻塞GUI线程
+        self.executor = None
+        self.sample_cloud = np.zeros((0, 3))  # 标定成功后有效采样点的三角化结果(cam1坐标系)
+        # 两相机光心间距(米) recoverPose只能得到单位长度的平移 设置后位姿与三角化结果均为米
+        # 0为未设置 三角化结果以基线长度为单位
+        self.baseline = 0.0
         # cam intrinsic
         self.cam1_fx = 204.64863681
         self.cam1_fy = 204.47041377
@@ -77,25 +115,19 @@ class Calibration(QObject):
             return
         else:
             self.valid_points_num += 1
-            for index in range(self.cam_num):
-                self.cam_points[index].append(points[index])
-            # self.cam_points[0].append(points[0])
-            # self.cam_points[1].append(points[1])
+            self.sample_store.append(points)
 
     # 清除所有采集的点
     def clear_all_points(self):
         self.valid_points_num = 0
-        for index in range(self.cam_num):
-            self.cam_points[index].clear()
+        self.sample_store.clear()
 
     def print_all_points(self):
-        # print(self.cam_points[0])
-        # print(self.cam_points[1])
         for cam_index in range(self.cam_num):
-            point_num = len(self.cam_points[cam_index])
+            point_num = len(self.sample_store)
             # print(f"Cam{cam_index} has {point_num} points:")
             self.log(f"Cam{cam_index} has {point_num} points:")
-            for point_index, point in enumerate(self.cam_points[cam_index]):
+            for point_index, point in enumerate(self.sample_store.camera(cam_index)):
                 self.log(f"Point{point_index}: x:{point[0]} y:{point[1]}")
                 # print(f"Point{point_index}: x:{point[0]} y:{point[1]}")
 
@@ -113,84 +145,270 @@ class Calibration(QObject):
         upy = undistorted_points[0][0][1]
         return (upx - self.cam2_cx) / self.cam2_fx, (upy - self.cam2_cy) / self.cam2_fy
 
+    # 批量去畸变并转换为归一化相机坐标 points: (N, 2) 像素坐标
+    def pixels2cam(self, points, cam_matrix, cam_dist):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 1, 2)
+        return cv.undistortPoints(points, cam_matrix, cam_dist).reshape(-1, 2)
+
     # 归一化平面(Z=1)转换为像素坐标
     # 使用理想相机模型 fx=1 fy=1 cx=320 cy=240
     def cam2pixel(self, sx, sy):
         return (sx * self.cam_fx + self.cam_cx), (sy * self.cam_fy + self.cam_cy)
 
+    # 全部采样点去畸变后投影到理想相机像素坐标 返回(cam1_array, cam2_array)
+    def get_ideal_samples(self):
+        _points1 = self.pixels2cam(self.sample_store.camera(0), self.cam1_matrix, self.cam1_dist)
+        _points2 = self.pixels2cam(self.sample_store.camera(1), self.cam2_matrix, self.cam2_dist)
+        cam1_array = np.stack(self.cam2pixel(_points1[:, 0], _points1[:, 1]), axis=1)
+        cam2_array = np.stack(self.cam2pixel(_points2[:, 0], _points2[:, 1]), axis=1)
+        return cam1_array, cam2_array
+
+    # 保存标定结果(内参/畸变/投影矩阵/采样点云) 供离线重新处理与再次载入使用
+    def save_calibration(self, path):
+        np.savez(path, cam1_matrix=self.cam1_matrix, cam1_dist=self.cam1_dist, cam1_proj=self.cam1_proj,
+                 cam2_matrix=self.cam2_matrix, cam2_dist=self.cam2_dist, cam2_proj=self.cam2_proj,
+                 sample_cloud=self.sample_cloud, baseline=self.baseline)
+        self.log(f"Calibration saved to {path}")
+
+    # 读取标定结果 位姿形状与apply_pose一致: cam1_t为(3,) cam2_t为recoverPose的(3, 1)
+    # 旧文件没有sample_cloud时点云为空
+    def load_calibration(self, path):
+        data = np.load(path)
+        self.cam1_matrix = data["cam1_matrix"]
+        self.cam1_dist = data["cam1_dist"]
+        self.cam1_proj = data["cam1_proj"]
+        self.cam2_matrix = data["cam2_matrix"]
+        self.cam2_dist = data["cam2_dist"]
+        self.cam2_proj = data["cam2_proj"]
+        self.cam1_fx, self.cam1_fy = self.cam1_matrix[0, 0], self.cam1_matrix[1, 1]
+        self.cam1_cx, self.cam1_cy = self.cam1_matrix[0, 2], self.cam1_matrix[1, 2]
+        self.cam2_fx, self.cam2_fy = self.cam2_matrix[0, 0], self.cam2_matrix[1, 1]
+        self.cam2_cx, self.cam2_cy = self.cam2_matrix[0, 2], self.cam2_matrix[1, 2]
+        self.cam1_R, self.cam1_t = self.cam1_proj[:, :3], self.cam1_proj[:, 3]
+        self.cam2_R, self.cam2_t = self.cam2_proj[:, :3], self.cam2_proj[:, 3:]
+        self.sample_cloud = data["sample_cloud"] if "sample_cloud" in data else np.zeros((0, 3))
+        self.baseline = float(data["baseline"]) if "baseline" in data else 0.0
+        self.quality = None
+        self.quality_generation += 1
+        self.calibration_ok = True
+        self.log(f"Calibration loaded from {path}")
+
+    # 使用一组参数求解相对位姿 不修改标定状态
+    # 为了在不同参数之间公平比较 用统一标准评价: 全部样本三角化后 位于两相机前方且两相机重投影误差均小于eval_threshold(像素)的为内点
+    # 返回字典: E R t tri_points mask(recoverPose有效点) pose_inliers essential_inliers
+    #          inliers(统一标准内点数) error(内点平均重投影误差 像素) 及所用参数
+    def solve_pose(self, cam1_array, cam2_array, method, threshold, distance_thresh, eval_threshold=2.0):
+        E, mask = cv.findEssentialMat(
+            points1=cam1_array,
+            points2=cam2_array,
+            cameraMatrix=self.cam_matrix,
+            method=method,
+            threshold=threshold
+        )
+        if E is None:
+            raise ValueError("findEssentialMat failed")
+        essential_inliers = int(np.count_nonzero(mask))
+        ret, R, t, mask, tri_points = cv.recoverPose(
+            E=E[:3],
+            points1=cam1_array,
+            points2=cam2_array,
+            cameraMatrix=self.cam_matrix,
+            distanceThresh=distance_thresh
+        )
+        # 在理想相机归一化坐标下三角化全部样本
+        x1 = (cam1_array - [self.cam_cx, self.cam_cy]) / [self.cam_fx, self.cam_fy]
+        x2 = (cam2_array - [self.cam_cx, self.cam_cy]) / [self.cam_fx, self.cam_fy]
+        P1 = np.hstack((np.eye(3), np.zeros((3, 1))))
+        P2 = np.hstack((R, t.reshape(-1, 1)))
+        _X, errors, front = triangulation.triangulate(P1, P2, x1, x2)
+        errors = errors.max(axis=1) * self.cam_fx
+        inliers = front & (errors < eval_threshold)
+        error = float(np.mean(errors[inliers])) if np.any(inliers) else np.inf
+        return {
+            "E": E[:3], "R": R, "t": t, "mask": mask.ravel() > 0, "tri_points": tri_points,
+            "pose_inliers": int(np.count_nonzero(mask)), "essential_inliers": essential_inliers,
+            "inliers": int(np.count_nonzero(inliers)), "error": error,
+            "method": method, "threshold": threshold, "distance_thresh": distance_thresh,
+        }
+
+    # 应用求解结果 更新相机位姿
+    def apply_pose(self, result):
+        self.log("Calibration: Update Cam Poses!")
+        self.cam1_R = np.eye(3)
+        self.cam1_t = np.array([0, 0, 0])
+        self.cam2_R = result["R"]
+        self.cam2_t = result["t"] * self.baseline_scale()
+        R1 = self.cam1_R
+        t1 = self.cam1_t
+        R2 = self.cam2_R
+        t2 = self.cam2_t
+        self.cam1_proj = np.hstack((R1, t1.reshape(-1, 1)))
+        self.cam2_proj = np.hstack((R2, t2.reshape(-1, 1)))
+        print(self.cam1_proj)
+        print(self.cam2_proj)
+        # 保存recoverPose有效点的三角化结果 用于点云显示
+        tri_points = result["tri_points"]
+        valid = result["mask"] & (tri_points[3] != 0)
+        self.sample_cloud = (tri_points[:3, valid] / tri_points[3, valid]).T * self.baseline_scale()
+        self.calibration_ok = True
+
+    # 基线长度 未设置时为1(单位长度)
+    def baseline_scale(self):
+        return self.baseline if self.baseline > 0 else 1.0
+
+    # 设置两相机基线长度(米) 0为使用单位长度 已标定时按新长度缩放平移/投影矩阵/采样点云
+    def set_baseline(self, baseline):
+        self.baseline = max(float(baseline), 0.0)
+        if not self.calibration_ok:
+            return
+        length = float(np.linalg.norm(self.cam2_t))
+        if length == 0:
+            return
+        factor = self.baseline_scale() / length
+        self.cam2_t = self.cam2_t * factor
+        self.cam2_proj = np.hstack((self.cam2_R, self.cam2_t.reshape(-1, 1)))
+        self.sample_cloud = self.sample_cloud * factor
+        self.log(f"Calibration: Baseline set to {self.baseline_scale():.4f}" + (" m" if self.baseline > 0 else " (unit)"))
+
     # 开始进行计算求解相机相对位姿 即相机外参标定
-    def start_calculation(self):
+    # 采样点保留在sample_store中 可更换参数重新求解
+    def start_calculation(self, threshold=2.0, distance_thresh=5):  # distanceThresh=5刚刚好
         self.log("Calibration: Begin Calculate!")
-        cam1_list = []
-        cam2_list = []
-        while self.cam_points[0] and self.cam_points[1]:
-            point1 = self.cam_points[0].popleft()
-            point2 = self.cam_points[1].popleft()
-            # 在此处对像素坐标进行处理
-            _point1 = self.cam1_pixel2cam(point1[0], point1[1])
-            _point2 = self.cam2_pixel2cam(point2[0], point2[1])
-            cam1_list.append(self.cam2pixel(_point1[0], _point1[1]))
-            cam2_list.append(self.cam2pixel(_point2[0], _point2[1]))
-        cam1_array = np.array(cam1_list)
-        cam2_array = np.array(cam2_list)
-        self.log("Calibration: Find Essential Matrix!")
         try:
-            E, mask = cv.findEssentialMat(
-                points1=cam1_array,
-                points2=cam2_array,
-                cameraMatrix=self.cam_matrix,
-                method=cv.RANSAC,
-                threshold=2.0
-            )
-            # print("the essential mask:")
-            # print(mask)
-            print("essential useful points rate:")
-            success = np.sum(mask) / mask.size
-            print("useful points:")
-            print(np.sum(mask))
-            print(success)
+            cam1_array, cam2_array = self.get_ideal_samples()
+            self.log("Calibration: Find Essential Matrix!")
+            result = self.solve_pose(cam1_array, cam2_array, cv.RANSAC, threshold, distance_thresh)
+            sample_num = len(cam1_array)
+            print(f"essential useful points: {result['essential_inliers']} rate: {result['essential_inliers'] / sample_num}")
+            print(f"recoverPose useful points: {result['pose_inliers']} rate: {result['pose_inliers'] / sample_num}")
+            print(f"reprojection inliers: {result['inliers']} mean error: {result['error']:.3f}px")
             print("the essential matrix:")
-            print(E)
-            ret, R, t, mask, tri_points = cv.recoverPose(
-                E=E,
-                points1=cam1_array,
-                points2=cam2_array,
-                cameraMatrix=self.cam_matrix,
-                distanceThresh=5  # 5刚刚好
-            )
-            # print(tri_points)
-            # print("the point mask:")
-            # print(mask)
-            print("recoverPose useful points rate:")
-            success = np.sum(mask) / mask.size / 255
-            print("recoverPose useful points:")
-            print(np.sum(mask) / 255)
-            print(success)
+            print(result["E"])
             print("the rotation matrix:")
-            print(R)
+            print(result["R"])
             print("the t vector")
-            print(t)
-            # 更新相机位姿
-            self.log("Calibration: Update Cam Poses!")
-            self.cam1_R = np.eye(3)
-            self.cam1_t = np.array([0, 0, 0])
-            self.cam2_R = R
-            self.cam2_t = t
-            R1 = self.cam1_R
-            t1 = self.cam1_t
-            R2 = self.cam2_R
-            t2 = self.cam2_t
-            self.cam1_proj = np.hstack((R1, t1.reshape(-1, 1)))
-            self.cam2_proj = np.hstack((R2, t2.reshape(-1, 1)))
-            print(self.cam1_proj)
-            print(self.cam2_proj)
-            self.calibration_ok = True
+            print(result["t"])
+            self.apply_pose(result)
+            self.report_quality(threshold=threshold)
 
         except cv.error as e:
             self.log(f"OpenCV Error:{str(e)}")
         except Exception as e:
             self.log(f"Error:{str(e)}")
 
+    # 共用线程池 首次使用时创建
+    def get_executor(self, workers=None):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count())
+        return self.executor
+
+    # 参数扫描求解 在线程池中并行对所有(方法, 阈值, 距离阈值)组合求解
+    # LMEDS不使用阈值 只以中间的阈值求解一次(该值也用于质量报告的bootstrap) 其余RANSAC类方法扫描全部阈值
+    # 选择统一标准下内点最多的结果 相同时选重投影误差最小的 成功返回最优结果字典
+    def start_sweep_calculation(self, thresholds=(0.5, 1.0, 2.0, 3.0, 5.0), methods=None,
+                                distance_threshs=(5, 10, 50), workers=None):
+        self.log("Calibration: Begin Parameter Sweep!")
+        if methods is None:
+            methods = [cv.RANSAC, cv.LMEDS] + [getattr(cv, name) for name in ("USAC_DEFAULT", "USAC_MAGSAC")
+                                               if hasattr(cv, name)]
+        try:
+            cam1_array, cam2_array = self.get_ideal_samples()
+        except cv.error as e:
+            self.log(f"OpenCV Error:{str(e)}")
+            return None
+        lmeds_thresholds = [sorted(thresholds)[len(thresholds) // 2]]
+        grid = [(method, threshold, distance_thresh) for method in methods
+                for threshold in (lmeds_thresholds if method == cv.LMEDS else thresholds)
+                for distance_thresh in distance_threshs]
+
+        def solve(params):
+            try:
+                return self.solve_pose(cam1_array, cam2_array, *params)
+            except (cv.error, ValueError):
+                return None
+
+        # OpenCV求解时释放GIL 使用线程即可并行
+        results = [result for result in self.get_executor(workers).map(solve, grid) if result is not None]
+        if not results:
+            self.log("Calibration: Parameter Sweep Failed!")
+            return None
+        best = min(results, key=lambda result: (-result["inliers"], result["error"]))
+        self.log(f"Calibration: {len(results)}/{len(grid)} solved, best method:{best['method']} "
+                 f"threshold:{best['threshold']} distanceThresh:{best['distance_thresh']} "
+                 f"inliers:{best['inliers']}/{len(cam1_array)} error:{best['error']:.3f}px")
+        self.apply_pose(best)
+        self.report_quality(threshold=best["threshold"])
+        return best
+
+    # 当前标定结果的质量报告 在线程池中计算(bootstrap需要0.5~2秒) 完成后经quality_signal回到GUI线程
+    # 摘要输出到log 热力图输出到控制台 结果保存在self.quality
+    # threshold: bootstrap重新求解时RANSAC的阈值(像素) 与求解时一致 返回Future
+    def report_quality(self, bootstrap=200, threshold=2.0):
+        cam1_array, cam2_array = self.get_ideal_samples()
+        # 在GUI线程中复制输入 计算期间继续采样或重新标定不影响本次报告
+        raw1 = self.sample_store.camera(0).copy()
+        raw2 = self.sample_store.camera(1).copy()
+        R = np.array(self.cam2_R)
+        t = np.array(self.cam2_t)
+        self.quality_generation += 1
+        generation = self.quality_generation
+        self.log("Calibration: Quality report running in background...")
+
+        def run():
+            try:
+                report = calib_report.quality_report(cam1_array, cam2_array, R, t, self.cam_matrix,
+                                                     raw1=raw1, raw2=raw2, bootstrap=bootstrap, threshold=threshold)
+            except Exception as e:
+                self.log(f"Calibration: Quality report Error:{str(e)}")
+                return None
+            self.quality_signal.emit(report, generation)
+            return report
+
+        return self.get_executor().submit(run)
+
+    # 质量报告完成 在GUI线程中执行 位姿已更新时丢弃旧报告
+    def apply_quality(self, report, generation):
+        if generation != self.quality_generation:
+            return
+        self.quality = report
+        print(calib_report.format_report(report))
+        for line in calib_report.format_report(report, heatmaps=False).splitlines():
+            self.log(f"Calibration: {line}")
+
+    # 批量三角化 points1/points2: (N, 2) 两相机对应的像素坐标
+    # method: "dlt" / "midpoint" / "optimal"
+    # 返回(三维点(N,3), 两相机像素重投影误差(N,2), 有效掩码(N,) 点在两相机前方) 未校准返回None
+    def triangulate_points(self, points1, points2, method="dlt"):
+        if not self.calibration_ok:
+            return None
+        _points1 = self.pixels2cam(points1, self.cam1_matrix, self.cam1_dist)
+        _points2 = self.pixels2cam(points2, self.cam2_matrix, self.cam2_dist)
+        X, errors, valid = triangulation.triangulate(self.cam1_proj, self.cam2_proj, _points1, _points2, method)
+        errors = errors * np.array([self.cam1_fx, self.cam2_fx])  # 归一化坐标误差换算为像素
+        return X, errors, valid
+
+    # 多点三角化 两相机各自检测到的点集先按对极约束对应 threshold: 对极距离阈值(像素)
+    # 返回(三维点(M,3), 两相机像素重投影误差(M,2)) 只含有效的对应点 未校准返回None
+    def triangulate_markers(self, points1, points2, threshold=3.0, method="dlt"):
+        if not self.calibration_ok:
+            return None
+        _points1 = self.pixels2cam(points1, self.cam1_matrix, self.cam1_dist)
+        _points2 = self.pixels2cam(points2, self.cam2_matrix, self.cam2_dist)
+        E = triangulation.essential_from_projections(self.cam1_proj, self.cam2_proj)
+        idx1, idx2 = triangulation.match_epipolar(E, _points1, _points2, threshold / self.cam1_fx)
+        X, errors, valid = triangulation.triangulate(self.cam1_proj, self.cam2_proj,
+                                                     _points1[idx1], _points2[idx2], method)
+        errors = errors * np.array([self.cam1_fx, self.cam2_fx])
+        return X[valid], errors[valid]
+
+    # 已知三维点在两相机中的重投影误差(像素) 返回(N, 2)
+    def reprojection_errors(self, X, points1, points2):
+        X = np.asarray(X, dtype=np.float64).reshape(-1, 3)
+        _points1 = self.pixels2cam(points1, self.cam1_matrix, self.cam1_dist)
+        _points2 = self.pixels2cam(points2, self.cam2_matrix, self.cam2_dist)
+        return np.stack([triangulation.reprojection_error(self.cam1_proj, X, _points1) * self.cam1_fx,
+                         triangulation.reprojection_error(self.cam2_proj, X, _points2) * self.cam2_fx], axis=1)
+
     def triangulate(self, point1, point2):  # 三角化函数
         if self.calibration_ok:
             print("Begin Triangulate!")
@@ -0,0 +1,332 @@
+import os
+import sys
+import time
+import socket
+import argparse
+import threading
+import numpy as np
+import cv2 as cv
+from udp_protocol import pack_frame, DEFAULT_FRAGMENT_PAYLOAD, MAX_FRAME_SIZE
+
+# ESP32CAM 数据流模拟器
+# 在本机模拟N个相机 按设定的分辨率/帧率/抖动/丢包/损坏/超大包比例向UDP_RX发送JPEG
+# 图像内容为已知三维轨迹上的红外光点在各相机中的投影 可用于检查检测/标定/三角化结果
+# 可选在同一进程内启动无界面接收端 测量单机可承受的相机数与帧率 以及长时间运行的内存增长
+PROTOCOL_LEGACY = "legacy"  # 单包整帧 与现有ESP32CAM固件一致
+PROTOCOL_FRAMED = "framed"  # 分包帧协议 udp_protocol.pack_frame
+LEGACY_OVERSIZE = 60000  # 旧协议超大包长度 等于接收端UDP_BUFFER_SIZE
+BASE_WIDTH = 640
+BASE_FOCAL = 204.5  # 与Calibration中的标准相机内参一致
+LATENCY_WINDOW = 2000  # 无界面接收端延迟统计的滑动窗口帧数
+
+
+# 已知三维轨迹 光点沿水平圆周运动并上下起伏 单位与标定结果一致
+class DotPath:
+    def __init__(self, radius=0.5, height=0.2, period=4.0, dot_num=1):
+        self.radius = radius
+        self.height = height
+        self.period = period
+        self.dot_num = dot_num
+
+    # 返回t时刻各光点的世界坐标 (dot_num, 3)
+    def positions(self, t):
+        phase = 2 * np.pi * (t / self.period + np.arange(self.dot_num) / self.dot_num)
+        return np.stack([self.radius * np.cos(phase),
+                         self.height * np.sin(2 * phase),
+                         self.radius * np.sin(phase)], axis=1)
+
+
+# 模拟相机 位于半径distance的圆上 朝向原点 无畸变针孔模型
+class SimCamera:
+    def __init__(self, index, cam_num, width=640, height=480, distance=3.0):
+        self.index = index
+        self.width = width
+        self.height = height
+        focal = BASE_FOCAL * width / BASE_WIDTH
+        self.K = np.array([[focal, 0, width / 2], [0, focal, height / 2], [0, 0, 1]])
+        # 相机光心 各相机在水平圆上均匀分布
+        angle = 2 * np.pi * index / max(cam_num, 1)
+        center = np.array([distance * np.sin(angle), 0.0, -distance * np.cos(angle)])
+        z = -center / np.linalg.norm(center)  # 光轴指向原点
+        x = np.cross([0.0, 1.0, 0.0], z)
+        x /= np.linalg.norm(x)
+        y = np.cross(z, x)
+        self.R = np.stack([x, y, z])
+        self.t = -self.R @ center
+
+    # 世界坐标投影为像素坐标 返回(N, 2) 以及是否在相机前方且在画面内
+    def project(self, points):
+        cam = points @ self.R.T + self.t
+        pixels = cam @ self.K.T
+        pixels = pixels[:, :2] / pixels[:, 2:3]
+        visible = ((cam[:, 2] > 0) & (pixels[:, 0] >= 0) & (pixels[:, 0] < self.width)
+                   & (pixels[:, 1] >= 0) & (pixels[:, 1] < self.height))
+        return pixels, visible
+
+
+# 红外光点图像渲染 背景噪声预先生成 每帧只在光点附近的小窗口内叠加高斯光斑
+class DotRenderer:
+    def __init__(self, width=640, height=480, quality=50, dot_radius=2.0, seed=0):
+        self.width = width
+        self.height = height
+        self.quality = quality
+        self.dot_radius = dot_radius
+        rng = np.random.default_rng(seed)
+        self.backgrounds = [rng.normal(12, 3, (height, width)).clip(0, 255).astype(np.float32) for _ in range(4)]
+        self.count = 0
+        half = int(np.ceil(dot_radius * 4))
+        self.patch_grid = np.mgrid[-half:half + 1, -half:half + 1].astype(np.float32)
+
+    def render(self, pixels):
+        img = self.backgrounds[self.count % len(self.backgrounds)].copy()
+        self.count += 1
+        half = self.patch_grid.shape[1] // 2
+        for px, py in pixels:
+            cx, cy = int(round(px)), int(round(py))
+            x0, x1 = max(cx - half, 0), min(cx + half + 1, self.width)
+            y0, y1 = max(cy - half, 0), min(cy + half + 1, self.height)
+            if x0 >= x1 or y0 >= y1:
+                continue
+            yy = self.patch_grid[0, y0 - cy + half:y1 - cy + half, x0 - cx + half:x1 - cx + half] + (cy - py)
+            xx = self.patch_grid[1, y0 - cy + half:y1 - cy + half, x0 - cx + half:x1 - cx + half] + (cx - px)
+            img[y0:y1, x0:x1] += 255 * np.exp(-(xx * xx + yy * yy) / (2 * self.dot_radius ** 2))
+        grey = img.clip(0, 255).astype(np.uint8)
+        return cv.imencode(".jpg", cv.cvtColor(grey, cv.COLOR_GRAY2BGR), [cv.IMWRITE_JPEG_QUALITY, self.quality])[1].tobytes()
+
+
+# 单个模拟相机的发送线程
+class CameraSender(threading.Thread):
+    def __init__(self, camera, path, address, fps=30.0, jitter=0.0, loss=0.0, corrupt=0.0, oversize=0.0,
+                 protocol=PROTOCOL_LEGACY, quality=50, seed=0):
+        super().__init__(daemon=True)
+        self.camera = camera
+        self.path = path
+        self.address = address
+        self.fps = fps
+        self.jitter = jitter  # 发送时刻抖动标准差(秒)
+        self.loss = loss  # 丢包率(每个UDP包独立)
+        self.corrupt = corrupt  # 帧损坏率(截断JPEG尾部)
+        self.oversize = oversize  # 超大帧比例
+        self.protocol = protocol
+        self.renderer = DotRenderer(camera.width, camera.height, quality, seed=seed)
+        self.rng = np.random.default_rng(seed)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.running = False
+        self.start_time = None
+        # 统计
+        self.frames = 0
+        self.packets = 0
+        self.bytes = 0
+        self.lost_packets = 0
+        self.corrupt_frames = 0
+        self.oversize_frames = 0
+        self.late_frames = 0  # 渲染+发送耗时超过帧周期
+
+    # 生成一帧的数据包列表 返回(数据包列表, 帧类型)
+    def make_packets(self, t):
+        pixels, visible = self.camera.project(self.path.positions(t))
+        jpeg = self.renderer.render(pixels[visible])
+        capture_us = int(t * 1e6)
+        kind = "ok"
+        if self.rng.random() < self.oversize:
+            kind = "oversize"
+            size = LEGACY_OVERSIZE if self.protocol == PROTOCOL_LEGACY else MAX_FRAME_SIZE + 1
+            jpeg = jpeg[:2] + bytes(size - len(jpeg)) + jpeg[2:] if size > len(jpeg) else jpeg
+        elif self.rng.random() < self.corrupt:
+            kind = "corrupt"
+            jpeg = jpeg[:-self.rng.integers(2, 64)]
+        if self.protocol == PROTOCOL_LEGACY:
+            if kind == "oversize":  # 旧协议接收端按收满缓冲判断超大包
+                return [jpeg[:LEGACY_OVERSIZE]], kind
+            return [jpeg], kind
+        if kind == "oversize":
+            return [], kind  # 分包协议发送端本身无法发出超过上限的帧 只计数
+        return pack_frame(jpeg, self.frames, capture_us, DEFAULT_FRAGMENT_PAYLOAD), kind
+
+    def run(self):
+        self.running = True
+        self.start_time = time.monotonic()
+        period = 1.0 / self.fps
+        next_time = self.start_time
+        while self.running:
+            t = time.monotonic()
+            packets, kind = self.make_packets(t - self.start_time)
+            self.frames += 1
+            if kind == "corrupt":
+                self.corrupt_frames += 1
+            elif kind == "oversize":
+                self.oversize_frames += 1
+            for packet in packets:
+                if self.rng.random() < self.loss:
+                    self.lost_packets += 1
+                    continue
+                try:
+                    self.sock.sendto(packet, self.address)
+                except OSError:  # 接收端缓冲满或未监听
+                    self.lost_packets += 1
+                    continue
+                self.packets += 1
+                self.bytes += len(packet)
+            next_time += period
+            delay = next_time + (self.rng.normal(0, self.jitter) if self.jitter > 0 else 0.0) - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -period:
+                self.late_frames += 1
+                next_time = time.monotonic()  # 跟不上时不追赶 避免突发
+        self.sock.close()
+
+    def stop(self):
+        self.running = False
+
+    def get_stats(self):
+        elapsed = time.monotonic() - self.start_time if self.start_time else 0.0
+        return {
+            "fps": self.frames / elapsed if elapsed > 0 else 0.0,
+            "frames": self.frames,
+            "packets": self.packets,
+            "bytes": self.bytes,
+            "lost_packets": self.lost_packets,
+            "corrupt": self.corrupt_frames,
+            "oversize": self.oversize_frames,
+            "late": self.late_frames,
+        }
+
+
+# 本进程常驻内存(bytes) Linux读取/proc 其他平台返回峰值
+def get_rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# 无界面接收端 复用ReceiveThread与检测函数 每个相机一个处理线程取空信箱并检测
+class HeadlessReceiver:
+    def __init__(self, address):
+        from PyQt5.QtCore import Qt
+        from udp_rx import ReceiveThread, UDP_RCVBUF_SIZE
+        from dot_detect import find_dots_full
+        from stream_health import RollingWindow
+        udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_RCVBUF_SIZE)
+        udp_socket.bind(address)
+        self.rx_thread = ReceiveThread(udp_socket)
+        self.ready = threading.Event()
+        # 没有Qt事件循环 直接在接收线程中置位
+        self.rx_thread.frame_ready_signal.connect(self.ready.set, Qt.DirectConnection)
+        self.detect = find_dots_full
+        self.process_thread = threading.Thread(target=self.process_loop, daemon=True)
+        self.processed = 0
+        self.detected = 0  # 检测到至少一个点的帧数
+        # 接收到处理完成的延迟(秒) 只保留最近LATENCY_WINDOW帧 长时间运行内存不增长 统计反映最近状态
+        self.latency = RollingWindow(LATENCY_WINDOW)
+
+    def start(self):
+        self.rx_thread.running = True
+        self.rx_thread.start()
+        self.process_thread.start()
+
+    def process_loop(self):
+        while self.rx_thread.running:
+            if not self.ready.wait(0.5):
+                continue
+            self.ready.clear()
+            while True:
+                frame = self.rx_thread.mailbox.take()
+                if frame is None:
+                    break
+                image_data, _capture_timestamp, arrival = frame
+                _points, num = self.detect(image_data)
+                self.processed += 1
+                self.detected += num > 0
+                self.latency.append(time.monotonic() - arrival)
+
+    def stop(self):
+        self.rx_thread.stop()
+        self.rx_thread.wait()
+        self.process_thread.join(2.0)
+        self.rx_thread.udp_socket.close()
+
+    def get_stats(self):
+        stats = self.rx_thread.get_health()
+        stats["processed"] = self.processed
+        stats["detected"] = self.detected
+        if len(self.latency):
+            stats["latency_p50_ms"] = self.latency.percentile(50) * 1000
+            stats["latency_p99_ms"] = self.latency.percentile(99) * 1000
+        return stats
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="ESP32CAM stream simulator")
+    parser.add_argument("--cameras", type=int, default=2, help="模拟相机数量")
+    parser.add_argument("--host", default="127.0.0.1", help="接收端IP")
+    parser.add_argument("--port", type=int, default=6666, help="第一个相机的端口 其余相机依次加1")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--quality", type=int, default=50, help="JPEG质量")
+    parser.add_argument("--jitter", type=float, default=0.0, help="发送时刻抖动标准差(ms)")
+    parser.add_argument("--loss", type=float, default=0.0, help="丢包率")
+    parser.add_argument("--corrupt", type=float, default=0.0, help="损坏帧比例")
+    parser.add_argument("--oversize", type=float, default=0.0, help="超大帧比例")
+    parser.add_argument("--dots", type=int, default=1, help="光点数量")
+    parser.add_argument("--protocol", choices=[PROTOCOL_LEGACY, PROTOCOL_FRAMED], default=PROTOCOL_LEGACY)
+    parser.add_argument("--duration", type=float, default=10.0, help="运行时间(秒) 0为一直运行")
+    parser.add_argument("--report", type=float, default=5.0, help="统计输出间隔(秒)")
+    parser.add_argument("--receive", action="store_true", help="在本进程内启动无界面接收端")
+    return parser.parse_args(argv)
+
+
+# 用法:
+#   向GUI发送: python cam_simulator.py --cameras 2 --port 6666
+#   负载测试: python cam_simulator.py --cameras 4 --fps 60 --receive --duration 30
+#   长时间运行: python cam_simulator.py --receive --duration 3600 --report 60 --loss 0.01 --corrupt 0.01
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    path = DotPath(dot_num=args.dots)
+    receivers = []
+    senders = []
+    for index in range(args.cameras):
+        address = (args.host, args.port + index)
+        if args.receive:
+            receivers.append(HeadlessReceiver(address))
+        camera = SimCamera(index, args.cameras, args.width, args.height)
+        senders.append(CameraSender(camera, path, address, args.fps, args.jitter / 1000, args.loss, args.corrupt,
+                                    args.oversize, args.protocol, args.quality, seed=index))
+    for receiver in receivers:
+        receiver.start()
+    for sender in senders:
+        sender.start()
+
+    start = time.monotonic()
+    start_rss = get_rss()
+    print(f"{args.cameras} cameras {args.width}x{args.height} @ {args.fps} fps, protocol {args.protocol}, "
+          f"rss {start_rss / 2 ** 20:.1f} MB")
+    try:
+        while args.duration <= 0 or time.monotonic() - start < args.duration:
+            time.sleep(min(args.report, max(args.duration - (time.monotonic() - start), 0.01))
+                       if args.duration > 0 else args.report)
+            elapsed = time.monotonic() - start
+            rss = get_rss()
+            print(f"[{elapsed:7.1f} s] rss {rss / 2 ** 20:.1f} MB ({(rss - start_rss) / 2 ** 20:+.1f} MB)")
+            for index, sender in enumerate(senders):
+                stats = sender.get_stats()
+                line = f"  cam{index + 1} tx {stats['fps']:.1f} fps, lost {stats['lost_packets']}, late {stats['late']}"
+                if receivers:
+                    rx = receivers[index].get_stats()
+                    line += (f" | rx {rx['fps']:.1f} fps, processed {rx['processed']}, detected {rx['detected']},"
+                             f" broken {rx['broken']}, oversize {rx['oversize']}, dropped {rx['mailbox_dropped']},"
+                             f" latency p99 {rx.get('latency_p99_ms', 0):.1f} ms")
+                print(line)
+    except KeyboardInterrupt:
+        pass
+    for sender in senders:
+        sender.stop()
+    for sender in senders:
+        sender.join(2.0)
+    for receiver in receivers:
+        receiver.stop()
@@ -0,0 +1,37 @@
+import os
+import json
+from dot_detect import DEFAULT_DETECT_PARAMS
+
+# 每个相机的配置 保存在camera_config.json
+# {"1": {"detect": {"threshold": 229.5, "blur": 0, ...}}, "2": {...}}
+# 文件不存在或缺少某项时使用默认值 由tune_detection.py写入检测参数
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "camera_config.json")
+
+
+def read_config(path=CONFIG_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+# 读取相机camera(从1开始)的检测参数
+def load_detect_params(camera, path=CONFIG_FILE):
+    params = dict(DEFAULT_DETECT_PARAMS)
+    try:
+        stored = read_config(path).get(str(camera), {}).get("detect", {})
+    except (OSError, ValueError) as e:
+        print(f"camera config error: {e}")
+        return params
+    params.update({key: value for key, value in stored.items() if key in params})
+    return params
+
+
+# 写入相机camera的检测参数 保留文件中的其他相机与其他配置项
+def save_detect_params(camera, params, path=CONFIG_FILE):
+    config = read_config(path)
+    config.setdefault(str(camera), {})["detect"] = {key: params[key] for key in DEFAULT_DETECT_PARAMS}
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(config, f, indent=2)
+    os.replace(tmp_path, path)
@@ -0,0 +1,262 @@
+import sys
+import time
+import threading
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+from dot_detect import find_dots_full, DEFAULT_DETECT_PARAMS
+from udp_protocol import MAX_FRAME_SIZE
+
+# 多进程解码/检测
+# 每个相机一个独立的工作进程 解码与检测不占用GUI线程 GUI线程只按显示间隔解码显示帧(见udp_rx.DISPLAY_INTERVAL)
+# 多核机器上各相机的检测可在不同核上进行 实际吞吐需在目标机器上用下面的测试确认(单核上反而更慢)
+# 帧数据与检测结果均通过共享内存环形缓冲传递 不经过pickle
+# 同步采用seqlock: 写入前将槽位版本号置为-1 写完后置为序号 读取前后版本号一致才有效
+
+# 槽位元数据字段
+FIELD_VERSION = 0  # 写入中为-1 写完为序号
+FIELD_LENGTH = 1  # 帧: JPEG字节数 结果: 检测到的点数量(解码失败为-1)
+FIELD_CAPTURE = 2  # 相机端采集时间戳(us)
+FIELD_ARRIVAL = 3  # 接收时间(time.monotonic_ns)
+FIELD_AUX = 4  # 结果: 对应的帧序号
+FIELD_COST = 5  # 结果: 解码+检测耗时(ns)
+FIELD_NUM = 6
+# 控制字段
+CONTROL_LATEST = 0  # 最新已发布序号
+CONTROL_COUNT = 1  # 结果环: 工作进程累计处理帧数
+MAX_POINTS = 64  # 单帧结果最多保存的点数
+
+
+# 共享内存环形缓冲 slot_num个定长槽位 name为None时创建 否则连接已有的共享内存
+class SharedRing:
+    def __init__(self, slot_num, slot_size, name=None):
+        self.slot_num = slot_num
+        self.slot_size = slot_size
+        meta_size = 8 * (2 + slot_num * FIELD_NUM)
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=meta_size + slot_num * slot_size)
+        else:
+            self.shm = attach_shared_memory(name)
+        self.control = np.ndarray((2,), dtype=np.int64, buffer=self.shm.buf, offset=0)
+        self.meta = np.ndarray((slot_num, FIELD_NUM), dtype=np.int64, buffer=self.shm.buf, offset=16)
+        self.data = np.ndarray((slot_num, slot_size), dtype=np.uint8, buffer=self.shm.buf, offset=meta_size)
+        if self.owner:
+            self.control[:] = 0
+            self.meta[:] = 0
+        self.seq = int(self.control[CONTROL_LATEST])  # 写入端序号
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def latest(self):
+        return int(self.control[CONTROL_LATEST])
+
+    def slot(self, seq):
+        return seq % self.slot_num
+
+    # 序号为seq的记录是否仍完整有效(未被覆盖/未在写入中)
+    def check(self, seq):
+        return int(self.meta[seq % self.slot_num, FIELD_VERSION]) == seq
+
+    # 写入一条记录 payload: 一维uint8数组或bytes-like 返回序号
+    def write(self, payload, length, capture=0, arrival=0, aux=0, cost=0):
+        self.seq += 1
+        slot = self.seq % self.slot_num
+        meta = self.meta[slot]
+        meta[FIELD_VERSION] = -1
+        payload = np.frombuffer(payload, dtype=np.uint8)
+        self.data[slot, :len(payload)] = payload
+        meta[FIELD_LENGTH] = length
+        meta[FIELD_CAPTURE] = capture
+        meta[FIELD_ARRIVAL] = arrival
+        meta[FIELD_AUX] = aux
+        meta[FIELD_COST] = cost
+        meta[FIELD_VERSION] = self.seq
+        self.control[CONTROL_LATEST] = self.seq
+        return self.seq
+
+    def close(self):
+        # 释放numpy视图后才能关闭共享内存
+        self.control = None
+        self.meta = None
+        self.data = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# 连接已有共享内存 由创建方负责释放
+# Python < 3.13 没有track参数 spawn出的子进程与创建方共用resource_tracker 重复登记不会导致提前释放
+def attach_shared_memory(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+# 工作进程入口 只处理最新帧 处理期间被覆盖的帧直接丢弃
+def detect_worker_main(frame_ring_name, result_ring_name, slot_num, frame_slot_size,
+                       frame_event, result_event, stop_event, detect_params):
+    frames = SharedRing(slot_num, frame_slot_size, frame_ring_name)
+    results = SharedRing(slot_num, MAX_POINTS * 2 * 8, result_ring_name)
+    processed = 0
+    last_seq = 0
+    try:
+        while not stop_event.is_set():
+            if not frame_event.wait(0.5):
+                continue
+            frame_event.clear()
+            seq = frames.latest()
+            if seq == last_seq or not frames.check(seq):
+                continue
+            slot = frames.slot(seq)
+            meta = frames.meta[slot].copy()
+            start = time.perf_counter_ns()
+            jpeg = frames.data[slot, :meta[FIELD_LENGTH]]
+            points, num = find_dots_full(jpeg, **detect_params)
+            cost = time.perf_counter_ns() - start
+            del jpeg  # 释放共享内存视图
+            if not frames.check(seq):  # 解码期间槽位被覆盖 结果无效
+                continue
+            last_seq = seq
+            payload = np.zeros((MAX_POINTS, 2), dtype=np.float64)
+            if points:
+                payload[:min(len(points), MAX_POINTS)] = points[:MAX_POINTS]
+            processed += 1
+            results.control[CONTROL_COUNT] = processed
+            results.write(payload.view(np.uint8).ravel(), num, meta[FIELD_CAPTURE], meta[FIELD_ARRIVAL], seq, cost)
+            result_event.set()
+    finally:
+        frames.close()
+        results.close()
+
+
+# 主进程侧: 单个相机的检测工作进程
+# detect_params: 检测参数 见DEFAULT_DETECT_PARAMS
+class DetectWorker:
+    def __init__(self, slot_num=4, frame_slot_size=MAX_FRAME_SIZE, detect_params=None):
+        ctx = mp.get_context("spawn")  # 主进程有Qt线程 不能fork
+        self.frames = SharedRing(slot_num, frame_slot_size)
+        self.results = SharedRing(slot_num, MAX_POINTS * 2 * 8)
+        self.frame_event = ctx.Event()
+        self.result_event = ctx.Event()
+        self.stop_event = ctx.Event()
+        self.process = ctx.Process(target=detect_worker_main,
+                                   args=(self.frames.name, self.results.name, slot_num, frame_slot_size,
+                                         self.frame_event, self.result_event, self.stop_event,
+                                         dict(detect_params or DEFAULT_DETECT_PARAMS)),
+                                   daemon=True)
+        self.submit_lock = threading.Lock()
+        self.oversize_count = 0
+        self.last_result_seq = 0
+
+    def start(self):
+        self.process.start()
+
+    # 提交一帧JPEG 由接收线程调用
+    def submit(self, jpeg, capture_timestamp=0, arrival_ns=None):
+        if len(jpeg) > self.frames.slot_size:
+            self.oversize_count += 1
+            return False
+        if arrival_ns is None:
+            arrival_ns = time.monotonic_ns()
+        with self.submit_lock:
+            self.frames.write(jpeg, len(jpeg), capture_timestamp or 0, arrival_ns)
+        self.frame_event.set()
+        return True
+
+    # 等待新结果 返回是否有新结果
+    def wait_result(self, timeout):
+        if self.result_event.wait(timeout):
+            self.result_event.clear()
+            return True
+        return False
+
+    # 读取最新检测结果 无新结果返回None
+    # 返回字典: frame_seq, points(None或[[x, y], ...]), num_points, capture_timestamp, arrival_ns, cost_ns
+    def latest_result(self):
+        seq = self.results.latest()
+        if seq == self.last_result_seq:
+            return None
+        slot = self.results.slot(seq)
+        meta = self.results.meta[slot].copy()
+        payload = self.results.data[slot].view(np.float64).reshape(MAX_POINTS, 2).copy()
+        if not self.results.check(seq):
+            return None
+        self.last_result_seq = seq
+        num = int(meta[FIELD_LENGTH])
+        points = payload[:min(num, MAX_POINTS)].tolist() if num > 0 else None
+        return {
+            "frame_seq": int(meta[FIELD_AUX]),
+            "points": points,
+            "num_points": num,
+            "capture_timestamp": int(meta[FIELD_CAPTURE]),
+            "arrival_ns": int(meta[FIELD_ARRIVAL]),
+            "cost_ns": int(meta[FIELD_COST]),
+        }
+
+    # 获取统计 submitted: 提交帧数 processed: 工作进程处理帧数 其余为丢弃
+    def get_stats(self):
+        submitted = self.frames.latest()
+        processed = int(self.results.control[CONTROL_COUNT])
+        return {
+            "submitted": submitted,
+            "processed": processed,
+            "skipped": submitted - processed,
+            "oversize": self.oversize_count,
+        }
+
+    def stop(self):
+        self.stop_event.set()
+        self.frame_event.set()
+        self.process.join(2.0)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.frames.close()
+        self.results.close()
+
+
+# main test: N个相机同时处理的吞吐量 对比单进程串行
+# 用法: python detect_worker.py [相机数量] [每相机帧数]
+if __name__ == "__main__":
+    from dot_detect import make_test_jpeg
+
+    cam_num = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    frame_num = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    jpeg = make_test_jpeg([(320.3, 240.7, 2.0)])
+
+    start = time.perf_counter()
+    for _ in range(cam_num * frame_num):
+        find_dots_full(jpeg)
+    serial = cam_num * frame_num / (time.perf_counter() - start)
+    print(f"single process: {serial:.0f} frames/s")
+
+    workers = [DetectWorker() for _ in range(cam_num)]
+    for worker in workers:
+        worker.start()
+
+    # 每个相机一个线程 提交一帧后等待结果再提交下一帧
+    def run_camera(worker):
+        for _ in range(frame_num):
+            worker.submit(jpeg)
+            while worker.latest_result() is None:
+                worker.wait_result(1.0)
+
+    for worker in workers:  # 预热 等待工作进程启动
+        worker.submit(jpeg)
+        while worker.latest_result() is None:
+            worker.wait_result(1.0)
+    threads = [threading.Thread(target=run_camera, args=(worker,)) for worker in workers]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    parallel = cam_num * frame_num / (time.perf_counter() - start)
+    print(f"{cam_num} worker processes: {parallel:.0f} frames/s ({parallel / serial:.2f}x, {mp.cpu_count()} cores)")
+    for worker in workers:
+        print(worker.get_stats())
+        worker.stop()
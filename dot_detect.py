@@ -0,0 +1,134 @@
+import sys
+import time
+import numpy as np
+from startup import LazyModule
+
+cv = LazyModule("cv2")
+
+# 光点检测 全分辨率灰度解码后二值化 求轮廓质心
+# 检测结果与UDP_RX.find_dot_from_image保持一致(同样的灰度解码decode_grey 二值化阈值与轮廓规则)
+# 曾尝试先在IMREAD_REDUCED缩小图上找候选点再在全分辨率窗口内求质心 但cv.imdecode不支持只解码局部区域
+# 有光点时仍需整幅解码 缩小图解码本身的开销与全分辨率检测相当 实测比直接检测慢 因此只保留全分辨率检测
+DOT_THRESHOLD = 255 * 0.9  # 全分辨率二值化阈值 与find_dot_from_image相同
+# 检测参数 默认值与find_dot_from_image原有行为相同
+# blur: 高斯模糊核大小(奇数 0为不模糊) min_area/max_area: 光点面积范围(像素 0为不限制)
+# min_circularity: 最小圆度 4*pi*面积/周长^2 反光条纹等细长区域圆度低
+DEFAULT_DETECT_PARAMS = {
+    "threshold": DOT_THRESHOLD,
+    "blur": 0,
+    "min_area": 0.0,
+    "max_area": 0.0,
+    "min_circularity": 0.0,
+}
+
+
+# 解码JPEG为全分辨率灰度图 解码失败返回None
+# 运行时检测(UDP_RX/工作进程/边缘节点)与参数调优(tune_detection.py)都用它 保证调优得到的阈值在运行时含义相同
+# 直接取JPEG的亮度分量 不经过彩色图与色彩转换
+def decode_grey(jpeg_data):
+    return cv.imdecode(np.frombuffer(jpeg_data, dtype=np.uint8), cv.IMREAD_GRAYSCALE)
+
+
+# 读取JPEG帧头(SOF)中的图像尺寸 不解码 返回(宽, 高) 找不到帧头返回None
+# 只遍历SOF之前的标记段 开销与图像大小无关 用于在检测前丢弃尺寸不符的帧
+SOF_MARKERS = {0xc0, 0xc1, 0xc2, 0xc3, 0xc5, 0xc6, 0xc7, 0xc9, 0xca, 0xcb, 0xcd, 0xce, 0xcf}
+
+
+def jpeg_size(jpeg_data):
+    pos = 2  # 跳过SOI
+    end = len(jpeg_data)
+    while pos + 4 <= end:
+        if jpeg_data[pos] != 0xff:
+            return None
+        marker = jpeg_data[pos + 1]
+        if marker == 0xff:  # 填充字节
+            pos += 1
+            continue
+        length = (jpeg_data[pos + 2] << 8) | jpeg_data[pos + 3]
+        if marker in SOF_MARKERS:
+            if pos + 9 > end:
+                return None
+            height = (jpeg_data[pos + 5] << 8) | jpeg_data[pos + 6]
+            width = (jpeg_data[pos + 7] << 8) | jpeg_data[pos + 8]
+            return width, height
+        if marker == 0xda:  # 扫描数据开始 之前没有SOF
+            return None
+        pos += 2 + length
+    return None
+
+
+# 轮廓是否满足面积与圆度条件 moments为该轮廓的矩 m00即面积
+def contour_passes(contour, moments, min_area=0.0, max_area=0.0, min_circularity=0.0):
+    area = moments["m00"]
+    if area == 0 or area < min_area or (max_area > 0 and area > max_area):
+        return False
+    if min_circularity > 0:
+        perimeter = cv.arcLength(contour, True)
+        if perimeter == 0 or 4 * np.pi * area / (perimeter * perimeter) < min_circularity:
+            return False
+    return True
+
+
+# 高斯模糊 blur为核大小 偶数按+1处理
+def blur_grey(grey, blur):
+    if blur and blur > 1:
+        size = int(blur) | 1
+        return cv.GaussianBlur(grey, (size, size), 0)
+    return grey
+
+
+# 在灰度图(或其子窗口)中求光点质心 offset为子窗口左上角坐标
+def find_dots_in_grey(grey, threshold=DOT_THRESHOLD, offset=(0, 0), blur=0, min_area=0.0, max_area=0.0,
+                      min_circularity=0.0):
+    binary = cv.threshold(blur_grey(grey, blur), threshold, 255, cv.THRESH_BINARY)[1]
+    contours, _ = cv.findContours(binary, cv.RETR_TREE, cv.CHAIN_APPROX_SIMPLE)
+    image_points = []
+    for contour in contours:
+        moments = cv.moments(contour)
+        if contour_passes(contour, moments, min_area, max_area, min_circularity):
+            image_points.append([moments["m10"] / moments["m00"] + offset[0],
+                                 moments["m01"] / moments["m00"] + offset[1]])
+    return image_points
+
+
+# 全分辨率检测 与解码 + UDP_RX.find_dot_from_image结果相同 但不在图像上绘制标注
+# 返回(image_points, num_points) 解码失败返回(None, -1)
+# 其余关键字参数(blur/min_area/max_area/min_circularity)见DEFAULT_DETECT_PARAMS
+def find_dots_full(jpeg_data, threshold=DOT_THRESHOLD, **filters):
+    grey = decode_grey(jpeg_data)
+    if grey is None:
+        return None, -1
+    image_points = find_dots_in_grey(grey, threshold, **filters)
+    if not image_points:
+        return None, 0
+    return image_points, len(image_points)
+
+
+# 生成测试用JPEG 640x480 红外滤光下的暗背景噪声 + 若干高斯光点 dots: [(x, y, 半径), ...]
+def make_test_jpeg(dots, quality=50, seed=0):
+    rng = np.random.default_rng(seed)
+    img = rng.normal(12, 3, (480, 640)).clip(0, 255)
+    yy, xx = np.mgrid[0:480, 0:640]
+    for x, y, r in dots:
+        img += 255 * np.exp(-((xx - x) ** 2 + (yy - y) ** 2) / (2 * r * r))
+    img = cv.cvtColor(img.clip(0, 255).astype(np.uint8), cv.COLOR_GRAY2BGR)
+    return cv.imencode(".jpg", img, [cv.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+
+# main test: 全分辨率检测耗时与结果
+# 用法: python dot_detect.py [jpeg文件 ...]
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        frames = [open(path, "rb").read() for path in sys.argv[1:]]
+    else:
+        frames = [make_test_jpeg([]), make_test_jpeg([(320.3, 240.7, 2.0)]),
+                  make_test_jpeg([(100.5, 80.2, 3.0), (500.1, 400.9, 2.5)])]
+    repeat = 200
+
+    for data in frames:
+        points, num = find_dots_full(data)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            find_dots_full(data)
+        cost = (time.perf_counter() - start) / repeat * 1000
+        print(f"JPEG {len(data)} bytes, full {cost:6.3f} ms  points: {num} {points}")
@@ -0,0 +1,138 @@
+import sys
+import time
+import socket
+import argparse
+import threading
+from PyQt5.QtCore import Qt
+from udp_rx import ReceiveThread, UDP_RCVBUF_SIZE
+from udp_protocol import pack_centroids
+from dot_detect import find_dots_full
+from camera_config import load_detect_params
+from frame_skip import FrameSkipper
+
+# 边缘检测节点
+# 在靠近相机的机器上接管 接收 -> 解码 -> 检测 只把带时间戳的质心包发给运行Monitor的中心节点
+# 中心节点的UDP_RX照常监听端口 收到质心包时与多进程检测结果走同一路径(detect_result_update)
+# 一帧JPEG约20KB 质心包为24字节包头 + 每点8字节 中心节点既不需要Wi-Fi带宽也不需要解码算力
+# 每个相机一个接收线程 + 一个检测线程 检测跟不上时信箱只保留最新帧
+
+
+# 单个相机: 接收JPEG 检测后把质心包发送到central地址
+class EdgeCamera:
+    def __init__(self, camera, listen_address, central_address, detect_params=None,
+                 skip_static=False):
+        self.camera = camera
+        self.central_address = central_address
+        udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_RCVBUF_SIZE)
+        udp_socket.bind(listen_address)
+        self.rx_thread = ReceiveThread(udp_socket)
+        self.ready = threading.Event()
+        # 没有Qt事件循环 直接在接收线程中置位
+        self.rx_thread.frame_ready_signal.connect(self.ready.set, Qt.DirectConnection)
+        params = detect_params if detect_params is not None else load_detect_params(camera)
+        self.detect = lambda jpeg: find_dots_full(jpeg, **params)
+        # 静止场景跳帧 JPEG字节与上一次检测的帧完全相同时复用结果 质心包照常发送
+        self.frame_skipper = FrameSkipper() if skip_static else None
+        self.send_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.process_thread = threading.Thread(target=self.process_loop, daemon=True)
+        # 统计
+        self.frame_id = 0
+        self.sent_bytes = 0
+        self.send_errors = 0
+
+    def start(self):
+        self.rx_thread.running = True
+        self.rx_thread.start()
+        self.process_thread.start()
+
+    def process_loop(self):
+        while self.rx_thread.running:
+            if not self.ready.wait(0.5):
+                continue
+            self.ready.clear()
+            while True:
+                frame = self.rx_thread.mailbox.take()
+                if frame is None:
+                    break
+                image_data, capture_timestamp, arrival = frame
+                if self.frame_skipper is not None:
+                    points, num = self.frame_skipper.detect(image_data, self.detect)
+                else:
+                    points, num = self.detect(image_data)
+                delay_us = (time.monotonic() - arrival) * 1e6
+                packet = pack_centroids(self.camera, self.frame_id, points, num, capture_timestamp, delay_us)
+                self.frame_id += 1
+                try:
+                    self.send_socket.sendto(packet, self.central_address)
+                    self.sent_bytes += len(packet)
+                except OSError:
+                    self.send_errors += 1
+
+    def stop(self):
+        self.rx_thread.stop()
+        self.rx_thread.wait()
+        self.process_thread.join(2.0)
+        self.rx_thread.udp_socket.close()
+        self.send_socket.close()
+
+    def get_stats(self):
+        stats = self.rx_thread.get_health()
+        stats["sent_frames"] = self.frame_id
+        stats["sent_bytes"] = self.sent_bytes
+        stats["send_errors"] = self.send_errors
+        stats["skip_rate"] = self.frame_skipper.get_stats()["skip_rate"] if self.frame_skipper is not None else 0.0
+        return stats
+
+
+# 解析 "监听端口:中心端口" 或 "相机号:监听端口:中心端口"
+def parse_camera(text, index):
+    parts = [int(part) for part in text.split(":")]
+    if len(parts) == 2:
+        return index + 1, parts[0], parts[1]
+    if len(parts) == 3:
+        return parts[0], parts[1], parts[2]
+    raise argparse.ArgumentTypeError(f"invalid camera spec: {text}")
+
+
+# 用法:
+#   python edge_node.py --central 192.168.1.10 --camera 6666:6666 --camera 6667:6667
+#   本机测试: Monitor监听6666/6667
+#     python edge_node.py --central 127.0.0.1 --camera 6700:6666 --camera 6701:6667
+#     python cam_simulator.py --cameras 2 --port 6700
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="edge detection node: forward centroids instead of JPEG frames")
+    parser.add_argument("--central", required=True, help="中心节点(Monitor)IP")
+    parser.add_argument("--bind", default="0.0.0.0", help="本机监听IP")
+    parser.add_argument("--camera", action="append", required=True,
+                        help="监听端口:中心端口 或 相机号:监听端口:中心端口 可重复")
+    parser.add_argument("--threshold", type=float, default=None, help="二值化阈值 默认使用camera_config.json")
+    parser.add_argument("--skip-static", action="store_true", help="静止场景跳帧 字节完全相同的帧复用上一次检测结果")
+    parser.add_argument("--report", type=float, default=5.0, help="统计输出间隔(秒)")
+    args = parser.parse_args()
+
+    cameras = []
+    for index, text in enumerate(args.camera):
+        camera, listen_port, central_port = parse_camera(text, index)
+        params = load_detect_params(camera)
+        if args.threshold is not None:
+            params["threshold"] = args.threshold
+        cameras.append(EdgeCamera(camera, (args.bind, listen_port), (args.central, central_port),
+                                  params, args.skip_static))
+    for camera in cameras:
+        camera.start()
+    print(f"edge node: {len(cameras)} cameras -> {args.central}")
+    try:
+        while True:
+            time.sleep(args.report)
+            for camera in cameras:
+                stats = camera.get_stats()
+                ratio = stats["bytes"] / stats["sent_bytes"] if stats["sent_bytes"] else 0.0
+                print(f"  cam{camera.camera}: rx {stats['fps']:.1f} fps {stats['bytes_per_second'] / 1024:.0f} KB/s, "
+                      f"sent {stats['sent_frames']} ({ratio:.0f}x smaller), dropped {stats['mailbox_dropped']}, "
+                      f"errors {stats['send_errors']}, skipped {stats['skip_rate']:.1%}")
+    except KeyboardInterrupt:
+        pass
+    for camera in cameras:
+        camera.stop()
+    sys.exit(0)
@@ -0,0 +1,67 @@
+import threading
+from collections import deque
+
+# 接收线程与处理(解码/检测)之间的帧交接
+# capacity=1 时为单槽信箱: 只保留最新一帧(latest-frame-wins)
+# capacity>1 时为有界队列: 满时按policy丢弃最旧帧或新到帧
+# 生产者只在信箱由空变为非空时通知消费者 消费者每次只处理通知时已有的帧 仍非空则重新排队
+# 因此Qt事件队列中最多只有一个待处理通知 处理跟不上时丢帧而不是积压延迟
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+
+
+class FrameMailbox:
+    def __init__(self, capacity=1, policy=DROP_OLDEST):
+        if capacity < 1:
+            raise ValueError("capacity must be >= 1")
+        if policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"unknown drop policy: {policy}")
+        self.capacity = capacity
+        self.policy = policy
+        self.lock = threading.Lock()
+        self.frames = deque()
+        # 统计
+        self.put_count = 0
+        self.take_count = 0
+        self.drop_count = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    # 放入一帧 返回True表示信箱由空变为非空 调用方需要通知消费者
+    def put(self, frame):
+        with self.lock:
+            self.put_count += 1
+            was_empty = not self.frames
+            if len(self.frames) >= self.capacity:
+                self.drop_count += 1
+                if self.policy == DROP_NEWEST:
+                    return False
+                self.frames.popleft()
+            self.frames.append(frame)
+            return was_empty
+
+    # 取出最旧的一帧 信箱为空时返回None
+    def take(self):
+        with self.lock:
+            if not self.frames:
+                return None
+            self.take_count += 1
+            return self.frames.popleft()
+
+    # 丢弃所有未处理的帧(不计入丢帧统计)
+    def clear(self):
+        with self.lock:
+            self.frames.clear()
+
+    # 获取交接统计
+    def get_stats(self):
+        with self.lock:
+            return {
+                "capacity": self.capacity,
+                "policy": self.policy,
+                "pending": len(self.frames),
+                "put": self.put_count,
+                "taken": self.take_count,
+                "dropped": self.drop_count,
+            }
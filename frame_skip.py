@@ -0,0 +1,112 @@
+import sys
+import time
+import zlib
+import numpy as np
+from startup import LazyModule
+
+cv = LazyModule("cv2")
+
+# 静止场景跳帧
+# 标定采集/空闲时场景可能不变 先用廉价的字节签名与参考帧比较 字节完全相同的帧不解码 直接复用参考帧的检测结果
+# 字节签名: JPEG长度 + 整帧CRC32 (5KB左右的帧只需几微秒) 相同字节的检测结果必然相同 复用不引入任何误差
+# 只比较签名 不做内容比较: 检测耗时主要是解码 任何基于图像内容的比较(缩略图/全分辨率亮区)都要先解码
+#   曾用1/4缩略图比较亮区 变化帧要解码两次 慢速/运动场景比每帧检测慢约一倍 阈值内的亚像素漂移还会留下陈旧质心
+# 只取部分字节也不可靠: 暗背景上光点移动后 长度与大部分扫描数据都可能不变
+# 带传感器噪声的画面每帧字节都不同 不会被跳过 与每帧完整检测结果一致
+# 单个相机的跳帧判断 detect(jpeg, detect_func) 代替 detect_func(jpeg)
+class FrameSkipper:
+    def __init__(self):
+        self.reference_key = None
+        self.result = None
+        # 统计
+        self.frame_count = 0
+        self.identical_count = 0  # 字节签名相同跳过
+
+    def clear(self):
+        self.reference_key = None
+        self.result = None
+
+    # 字节签名 长度 + 整帧CRC32
+    @staticmethod
+    def byte_key(jpeg):
+        return len(jpeg), zlib.crc32(jpeg)
+
+    def detect(self, jpeg, detect_func):
+        self.frame_count += 1
+        key = self.byte_key(jpeg)
+        if self.result is not None and key == self.reference_key:
+            self.identical_count += 1
+            return self.result
+        result = detect_func(jpeg)
+        if result[1] < 0:  # 解码失败不作为参考帧
+            self.clear()
+            return result
+        self.reference_key = key
+        self.result = result
+        return result
+
+    def get_stats(self):
+        return {
+            "frames": self.frame_count,
+            "skipped": self.identical_count,
+            "identical": self.identical_count,
+            "skip_rate": self.identical_count / self.frame_count if self.frame_count else 0.0,
+        }
+
+
+# 测试: 静止/缓慢漂移/运动场景 对比每帧完整检测的结果与耗时 跳帧结果必须与完整检测完全一致
+if __name__ == "__main__":
+    from cam_simulator import DotRenderer
+    from dot_detect import find_dots_full
+
+    frame_num = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    rng = np.random.default_rng(0)
+    renderer = DotRenderer(dot_radius=3.0, seed=0)
+
+    # 每帧叠加新的随机噪声 使静止场景的JPEG字节也各不相同(与真实传感器一致)
+    def render(pixels):
+        grey = cv.imdecode(np.frombuffer(renderer.render(pixels), dtype=np.uint8), cv.IMREAD_GRAYSCALE)
+        grey = (grey + rng.normal(0, 2, grey.shape)).clip(0, 255).astype(np.uint8)
+        return cv.imencode(".jpg", cv.cvtColor(grey, cv.COLOR_GRAY2BGR), [cv.IMWRITE_JPEG_QUALITY, 50])[1].tobytes()
+
+    # 无噪声的纯暗背景 静止帧字节完全相同 移动帧长度常常也相同 检验字节签名不会误判
+    def render_flat(pixels):
+        img = np.zeros((480, 640, 3), dtype=np.uint8)
+        for x, y in pixels:
+            cv.circle(img, (int(round(x)), int(round(y))), 3, (255, 255, 255), -1)
+        return cv.imencode(".jpg", img, [cv.IMWRITE_JPEG_QUALITY, 50])[1].tobytes()
+
+    base = np.array([[200.0, 150.0], [420.0, 300.0]])
+    k = np.arange(frame_num)[:, None, None]
+    scenes = {
+        "static": np.broadcast_to(base, (frame_num, 2, 2)),
+        "drift 0.02px/f": base + 0.02 * k,
+        "slow 0.1px/f": base + 0.1 * k,
+        "moving 2px/f": base + np.stack([2.0 * np.sin(k[..., 0] / 20), 2.0 * k[..., 0] / 3], axis=2),
+        "flat static": np.broadcast_to(base, (frame_num, 2, 2)),
+        "flat drift 0.02px/f": base + 0.02 * k,
+        "flat jump 16px": base + 16.0 * (k // 10 % 10),
+    }
+    for name, path in scenes.items():
+        frames = [(render_flat if name.startswith("flat") else render)(pixels) for pixels in path]
+        start = time.perf_counter()
+        full = [find_dots_full(jpeg) for jpeg in frames]
+        full_cost = (time.perf_counter() - start) / frame_num * 1e6
+        skipper = FrameSkipper()
+        start = time.perf_counter()
+        skipped = [skipper.detect(jpeg, find_dots_full) for jpeg in frames]
+        skip_cost = (time.perf_counter() - start) / frame_num * 1e6
+        # 与完整检测结果比较: 点数不同的帧数 与 质心最大偏差
+        count_mismatch = 0
+        max_error = 0.0
+        for (points_a, num_a), (points_b, num_b) in zip(full, skipped):
+            if num_a != num_b:
+                count_mismatch += 1
+            elif num_a > 0:
+                a = np.array(sorted(points_a))
+                b = np.array(sorted(points_b))
+                max_error = max(max_error, float(np.abs(a - b).max()))
+        stats = skipper.get_stats()
+        print(f"{name:19s}: full {full_cost:6.0f} us/frame, with skip {skip_cost:6.0f} us/frame, "
+              f"skip rate {stats['skip_rate']:.1%}, count mismatch {count_mismatch}, max centroid diff {max_error:.3f} px")
+        assert count_mismatch == 0 and max_error == 0.0, f"{name}: skip path differs from find_dots_full"
@@ -1,16 +1,21 @@
+import startup
 from udp_rx import UDP_RX
 from calibration import Calibration
 from opengl_widget import OpenGLWidget
+from time_sync import TimeSync
+from trajectory_log import TrajectoryWriter
+from zones import ZoneEngine, load_zones
+from rigid_body import RigidBodyTracker, load_rigid_bodies
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QLabel,
                              QPushButton, QHBoxLayout, QLineEdit, QSpinBox,
-                             QGridLayout, QSizePolicy, QFrame, QTextEdit)
+                             QGridLayout, QSizePolicy, QFrame, QTextEdit, QCheckBox, QFileDialog,
+                             QDoubleSpinBox)
 from PyQt5.QtGui import QFont, QPixmap
 from PyQt5.QtCore import QThread, pyqtSignal, QByteArray, QBuffer, QTimer
 import time
+import os
 from PyQt5.QtCore import pyqtSignal, QObject
 import numpy as np
-import cv2 as cv
-import socket
 
 
 # log显示模块
@@ -41,6 +46,22 @@ class Monitor(QWidget):
         self.udp1_rx = UDP_RX("udp1", 1)
         self.udp2_rx = UDP_RX("udp2", 2)
         self.udp1_rx.update_signal.connect(self.cam1_update_callback)
+        # 相机时间同步 各相机的点按估计采集时间插值到统一时刻后再三角化 输出频率与相机帧率无关
+        self.time_sync = TimeSync(2)
+        self.sync_output = False
+        self.sync_rate = 30  # 同步输出频率(Hz)
+        self.sync_timer = QTimer(self)
+        self.sync_timer.timeout.connect(self.sync_timer_callback)
+        self.udp1_rx.update_signal.connect(lambda: self.time_sync_observe(0, self.udp1_rx))
+        self.udp2_rx.update_signal.connect(lambda: self.time_sync_observe(1, self.udp2_rx))
+        # 三角化结果记录 写盘在后台线程
+        self.trajectory_writer = None
+        self.recording_root = "recordings"
+        # 区域事件 载入区域文件后启用
+        self.zone_engine = None
+        # 刚体位姿跟踪 载入刚体定义后持续三角化时在单点三角化之外 再做多点三角化 + 刚体识别
+        self.body_tracker = None
+        self.found_bodies = set()  # 上一帧识别到的刚体名称 用于输出识别/丢失log
         # Calibration模块
         self.calibration = Calibration(2)
         self.calibration.log_signal.connect(self.log_callback)  # logger output
@@ -64,6 +85,7 @@ class Monitor(QWidget):
         self.auto_calibration_button = QPushButton("Start Auto Calibration")  # 开始自动捕获有效点
         self.capture_sample_button = QPushButton("Capture Sample")  # 手动捕获有效点
         self.start_calculation_button = QPushButton("Start Calculation")  # 开始计算标定结果
+        self.sweep_calculation_button = QPushButton("Sweep Calculation")  # 多组参数并行求解 选最优
         self.print_all_points_button = QPushButton("Print Points")  # 打印所有相机所有采集点
         self.clear_all_points_button = QPushButton("Clear Points")  # 清除所有采集的点
         self.triangulate_one_point_button = QPushButton("Triangulate")  # 三角化单个点
@@ -72,25 +94,63 @@ class Monitor(QWidget):
         self.valid_sample_count_value_label = QLabel("0")
         self.calibration_state_label = QLabel("State:")
         self.calibration_state_value_label = QLabel()
+        self.sync_output_checkbox = QCheckBox("Time-Synced Output")  # 按统一时刻插值后三角化
+        self.sync_rate_spinbox = QSpinBox()  # 同步输出频率
+        self.sync_rate_spinbox.setRange(1, 240)
+        self.sync_rate_spinbox.setSuffix(" Hz")
+        self.sync_rate_spinbox.setValue(self.sync_rate)
+        self.sync_skew_label = QLabel("Sync Skew:")
+        self.sync_skew_value_label = QLabel("--")
+        self.record_button = QPushButton("Start Recording")  # 记录三角化结果
+        self.record_state_label = QLabel("")
+        self.load_zones_button = QPushButton("Load Zones")  # 载入区域 检测进入/离开/停留事件
+        self.load_bodies_button = QPushButton("Load Bodies")  # 载入刚体定义 跟踪6自由度位姿
+        self.load_calibration_button = QPushButton("Load Calibration")  # 载入保存的标定结果(如记录目录下的calibration.npz)
+        self.baseline_spinbox = QDoubleSpinBox()  # 两相机基线长度 设置后三角化结果为米
+        self.baseline_spinbox.setRange(0.0, 10.0)
+        self.baseline_spinbox.setDecimals(3)
+        self.baseline_spinbox.setSingleStep(0.01)
+        self.baseline_spinbox.setPrefix("Baseline: ")
+        self.baseline_spinbox.setSuffix(" m")
+        self.baseline_spinbox.setSpecialValueText("Baseline: unit")  # 0: 未设置 以基线长度为单位
 
         self.capture_sample_button.clicked.connect(self.upload_points)
         self.print_all_points_button.clicked.connect(self.print_all_points)
         self.clear_all_points_button.clicked.connect(self.clear_all_points)
         self.start_calculation_button.clicked.connect(self.start_calculation)
+        self.sweep_calculation_button.clicked.connect(self.start_sweep_calculation)
         self.triangulate_one_point_button.clicked.connect(self.triangulate_one_point)
         self.triangulating_button.clicked.connect(self.triangulation_button_callback)
+        self.sync_output_checkbox.toggled.connect(self.set_sync_output)
+        self.sync_rate_spinbox.valueChanged.connect(self.set_sync_rate)
+        self.record_button.clicked.connect(self.record_button_callback)
+        self.load_zones_button.clicked.connect(self.load_zones_button_callback)
+        self.load_bodies_button.clicked.connect(self.load_bodies_button_callback)
+        self.load_calibration_button.clicked.connect(self.load_calibration_button_callback)
+        self.baseline_spinbox.valueChanged.connect(self.set_baseline)
 
         self.calibration_grid_layout.addWidget(self.auto_calibration_button, 0, 0)
         self.calibration_grid_layout.addWidget(self.capture_sample_button, 0, 1)
         self.calibration_grid_layout.addWidget(self.start_calculation_button, 1, 0)
         self.calibration_grid_layout.addWidget(self.print_all_points_button, 1, 1)
         self.calibration_grid_layout.addWidget(self.clear_all_points_button, 2, 0)
+        self.calibration_grid_layout.addWidget(self.sweep_calculation_button, 2, 1)
         self.calibration_grid_layout.addWidget(self.valid_sample_count_label, 3, 0)
         self.calibration_grid_layout.addWidget(self.valid_sample_count_value_label, 3, 1)
         self.calibration_grid_layout.addWidget(self.calibration_state_label, 4, 0)
         self.calibration_grid_layout.addWidget(self.calibration_state_value_label, 4, 1)
         self.calibration_grid_layout.addWidget(self.triangulate_one_point_button, 5, 0)
         self.calibration_grid_layout.addWidget(self.triangulating_button, 5, 1)
+        self.calibration_grid_layout.addWidget(self.sync_output_checkbox, 6, 0)
+        self.calibration_grid_layout.addWidget(self.sync_rate_spinbox, 6, 1)
+        self.calibration_grid_layout.addWidget(self.sync_skew_label, 7, 0)
+        self.calibration_grid_layout.addWidget(self.sync_skew_value_label, 7, 1)
+        self.calibration_grid_layout.addWidget(self.record_button, 8, 0)
+        self.calibration_grid_layout.addWidget(self.record_state_label, 8, 1)
+        self.calibration_grid_layout.addWidget(self.load_zones_button, 9, 0)
+        self.calibration_grid_layout.addWidget(self.load_bodies_button, 9, 1)
+        self.calibration_grid_layout.addWidget(self.load_calibration_button, 10, 0)
+        self.calibration_grid_layout.addWidget(self.baseline_spinbox, 10, 1)
 
         self.calibration_frame.setLayout(self.calibration_grid_layout)
         self.calibration_frame.setObjectName("calibration_frame")
@@ -149,6 +209,15 @@ class Monitor(QWidget):
         self.main_hbox_layout.setStretch(1, 4)
 
         self.setLayout(self.main_hbox_layout)
+        self.opengl_widget.frameSwapped.connect(self.first_frame_callback)
+
+    # 3D视图首帧显示后回调 输出启动报告并在后台预加载OpenCV
+    def first_frame_callback(self):
+        self.opengl_widget.frameSwapped.disconnect(self.first_frame_callback)
+        startup.mark("first frame")
+        print(startup.report())
+        self.logger.append_log(startup.report())
+        startup.warm_up("cv2")
 
     # 更新相机位姿到opengl显示模块
     def update_cam_poses(self):
@@ -159,6 +228,7 @@ class Monitor(QWidget):
         R2 = self.calibration.cam2_R
         t2 = self.calibration.cam2_t
         self.opengl_widget.update_cam_poses(R1, t1, R2, t2)
+        self.opengl_widget.set_sample_cloud(self.calibration.sample_cloud)
 
     # log信号回调函数 用于其他模块输出log信息
     def log_callback(self, log_str):
@@ -180,14 +250,182 @@ class Monitor(QWidget):
 
     # CAM1触发三角化信号回调函数  认为此时CAM1 CAM2近似同步
     def cam1_update_callback(self):
-        if self.is_triangulating:  # 正在三角化
-            # 触发单次三角化函数
+        if self.is_triangulating and not self.sync_output:  # 正在三角化 同步输出模式由定时器触发
+            # 触发单次三角化函数 (记录/区域事件使用单点结果)
             self.triangulate_one_point()
+            if self.body_tracker is not None:
+                self.track_bodies()
+
+    # 相机检测结果更新 记录该帧的接收时间/采集时间戳与唯一有效点
+    def time_sync_observe(self, index, udp_rx):
+        if udp_rx.current_frame_stamp is None:
+            return
+        self.time_sync.add_observation(index, udp_rx.current_frame_stamp, udp_rx.get_current_valid_point(),
+                                       udp_rx.current_capture_timestamp)
+
+    # 开启/关闭同步输出
+    def set_sync_output(self, enable):
+        self.sync_output = enable
+        if enable:
+            self.time_sync.clear()
+            self.sync_timer.start(int(1000 / self.sync_rate))
+        else:
+            self.sync_timer.stop()
+            self.sync_skew_value_label.setText("--")
+
+    # 设置同步输出频率(Hz)
+    def set_sync_rate(self, rate):
+        self.sync_rate = rate
+        if self.sync_timer.isActive():
+            self.sync_timer.start(int(1000 / rate))
+
+    # 同步输出定时器回调 取略早于当前的时刻 保证两相机都有前后样本可内插
+    def sync_timer_callback(self):
+        if not self.is_triangulating:
+            return
+        query = time.monotonic() - self.time_sync.query_delay()
+        points = self.time_sync.sample(query)
+        if points is None:
+            return
+        skew = self.time_sync.get_stats()["residual_skew_ms"]
+        self.sync_skew_value_label.setText(f"{skew:.2f} ms")
+        result = self.calibration.triangulate(points[0], points[1])
+        if result is not None:
+            self.output_point(query, result, points[0], points[1])
+        # 刚体使用各相机最新一帧的点集 不做时间插值
+        if self.body_tracker is not None:
+            self.track_bodies()
+
+    # 开始/停止记录 按钮回调函数 每次记录保存到recordings下以开始时间命名的目录
+    def record_button_callback(self):
+        if self.trajectory_writer is None:
+            path = os.path.join(self.recording_root, time.strftime("%Y%m%d_%H%M%S"))
+            self.trajectory_writer = TrajectoryWriter(path)
+            # 同时记录原始数据流与当前标定 可用batch_reprocess.py离线重新处理
+            self.udp1_rx.start_stream_recording(os.path.join(path, "cam1"))
+            self.udp2_rx.start_stream_recording(os.path.join(path, "cam2"))
+            if self.calibration.calibration_ok:
+                self.calibration.save_calibration(os.path.join(path, "calibration.npz"))
+            self.logger.append_log(f"MAIN: Start Recording to {path}")
+            self.record_button.setText("Stop Recording")
+        else:
+            self.stop_recording()
+
+    # 停止记录 写完缓存中的数据 程序退出时也会调用
+    def stop_recording(self):
+        if self.trajectory_writer is None:
+            return
+        self.trajectory_writer.close()
+        frames = [self.udp1_rx.stop_stream_recording(), self.udp2_rx.stop_stream_recording()]
+        stats = self.trajectory_writer.get_stats()
+        self.logger.append_log(f"MAIN: Stop Recording, {stats['written']} points, {stats['dropped']} dropped, "
+                               f"frames {frames}")
+        self.record_state_label.setText(f"{stats['written']} pts")
+        self.trajectory_writer = None
+        self.record_button.setText("Start Recording")
+
+    # 输出一个三角化结果: 显示 记录 区域事件 stamp: 观测时刻(time.monotonic())
+    def output_point(self, stamp, xyz, point1, point2):
+        self.opengl_widget.set_display_point(*xyz)
+        self.record_point(stamp, xyz, point1, point2)
+        self.check_zones(stamp, xyz)
+
+    # 载入区域文件 按钮回调函数
+    def load_zones_button_callback(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Load Zones", "", "Zone Files (*.json)")
+        if not path:
+            return
+        try:
+            self.zone_engine = ZoneEngine(load_zones(path))
+        except (OSError, ValueError, KeyError) as e:
+            self.logger.append_log(f"MAIN: Load Zones Error:{str(e)}")
+            return
+        self.logger.append_log(f"MAIN: Loaded {len(self.zone_engine.index.zones)} Zones from {path}")
+
+    # 区域事件检测 事件输出到log
+    def check_zones(self, stamp, xyz):
+        if self.zone_engine is None:
+            return
+        for event in self.zone_engine.update(stamp, 0, [xyz]):
+            self.logger.append_log(f"ZONE: marker {event['marker']} {event['type']} {event['zone']} "
+                                   f"({event['duration']:.2f} s)")
+
+    # 载入标定结果 按钮回调函数
+    def load_calibration_button_callback(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Load Calibration", self.recording_root,
+                                              "Calibration Files (*.npz)")
+        if not path:
+            return
+        try:
+            self.calibration.load_calibration(path)
+        except (OSError, ValueError, KeyError) as e:
+            self.logger.append_log(f"MAIN: Load Calibration Error:{str(e)}")
+            return
+        self.baseline_spinbox.blockSignals(True)
+        self.baseline_spinbox.setValue(self.calibration.baseline)
+        self.baseline_spinbox.blockSignals(False)
+        self.update_cam_poses()
+
+    # 设置两相机基线长度(米) 0为单位长度
+    def set_baseline(self, baseline):
+        self.calibration.set_baseline(baseline)
+        if self.calibration.calibration_ok:
+            self.update_cam_poses()
+
+    # 载入刚体定义 按钮回调函数
+    def load_bodies_button_callback(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Load Bodies", "", "Rigid Body Files (*.json)")
+        if not path:
+            return
+        try:
+            self.body_tracker = RigidBodyTracker(load_rigid_bodies(path))
+        except (OSError, ValueError, KeyError) as e:
+            self.logger.append_log(f"MAIN: Load Bodies Error:{str(e)}")
+            return
+        self.found_bodies = set()
+        self.opengl_widget.set_body_poses([])
+        self.logger.append_log(f"MAIN: Loaded {len(self.body_tracker.bodies)} Rigid Bodies from {path}")
+        if self.calibration.baseline <= 0:
+            self.logger.append_log("MAIN: Baseline not set, triangulated points are in baseline units, "
+                                   "rigid body layouts and tolerance must use the same unit")
+
+    # 多点三角化并识别刚体 位姿显示在OpenGL窗口
+    def track_bodies(self):
+        points1 = self.udp1_rx.get_current_valid_points()
+        points2 = self.udp2_rx.get_current_valid_points()
+        if points1 is None or points2 is None:
+            return
+        result = self.calibration.triangulate_markers(points1, points2)
+        if result is None:
+            return
+        poses = self.body_tracker.update(result[0])
+        self.opengl_widget.set_body_poses([(pose["R"], pose["t"]) for pose in poses])
+        found = {pose["name"] for pose in poses}
+        for name in sorted(found - self.found_bodies):
+            self.logger.append_log(f"BODY: {name} found")
+        for name in sorted(self.found_bodies - found):
+            self.logger.append_log(f"BODY: {name} lost")
+        self.found_bodies = found
+
+    # 记录一个三角化结果 stamp: 观测时刻(time.monotonic())
+    def record_point(self, stamp, xyz, point1, point2):
+        if self.trajectory_writer is None:
+            return
+        error = self.calibration.reprojection_errors(xyz, point1, point2).max()
+        self.trajectory_writer.append(stamp, 0, xyz, error, 0b11)
+        stats = self.trajectory_writer.get_stats()
+        if stats["appended"] % 100 == 0:
+            self.record_state_label.setText(f"{stats['appended']} pts")
 
     # 开始/停止持续三角化 按钮回调函数
     def triangulation_button_callback(self):
         if self.is_triangulating:
             self.is_triangulating = False
+            # 清除刚体显示与跟踪状态 重新开始时重新搜索
+            if self.body_tracker is not None:
+                self.body_tracker.reset()
+            self.found_bodies = set()
+            self.opengl_widget.set_body_poses([])
             self.logger.append_log("MAIN: Stop Triangulate!")
             self.triangulating_button.setText("Start Triangulating")
         else:
@@ -213,23 +451,35 @@ class Monitor(QWidget):
         self.calibration.start_calculation()
         self.update_cam_poses()
 
+    # 参数扫描校准计算
+    def start_sweep_calculation(self):
+        if self.calibration.start_sweep_calculation() is not None:
+            self.update_cam_poses()
+
     # 单对点三角化
     def triangulate_one_point(self):
         # 检测点是否有效
         point1 = self.udp1_rx.get_current_valid_point()
         point2 = self.udp2_rx.get_current_valid_point()
         if point1 and point2:
-            _x, _y, _z = self.calibration.triangulate(point1, point2)
-            self.opengl_widget.set_display_point(_x, _y, _z)
+            result = self.calibration.triangulate(point1, point2)
+            if result is None:
+                return
+            _x, _y, _z = result
+            stamp = self.udp1_rx.current_frame_stamp or time.monotonic()
+            self.output_point(stamp, (_x, _y, _z), point1, point2)
             # print("triangulate success!")
         else:
             print("triangulate failed!")
 
 
 if __name__ == "__main__":
+    startup.mark("imports")
     app = QApplication([])
     main_widget = QWidget()
     main_monitor = Monitor()
+    app.aboutToQuit.connect(main_monitor.stop_recording)
     main_widget.setLayout(main_monitor.main_hbox_layout)
+    startup.mark("widgets created")
     main_widget.show()
     app.exec_()
\ No newline at end of file
@@ -0,0 +1,495 @@
+import sys
+import time
+import random
+import socket
+import argparse
+from urllib.parse import urlsplit
+from udp_rx import ReceiveThread
+
+# HTTP MJPEG数据源 对应ESP32CAM官方CameraWebServer的 http://<ip>:81/stream
+# 响应为 multipart/x-mixed-replace 每个part为一帧JPEG 官方固件使用分块传输(Transfer-Encoding: chunked)
+# 每个part头含 Content-Length 与 X-Timestamp(秒.微秒) 也兼容没有Content-Length、只能按boundary切分的服务器
+# 解析是增量的: 只有HTTP头/part头经过小缓冲 已知长度的JPEG直接从socket接收到该帧自己的缓冲中 不做整帧拷贝
+# 每个相机一个长连接(开启TCP keep-alive) 断开或长时间无数据时按指数退避重连
+# MjpegReceiveThread继承ReceiveThread 整帧交给deliver_frame 与UDP数据源走同一处理路径
+
+HEADER_LIMIT = 16 * 1024  # HTTP头/part头最大长度
+MAX_FRAME_SIZE = 1 << 20  # 无Content-Length时按boundary切分的最大帧长度
+READ_BUFFER_SIZE = 2048  # 头部解析缓冲 JPEG数据不经过此缓冲
+BACKOFF_MIN = 0.5  # 重连退避(秒)
+BACKOFF_MAX = 8.0
+
+
+# socket读取层 带少量缓冲用于按行读取
+# 读超时时调用idle_callback 连续stall_limit次超时视为连接失效
+class SocketSource:
+    def __init__(self, sock, idle_callback=None, stall_limit=5):
+        self.sock = sock
+        self.idle_callback = idle_callback
+        self.stall_limit = stall_limit
+        self.buffer = bytearray(READ_BUFFER_SIZE)
+        self.start = 0
+        self.end = 0
+
+    def recv_into(self, view):
+        idle = 0
+        while True:
+            try:
+                n = self.sock.recv_into(view)
+            except socket.timeout:
+                idle += 1
+                if self.idle_callback is not None:
+                    self.idle_callback()
+                if idle >= self.stall_limit:
+                    raise ConnectionError("stream stalled")
+                continue
+            if n == 0:
+                raise ConnectionError("connection closed by camera")
+            return n
+
+    # 读取数据到view 先取缓冲中剩余数据 缓冲为空时直接从socket接收到view
+    def readinto(self, view):
+        if self.start < self.end:
+            n = min(len(view), self.end - self.start)
+            view[:n] = self.buffer[self.start:self.start + n]
+            self.start += n
+            return n
+        return self.recv_into(view)
+
+    # 读取一行(不含CRLF)
+    def readline(self, limit=HEADER_LIMIT):
+        while True:
+            index = self.buffer.find(b"\n", self.start, self.end)
+            if index >= 0:
+                line = bytes(self.buffer[self.start:index]).rstrip(b"\r")
+                self.start = index + 1
+                return line
+            if self.end - self.start >= limit:
+                raise ValueError("header line too long")
+            if self.start > 0:
+                self.buffer[:self.end - self.start] = self.buffer[self.start:self.end]
+                self.end -= self.start
+                self.start = 0
+            if self.end == len(self.buffer):
+                self.buffer.extend(bytes(len(self.buffer)))
+            self.end += self.recv_into(memoryview(self.buffer)[self.end:])
+
+    def close(self):
+        self.sock.close()
+
+
+# 分块传输解码层 对上层表现为连续字节流
+class ChunkedSource:
+    def __init__(self, source):
+        self.source = source
+        self.remaining = 0  # 当前块剩余字节数
+        self.started = False
+
+    def readinto(self, view):
+        if self.remaining == 0:
+            if self.started:
+                self.source.readline()  # 上一块末尾的CRLF
+            self.started = True
+            line = self.source.readline()
+            size = int(line.split(b";")[0], 16)
+            if size == 0:
+                raise ConnectionError("stream ended")
+            self.remaining = size
+        n = self.source.readinto(view[:min(len(view), self.remaining)])
+        self.remaining -= n
+        return n
+
+    def close(self):
+        self.source.close()
+
+
+# multipart/x-mixed-replace增量解析 read_part()返回(JPEG数据, 采集时间戳us或None)
+class MultipartReader:
+    def __init__(self, source, boundary):
+        self.source = source
+        self.delimiter = b"\r\n--" + boundary
+        self.boundary_line = b"--" + boundary
+        self.buffer = bytearray(READ_BUFFER_SIZE)
+        self.start = 0
+        self.end = 0
+
+    # 从数据源追加数据到缓冲 缓冲满时先前移未读数据 仍不够时扩容
+    def fill(self, limit):
+        if self.end == len(self.buffer):
+            if self.start > 0:
+                self.buffer[:self.end - self.start] = self.buffer[self.start:self.end]
+                self.end -= self.start
+                self.start = 0
+            elif len(self.buffer) >= limit:
+                raise ValueError("multipart part too large")
+            else:
+                self.buffer.extend(bytes(min(len(self.buffer), limit - len(self.buffer))))
+        self.end += self.source.readinto(memoryview(self.buffer)[self.end:])
+
+    # 读取到delimiter为止 返回delimiter之前的数据 delimiter本身被消耗
+    def read_until(self, delimiter, limit):
+        scan = self.start
+        while True:
+            index = self.buffer.find(delimiter, scan, self.end)
+            if index >= 0:
+                data = bytes(self.buffer[self.start:index])
+                self.start = index + len(delimiter)
+                return data
+            if self.end - self.start >= limit:
+                raise ValueError("delimiter not found")
+            # 下次只从可能包含delimiter开头的位置继续查找
+            offset = scan - self.start
+            scan_from = max(offset, self.end - self.start - len(delimiter) + 1)
+            self.fill(limit)
+            scan = self.start + scan_from
+
+    # 读取length字节 缓冲中剩余部分拷贝后 其余直接接收到结果缓冲
+    def read_exact(self, length):
+        frame = bytearray(length)
+        got = min(length, self.end - self.start)
+        frame[:got] = self.buffer[self.start:self.start + got]
+        self.start += got
+        view = memoryview(frame)
+        while got < length:
+            got += self.source.readinto(view[got:])
+        return frame
+
+    def read_part(self):
+        block = self.read_until(b"\r\n\r\n", HEADER_LIMIT)
+        lines = block.split(b"\r\n")
+        while lines and not lines[0]:
+            lines.pop(0)
+        # 按boundary切分时boundary行已随上一帧消耗
+        if lines and lines[0].startswith(b"--"):
+            if lines[0].rstrip() == self.boundary_line + b"--":
+                raise ConnectionError("multipart stream ended")
+            if lines[0].rstrip() != self.boundary_line:
+                raise ValueError("unexpected multipart boundary")
+            lines.pop(0)
+        headers = parse_headers(lines)
+        length = headers.get("content-length")
+        if length is not None:
+            frame = self.read_exact(int(length))
+        else:
+            frame = self.read_until(self.delimiter, MAX_FRAME_SIZE)
+        return frame, parse_timestamp(headers.get("x-timestamp"))
+
+    def close(self):
+        self.source.close()
+
+
+def parse_headers(lines):
+    headers = {}
+    for line in lines:
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return headers
+
+
+# X-Timestamp: "秒.微秒" -> 微秒整数
+def parse_timestamp(text):
+    if not text:
+        return None
+    seconds, _, micros = text.partition(".")
+    try:
+        return int(seconds) * 1000000 + int(micros.ljust(6, "0")[:6] or 0)
+    except ValueError:
+        return None
+
+
+# 连接MJPEG地址 返回MultipartReader
+def open_stream(url, timeout=1.0, idle_callback=None, stall_limit=5):
+    parts = urlsplit(url)
+    if parts.scheme != "http" or not parts.hostname:
+        raise ValueError(f"unsupported url: {url}")
+    sock = socket.create_connection((parts.hostname, parts.port or 80), timeout=timeout)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        request = f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nConnection: keep-alive\r\n\r\n"
+        sock.sendall(request.encode("latin-1"))
+        source = SocketSource(sock, idle_callback, stall_limit)
+        status = source.readline().split(None, 2)
+        if len(status) < 2 or status[1] != b"200":
+            raise ValueError(f"HTTP error: {b' '.join(status).decode('latin-1')}")
+        lines = []
+        while True:
+            line = source.readline()
+            if not line:
+                break
+            lines.append(line)
+        headers = parse_headers(lines)
+        content_type = headers.get("content-type", "")
+        if not content_type.startswith("multipart/") or "boundary=" not in content_type:
+            raise ValueError(f"not a multipart stream: {content_type}")
+        boundary = content_type.split("boundary=", 1)[1].split(";")[0].strip().strip('"')
+        if boundary.startswith("--"):
+            boundary = boundary[2:]  # 部分固件在头中带了前导--
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            source = ChunkedSource(source)
+        return MultipartReader(source, boundary.encode("latin-1"))
+    except Exception:
+        sock.close()
+        raise
+
+
+# HTTP MJPEG接收线程 接口与ReceiveThread相同 可替换UDP_RX.rx_thread
+class MjpegReceiveThread(ReceiveThread):
+    def __init__(self, url, timeout=1.0, stall_limit=5):
+        super().__init__(None)
+        self.url = url
+        self.timeout = timeout  # 单次读超时 同时是超时状态上报周期
+        self.stall_limit = stall_limit
+        self.connect_count = 0
+        self.reconnect_count = 0
+        self.socket_rx_addr = url
+
+    def run(self):
+        print(f"MJPEG RX Thread RUNNING {self.url}")
+        delay = BACKOFF_MIN
+        while self.running:
+            try:
+                reader = open_stream(self.url, self.timeout, self.on_idle, self.stall_limit)
+            except (OSError, ValueError) as e:
+                if self.running:
+                    print(f"MJPEG connect failed: {e}")
+                    self.on_idle()
+                    self.wait_backoff(delay)
+                    delay = min(delay * 2, BACKOFF_MAX)
+                continue
+            self.connect_count += 1
+            try:
+                while self.running:
+                    image_data, capture_timestamp = reader.read_part()
+                    self.health.on_packet(len(image_data))
+                    self.last_capture_timestamp = capture_timestamp
+                    if self.deliver_frame(image_data, capture_timestamp):
+                        delay = BACKOFF_MIN
+                    else:
+                        print("MJPEG Receive Lost! Data is Broken!")
+            except (OSError, ValueError) as e:
+                if self.running:
+                    print(f"MJPEG stream lost: {e}")
+            finally:
+                reader.close()
+            if self.running:
+                self.reconnect_count += 1
+                self.on_idle()
+                self.wait_backoff(delay)
+                delay = min(delay * 2, BACKOFF_MAX)
+
+    # 读超时/断线 上报超时状态 线程已停止时中断读取
+    def on_idle(self):
+        if not self.running:
+            raise ConnectionAbortedError("receiver stopped")
+        self.success_image_count = 0
+        self.success_time = 0
+        self.health.on_timeout()
+        self.udp_state_signal.emit(False)
+
+    # 退避等待 加少量随机抖动 避免多个相机同时重连
+    def wait_backoff(self, delay):
+        deadline = time.monotonic() + delay * random.uniform(1.0, 1.2)
+        while self.running and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def get_health(self):
+        stats = super().get_health()
+        stats["connects"] = self.connect_count
+        stats["reconnects"] = self.reconnect_count
+        return stats
+
+
+# 本地MJPEG测试服务器 模拟ESP32CAM官方固件
+# mode: "chunked" 分块传输 + Content-Length(官方固件) / "length" 仅Content-Length / "boundary" 只能按boundary切分
+# 每次写入随机长度的片段 覆盖头部与JPEG数据跨越任意读边界的情况
+class StubMjpegServer:
+    BOUNDARY = b"123456789000000000000987654321"
+
+    def __init__(self, port=0, mode="chunked", fps=30.0, seed=0):
+        import socketserver
+        import threading
+        from cam_simulator import DotPath, SimCamera, DotRenderer
+
+        self.mode = mode
+        self.fps = fps
+        self.stopped = threading.Event()
+        # 预先渲染一段循环播放的帧
+        dot_path, camera, renderer = DotPath(), SimCamera(0, 2), DotRenderer(seed=seed)
+        self.frames = [renderer.render(camera.project(dot_path.positions(k / fps))[0]) for k in range(int(fps))]
+        stub = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                stub.serve(self.request)
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def serve(self, conn):
+        rng = random.Random(self.port)
+        request = b""
+        while b"\r\n\r\n" not in request:
+            data = conn.recv(1024)
+            if not data:
+                return
+            request += data
+        header = b"HTTP/1.1 200 OK\r\nContent-Type: multipart/x-mixed-replace;boundary=" + self.BOUNDARY + b"\r\n"
+        if self.mode == "chunked":
+            header += b"Transfer-Encoding: chunked\r\n"
+        conn.sendall(header + b"\r\n")
+        k = 0
+        next_time = time.monotonic()
+        try:
+            while not self.stopped.is_set():
+                jpeg = self.frames[k % len(self.frames)]
+                k += 1
+                now = time.time()
+                pieces = [b"\r\n--" + self.BOUNDARY + b"\r\n",
+                          b"Content-Type: image/jpeg\r\n"
+                          + (b"Content-Length: %d\r\n" % len(jpeg) if self.mode != "boundary" else b"")
+                          + b"X-Timestamp: %d.%06d\r\n\r\n" % (int(now), int(now % 1 * 1e6)),
+                          jpeg]
+                if self.mode == "chunked":
+                    pieces = [b"%X\r\n" % len(piece) + piece + b"\r\n" for piece in pieces]
+                data = b"".join(pieces)
+                offset = 0
+                while offset < len(data):
+                    size = rng.randint(1, 3000)
+                    conn.sendall(data[offset:offset + size])
+                    offset += size
+                next_time += 1.0 / self.fps
+                time.sleep(max(0.0, next_time - time.monotonic()))
+        except OSError:
+            pass
+
+    def close(self):
+        self.stopped.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# 在内存数据上测量解析吞吐
+class _MemorySocket:
+    def __init__(self, data):
+        self.view = memoryview(data)
+        self.offset = 0
+
+    def recv_into(self, view):
+        n = min(len(view), len(self.view) - self.offset, 65536)
+        view[:n] = self.view[self.offset:self.offset + n]
+        self.offset += n
+        return n
+
+    def close(self):
+        pass
+
+
+def _parse_benchmark(mode, frame_num=2000):
+    from cam_simulator import DotRenderer
+    jpeg = DotRenderer(seed=1).render([(320.0, 240.0)])
+    boundary = StubMjpegServer.BOUNDARY
+    part = (b"\r\n--" + boundary + b"\r\nContent-Type: image/jpeg\r\n"
+            + (b"Content-Length: %d\r\n" % len(jpeg) if mode != "boundary" else b"")
+            + b"X-Timestamp: 1.000000\r\n\r\n" + jpeg)
+    reader = MultipartReader(SocketSource(_MemorySocket(part * frame_num + b"\r\n--" + boundary + b"--\r\n")), boundary)
+    begin = time.perf_counter()
+    for _ in range(frame_num):
+        frame, _ts = reader.read_part()
+        assert frame == jpeg
+    elapsed = time.perf_counter() - begin
+    return elapsed / frame_num * 1e6, len(part) * frame_num / elapsed / 1e6
+
+
+# 本地测试: 三个测试服务器(官方固件分块/仅长度/仅boundary) 中途停掉一个服务器再恢复 验证重连
+def stub_test(seconds):
+    from PyQt5.QtCore import Qt
+    import numpy as np
+    import cv2 as cv
+
+    for mode in ("length", "boundary"):
+        us, mb = _parse_benchmark(mode)
+        print(f"parse {mode:8s}: {us:.1f} us/frame, {mb:.0f} MB/s")
+
+    servers = [StubMjpegServer(mode=mode) for mode in ("chunked", "length", "boundary")]
+    threads, counts = [], []
+    for server in servers:
+        thread = MjpegReceiveThread(f"http://127.0.0.1:{server.port}/stream", timeout=0.2)
+        count = {"frames": 0, "bad": 0, "last_ts": None}
+
+        def on_frame(thread=thread, count=count):
+            while True:
+                frame = thread.mailbox.take()
+                if frame is None:
+                    return
+                image_data, capture_timestamp, _arrival = frame
+                img = cv.imdecode(np.frombuffer(image_data, dtype=np.uint8), cv.IMREAD_GRAYSCALE)
+                if img is None or capture_timestamp is None:
+                    count["bad"] += 1
+                count["frames"] += 1
+        thread.frame_ready_signal.connect(on_frame, Qt.DirectConnection)
+        thread.running = True
+        thread.start()
+        threads.append(thread)
+        counts.append(count)
+
+    time.sleep(seconds / 2)
+    port, mode = servers[0].port, servers[0].mode
+    servers[0].close()
+    print(f"server {port} ({mode}) stopped")
+    time.sleep(1.5)
+    before = counts[0]["frames"]
+    servers[0] = StubMjpegServer(port=port, mode=mode)
+    print(f"server {port} restarted")
+    time.sleep(seconds / 2)
+    for server, thread, count in zip(servers, threads, counts):
+        thread.stop()
+        thread.wait()
+        server.close()
+        stats = thread.get_health()
+        print(f"  {server.mode:8s}: {count['frames']} frames ({count['bad']} bad), broken {stats['broken']}, "
+              f"connects {stats['connects']}, reconnects {stats['reconnects']}, "
+              f"interval p95 {stats['interval_p95_ms']:.1f} ms")
+    print(f"frames after restart on {mode} server: {counts[0]['frames'] - before}")
+
+
+# 用法:
+#   python mjpeg_rx.py http://192.168.1.50:81/stream [http://192.168.1.51:81/stream ...]
+#   python mjpeg_rx.py --stub   本地测试服务器自测
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP MJPEG camera ingest")
+    parser.add_argument("url", nargs="*", help="MJPEG地址 可多个")
+    parser.add_argument("--stub", action="store_true", help="本地测试服务器自测")
+    parser.add_argument("--seconds", type=float, default=6.0, help="自测时长")
+    parser.add_argument("--report", type=float, default=5.0, help="统计输出间隔(秒)")
+    args = parser.parse_args()
+    if args.stub:
+        stub_test(args.seconds)
+        sys.exit(0)
+    if not args.url:
+        parser.error("url is required")
+
+    threads = [MjpegReceiveThread(url) for url in args.url]
+    for thread in threads:
+        # 无界面模式 只统计不处理
+        thread.running = True
+        thread.start()
+    try:
+        while True:
+            time.sleep(args.report)
+            for thread in threads:
+                thread.mailbox.clear()
+                stats = thread.get_health()
+                print(f"  {thread.url}: {stats['fps']:.1f} fps {stats['bytes_per_second'] / 1024:.0f} KB/s, "
+                      f"broken {stats['broken']}, reconnects {stats['reconnects']}")
+    except KeyboardInterrupt:
+        pass
+    for thread in threads:
+        thread.stop()
+        thread.wait()
@@ -1,22 +1,139 @@
 import sys
 from PyQt5.QtWidgets import QApplication, QMainWindow, QOpenGLWidget
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtGui import QGuiApplication
 from OpenGL.GL import *
 from OpenGL.GLU import *
-from OpenGL.GLUT import *
 import numpy as np
+import ctypes
+import time
 
+# 轨迹尾迹颜色表 按marker_id循环使用
+TRAIL_COLORS = [(1.0, 0.5, 0.0), (0.0, 0.8, 1.0), (1.0, 1.0, 0.0), (0.5, 1.0, 0.5)]
 
 
+# 定长环形顶点缓冲
+# CPU侧为预分配的numpy镜像 GPU侧为同样大小的VBO
+# 新点只覆盖最旧的槽位 绘制前仅上传新写入的部分(glBufferSubData) 不做整帧重建
+class PointRingBuffer:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.points = np.zeros((capacity, 3), dtype=np.float32)
+        self.stamps = np.zeros(capacity, dtype=np.float64)
+        self.write_count = 0  # 累计写入点数(单调递增)
+        self.uploaded_count = 0  # 已上传到VBO的累计点数
+        self.vbo = None  # 在GL上下文中懒创建
+
+    def __len__(self):
+        return min(self.write_count, self.capacity)
+
+    def clear(self):
+        self.write_count = 0
+        self.uploaded_count = 0
+
+    # 追加点 points: (N, 3) stamps: 时间戳(秒) 默认为当前时间
+    def append(self, points, stamps=None):
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 3)
+        n = len(points)
+        if n == 0:
+            return
+        if stamps is None:
+            stamps = np.full(n, time.monotonic())
+        else:
+            stamps = np.broadcast_to(np.asarray(stamps, dtype=np.float64), (n,))
+        if n > self.capacity:  # 超出容量的部分直接丢弃最旧的
+            self.write_count += n - self.capacity
+            points = points[-self.capacity:]
+            stamps = stamps[-self.capacity:]
+            n = self.capacity
+        start = self.write_count % self.capacity
+        first = min(n, self.capacity - start)
+        self.points[start:start + first] = points[:first]
+        self.stamps[start:start + first] = stamps[:first]
+        self.points[:n - first] = points[first:]
+        self.stamps[:n - first] = stamps[first:]
+        self.write_count += n
+
+    # 返回需要绘制的物理槽位区间[(first, count), ...] 按从旧到新排列
+    # since: 只保留时间戳不早于since的点 时间戳按写入顺序单调 两段分别二分查找
+    def ranges(self, since=None):
+        size = len(self)
+        if size == 0:
+            return []
+        head = (self.write_count - size) % self.capacity  # 最旧点所在槽位
+        head_len = min(size, self.capacity - head)
+        skip = 0
+        if since is not None:
+            skip = int(np.searchsorted(self.stamps[head:head + head_len], since))
+            if skip == head_len:
+                skip += int(np.searchsorted(self.stamps[:size - head_len], since))
+        count = size - skip
+        if count <= 0:
+            return []
+        start = (head + skip) % self.capacity
+        first = min(count, self.capacity - start)
+        if first == count:
+            return [(start, count)]
+        return [(start, first), (0, count - first)]
+
+    # 将新写入的点增量上传到VBO 需在GL上下文中调用
+    def upload(self):
+        if self.vbo is None:
+            self.vbo = glGenBuffers(1)
+            glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+            glBufferData(GL_ARRAY_BUFFER, self.points.nbytes, None, GL_DYNAMIC_DRAW)
+            self.uploaded_count = self.write_count - len(self)
+        else:
+            glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        pending = self.write_count - self.uploaded_count
+        if pending >= self.capacity:
+            glBufferSubData(GL_ARRAY_BUFFER, 0, self.points.nbytes, self.points)
+        elif pending > 0:
+            start = self.uploaded_count % self.capacity
+            first = min(pending, self.capacity - start)
+            glBufferSubData(GL_ARRAY_BUFFER, start * 12, first * 12, self.points[start:start + first])
+            if pending > first:
+                glBufferSubData(GL_ARRAY_BUFFER, 0, (pending - first) * 12, self.points[:pending - first])
+        self.uploaded_count = self.write_count
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    # 绘制缓冲中的点 mode: GL_POINTS / GL_LINE_STRIP
+    def draw(self, mode, since=None):
+        self.upload()
+        ranges = self.ranges(since)
+        if not ranges:
+            return
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(3, GL_FLOAT, 0, ctypes.c_void_p(0))
+        for first, count in ranges:
+            glDrawArrays(mode, first, count)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        if mode == GL_LINE_STRIP and len(ranges) == 2:
+            # 回绕处两段不连续 补一条连接线
+            glBegin(GL_LINES)
+            glVertex3fv(self.points[self.capacity - 1])
+            glVertex3fv(self.points[0])
+            glEnd()
+
 
 class OpenGLWidget(QOpenGLWidget):
     def __init__(self, parent=None):
-        glutInit()  # 初始化 GLUT
         super(OpenGLWidget, self).__init__(parent)
         # 当前绘制移动点
         self.current_point = np.array([0, 0, 0])
         # 当前点是否有效
         self.current_point_is_valid = False
+        # 轨迹尾迹 marker_id -> PointRingBuffer 只显示最近trail_seconds秒
+        self.trails = {}
+        self.trail_seconds = 10.0
+        self.trail_capacity = 8192
+        # 标定采样点云
+        self.sample_cloud = PointRingBuffer(200000)
+        # 刚体位姿 [(R, t), ...] 以坐标轴显示
+        self.body_poses = []
+        self.body_axis_length = 0.2
 
         self.last_pos = None
         self.x_rotation = 0  # 初始x旋转角度
@@ -38,6 +155,66 @@ class OpenGLWidget(QOpenGLWidget):
                                [0, self.cam_fy, self.cam_cy],
                                [0, 0, 1]], dtype=np.float64)
 
+        # 重绘调度: 状态更新只保存最新值并置脏标记 由定时器按上限帧率合并重绘
+        self.repaint_pending = False
+        self.max_fps = 60.0
+        self.repaint_timer = QTimer(self)
+        self.repaint_timer.timeout.connect(self.repaint_timer_callback)
+        self.set_max_fps(None)
+        self.repaint_timer.start()
+        # 渲染统计
+        self.request_count = 0  # 重绘请求次数
+        self.render_count = 0  # 实际渲染次数
+        self.hidden_skip_count = 0  # 因隐藏/最小化跳过的调度次数
+        self.render_time_last = 0.0  # 最近一次渲染耗时(秒)
+        self.render_time_avg = 0.0  # 渲染耗时指数平均(秒)
+        self.render_time_max = 0.0  # 最大渲染耗时(秒)
+
+    # 设置最大重绘帧率 fps为None时使用屏幕刷新率
+    def set_max_fps(self, fps):
+        if fps is None:
+            screen = QGuiApplication.primaryScreen()
+            fps = screen.refreshRate() if screen is not None else 60.0
+            if fps <= 0:
+                fps = 60.0
+        self.max_fps = float(fps)
+        self.repaint_timer.setInterval(max(1, int(round(1000.0 / self.max_fps))))
+
+    # 请求重绘 仅置脏标记 实际重绘由repaint_timer_callback合并执行
+    def request_repaint(self):
+        self.request_count += 1
+        self.repaint_pending = True
+
+    # 重绘定时器回调 窗口隐藏或最小化时不渲染
+    def repaint_timer_callback(self):
+        if not self.repaint_pending and not self.trails_active():
+            return
+        if not self.isVisible() or self.window().isMinimized():
+            self.hidden_skip_count += 1
+            return
+        self.repaint_pending = False
+        self.update()
+
+    # 是否存在仍在时间窗口内的轨迹 用于尾迹随时间消退
+    def trails_active(self):
+        since = time.monotonic() - self.trail_seconds
+        for trail in self.trails.values():
+            if len(trail) > 0 and trail.stamps[(trail.write_count - 1) % trail.capacity] >= since:
+                return True
+        return False
+
+    # 获取渲染统计信息
+    def get_render_stats(self):
+        return {
+            "max_fps": self.max_fps,
+            "requests": self.request_count,
+            "renders": self.render_count,
+            "hidden_skips": self.hidden_skip_count,
+            "last_ms": self.render_time_last * 1000,
+            "avg_ms": self.render_time_avg * 1000,
+            "max_ms": self.render_time_max * 1000,
+        }
+
     def pixel2cam(self,px, py):
         return (px - self.cam_cx) / self.cam_fx, (py - self.cam_cy) / self.cam_fy
 
@@ -45,7 +222,36 @@ class OpenGLWidget(QOpenGLWidget):
     def set_display_point(self, x, y, z):
         self.current_point_is_valid = True
         self.current_point = np.array([x, y, z])
-        self.update()
+        self.add_trail_point(0, x, y, z)
+        self.request_repaint()
+
+    # 向指定marker的轨迹尾迹追加一个点 stamp: time.monotonic()时间戳 默认为当前时间
+    def add_trail_point(self, marker_id, x, y, z, stamp=None):
+        if marker_id not in self.trails:
+            self.trails[marker_id] = PointRingBuffer(self.trail_capacity)
+        self.trails[marker_id].append([x, y, z], stamp)
+
+    # 清除所有轨迹尾迹
+    def clear_trails(self):
+        for trail in self.trails.values():
+            trail.clear()
+        self.request_repaint()
+
+    # 设置标定采样点云 points: (N, 3)
+    def set_sample_cloud(self, points):
+        self.sample_cloud.clear()
+        self.sample_cloud.append(points)
+        self.request_repaint()
+
+    # 向标定采样点云追加点 points: (N, 3)
+    def append_sample_cloud(self, points):
+        self.sample_cloud.append(points)
+        self.request_repaint()
+
+    # 设置刚体位姿 poses: [(R, t), ...] 刚体坐标系到世界坐标系
+    def set_body_poses(self, poses):
+        self.body_poses = list(poses)
+        self.request_repaint()
 
     # 从欧拉角构建旋转矩阵
     def euler_to_rotation_matrix(self, yaw, pitch, roll):
@@ -69,7 +275,7 @@ class OpenGLWidget(QOpenGLWidget):
 
     # 旋转矩阵转换为Angle-Axis格式
     def rotation_matrix_to_gl_rotate(self, R):
-        angle = np.arccos((np.trace(R) - 1) / 2)
+        angle = np.arccos(np.clip((np.trace(R) - 1) / 2, -1.0, 1.0))  # 数值误差可能使迹略超出范围
         if np.sin(angle) != 0:
             x = (R[2, 1] - R[1, 2]) / (2 * np.sin(angle))
             y = (R[0, 2] - R[2, 0]) / (2 * np.sin(angle))
@@ -91,7 +297,7 @@ class OpenGLWidget(QOpenGLWidget):
         self.cam1_t = cam1_t
         self.cam2_R = cam2_R
         self.cam2_t = cam2_t
-        self.update()
+        self.request_repaint()
 
     def initializeGL(self):
         glClearColor(0.0, 0.0, 0.0, 1.0)
@@ -206,6 +412,17 @@ class OpenGLWidget(QOpenGLWidget):
         self.draw_camera_view(2)
         glPopMatrix()
 
+    # 绘制所有刚体坐标轴
+    def draw_bodies(self):
+        length = self.body_axis_length
+        for R, t in self.body_poses:
+            glPushMatrix()
+            glTranslatef(t[0], t[1], t[2])
+            angle, x, y, z = self.rotation_matrix_to_gl_rotate(R)
+            glRotatef(angle, x, y, z)
+            self.draw_xyz_axis(length, length, length, 4)
+            glPopMatrix()
+
     # 显示单个点
     def draw_point(self):
         if self.current_point_is_valid:
@@ -217,8 +434,23 @@ class OpenGLWidget(QOpenGLWidget):
             glPopMatrix()
             gluDeleteQuadric(quad)
 
+    # 绘制标定采样点云
+    def draw_sample_cloud(self):
+        glPointSize(2.0)
+        glColor3f(0.2, 0.6, 1.0)
+        self.sample_cloud.draw(GL_POINTS)
+
+    # 绘制所有marker最近trail_seconds秒的轨迹
+    def draw_trails(self):
+        since = time.monotonic() - self.trail_seconds
+        glLineWidth(2.0)
+        for marker_id, trail in self.trails.items():
+            glColor3f(*TRAIL_COLORS[marker_id % len(TRAIL_COLORS)])
+            trail.draw(GL_LINE_STRIP, since)
+
     # 绘制更新函数
     def paintGL(self):
+        start_time = time.perf_counter()
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
         glLoadIdentity()  # 复位单帧变换矩阵
         # 鼠标移动控制
@@ -229,8 +461,20 @@ class OpenGLWidget(QOpenGLWidget):
         self.draw_xz_plane(-5, -5, 5, 5, 0, 10, 10)
         # 绘制相机Pose
         self.draw_cam_poses()
-        # 绘制三角化点
+        # 绘制标定点云与轨迹
+        self.draw_sample_cloud()
+        self.draw_trails()
+        # 绘制三角化点与刚体
         self.draw_point()
+        self.draw_bodies()
+        # 渲染耗时统计
+        self.render_time_last = time.perf_counter() - start_time
+        if self.render_count == 0:
+            self.render_time_avg = self.render_time_last
+        else:
+            self.render_time_avg += (self.render_time_last - self.render_time_avg) * 0.05
+        self.render_time_max = max(self.render_time_max, self.render_time_last)
+        self.render_count += 1
 
     # 鼠标事件处理回调函数
     def mousePressEvent(self, event):
@@ -248,14 +492,14 @@ class OpenGLWidget(QOpenGLWidget):
             elif self.mouse_button == Qt.RightButton:
                 self.x_translation += dy
                 self.z_translation += dx
-            self.update()
+            self.request_repaint()
         self.last_pos = event.pos()
 
     # 鼠标滚轮事件处理回调函数
     def wheelEvent(self, event):
         delta = event.angleDelta().y() / 120  # 每个步长的单位为120
         self.zoom += delta * 0.5  # 缩放因子
-        self.update()
+        self.request_repaint()
 
 
 class MainWindow(QMainWindow):
@@ -0,0 +1,281 @@
+import sys
+import json
+import time
+import itertools
+import numpy as np
+
+# 刚体6自由度位姿跟踪
+# 刚体由若干marker在刚体坐标系下的位置定义(marker布局) 位姿满足 世界坐标 X = R @ X_body + t
+# 每帧输入三角化得到的无标签点集 识别各刚体对应的点并求位姿
+# 跟踪: 上一帧已识别的刚体 用上一帧位姿预测各marker位置 与当前点最近邻对应 不做组合搜索
+# 搜索: 新出现或跟踪丢失的刚体 用三个锚点marker的两两距离在点集距离矩阵中找候选三元组
+#       候选三元组批量求位姿后用其余marker验证 取对应marker最多、误差最小的一组
+# 所有刚体的位姿由一次批量Kabsch求解(各刚体的3x3 SVD合并为一次批量计算)
+# 布局中各marker间距离应互不相同 对称布局存在多个同样好的解
+# 布局坐标与tolerance须与三角化结果同单位: Calibration设置基线长度(米)后为米 未设置时为基线单位
+MIN_MARKERS = 3  # 求位姿所需的最少对应marker数
+MAX_CANDIDATES = 4096  # 单个刚体搜索时候选三元组数量上限
+
+
+# 单个刚体定义 tolerance: 对应距离容差 None时使用跟踪器默认值
+class RigidBody:
+    def __init__(self, name, markers, tolerance=None):
+        self.name = name
+        self.markers = np.asarray(markers, dtype=np.float64).reshape(-1, 3)
+        if len(self.markers) < MIN_MARKERS:
+            raise ValueError(f"rigid body {name} needs at least {MIN_MARKERS} markers")
+        self.tolerance = tolerance
+        # 搜索用锚点三元组 按三角形面积从大到小(越大越不容易退化) 前面的锚点被遮挡时依次尝试后面的
+        triples = list(itertools.combinations(range(len(self.markers)), 3))
+        areas = [np.linalg.norm(np.cross(self.markers[b] - self.markers[a], self.markers[c] - self.markers[a]))
+                 for a, b, c in triples]
+        self.anchor_sets = []
+        for area, triple in sorted(zip(areas, triples), reverse=True):
+            if area < 1e-9:
+                continue  # 共线三点无法确定位姿
+            a, b, c = self.markers[list(triple)]
+            distances = np.array([np.linalg.norm(b - a), np.linalg.norm(c - a), np.linalg.norm(c - b)])
+            self.anchor_sets.append((np.array(triple), distances))
+        if not self.anchor_sets:
+            raise ValueError(f"rigid body {name} markers are collinear")
+
+
+# 从JSON读取刚体定义
+# [{"name": "wand", "markers": [[x, y, z], ...], "tolerance": 0.01}, ...]
+def load_rigid_bodies(path):
+    with open(path) as f:
+        items = json.load(f)
+    return [RigidBody(item["name"], item["markers"], item.get("tolerance")) for item in items]
+
+
+# 批量Kabsch 求 observed ≈ R @ model + t
+# model/observed: (B, K, 3) mask: (B, K) 参与拟合的点 返回 R (B, 3, 3), t (B, 3), rms (B,)
+def kabsch(model, observed, mask=None):
+    if mask is None:
+        mask = np.ones(model.shape[:2], dtype=bool)
+    weight = mask.astype(np.float64)[..., None]
+    observed = np.where(mask[..., None], observed, 0.0)
+    count = np.maximum(weight.sum(axis=1), 1.0)
+    model_center = (model * weight).sum(axis=1) / count
+    observed_center = (observed * weight).sum(axis=1) / count
+    H = np.einsum("bki,bkj->bij", (model - model_center[:, None]) * weight, observed - observed_center[:, None])
+    U, _S, Vt = np.linalg.svd(H)
+    # 修正反射解 保证det(R)=1
+    sign = np.sign(np.linalg.det(np.einsum("bji,bkj->bik", Vt, U)))
+    sign[sign == 0] = 1.0
+    Vt[:, 2] *= sign[:, None]
+    R = np.einsum("bji,bkj->bik", Vt, U)
+    t = observed_center - np.einsum("bij,bj->bi", R, model_center)
+    residual = observed - (np.einsum("bij,bkj->bki", R, model) + t[:, None])
+    rms = np.sqrt((np.einsum("bki,bki->bk", residual, residual) * weight[..., 0]).sum(axis=1) / count[:, 0])
+    return R, t, rms
+
+
+# 每个点只分配给距离最近的一个(刚体, marker) 输入为候选对应的扁平数组 返回保留的掩码
+def unique_points(point_idx, distance):
+    order = np.argsort(distance, kind="stable")
+    _, first = np.unique(point_idx[order], return_index=True)
+    keep = np.zeros(len(point_idx), dtype=bool)
+    keep[order[first]] = True
+    return keep
+
+
+# 刚体跟踪器 tolerance: 对应距离容差(与三角化坐标单位相同) max_rms: 位姿拟合均方根误差上限
+class RigidBodyTracker:
+    def __init__(self, bodies, tolerance=0.01, max_rms=None, min_markers=MIN_MARKERS):
+        self.bodies = list(bodies)
+        self.min_markers = max(min_markers, MIN_MARKERS)
+        body_num = len(self.bodies)
+        marker_num = max([len(body.markers) for body in self.bodies], default=MIN_MARKERS)
+        # 所有刚体的marker布局补齐为相同个数 便于批量计算
+        self.model = np.zeros((body_num, marker_num, 3))
+        self.model_mask = np.zeros((body_num, marker_num), dtype=bool)
+        for i, body in enumerate(self.bodies):
+            self.model[i, :len(body.markers)] = body.markers
+            self.model_mask[i, :len(body.markers)] = True
+        self.tolerance = np.array([body.tolerance or tolerance for body in self.bodies])
+        self.max_rms = self.tolerance if max_rms is None else np.full(body_num, max_rms)
+        self.poses = [None] * body_num  # 上一帧位姿(R, t) 丢失为None
+        # 统计
+        self.frame_count = 0
+        self.tracked_count = 0  # 由上一帧位姿直接对应成功的次数
+        self.search_count = 0  # 组合搜索次数
+        self.found_count = 0
+        self.update_time = 0.0
+
+    def reset(self):
+        self.poses = [None] * len(self.bodies)
+
+    # 输入一帧三角化点 points: (N, 3) 返回识别到的刚体列表
+    # [{"name", "body", "R", "t", "rms", "markers": 对应marker数, "points": 各marker对应点索引(-1为缺失), "tracked"}]
+    def update(self, points):
+        start = time.perf_counter()
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        body_num, marker_num = self.model_mask.shape
+        assign = np.full((body_num, marker_num), -1, dtype=np.int64)
+        tracked = np.array([pose is not None for pose in self.poses], dtype=bool)
+        # 1. 跟踪: 用上一帧位姿预测 所有跟踪中的刚体一起计算
+        track_ids = np.nonzero(tracked)[0]
+        if len(track_ids) and len(points):
+            R = np.stack([self.poses[i][0] for i in track_ids])
+            t = np.stack([self.poses[i][1] for i in track_ids])
+            predicted = np.einsum("bij,bkj->bki", R, self.model[track_ids]) + t[:, None]
+            distance = np.linalg.norm(predicted[:, :, None, :] - points[None, None], axis=3)
+            nearest = distance.argmin(axis=2)
+            nearest_distance = np.take_along_axis(distance, nearest[..., None], axis=2)[..., 0]
+            ok = self.model_mask[track_ids] & (nearest_distance < self.tolerance[track_ids, None])
+            b, k = np.nonzero(ok)
+            keep = unique_points(nearest[b, k], nearest_distance[b, k])
+            assign[track_ids[b[keep]], k[keep]] = nearest[b[keep], k[keep]]
+        counts = (assign >= 0).sum(axis=1)
+        tracked &= counts >= self.min_markers
+        # 2. 搜索: 跟踪失败或新出现的刚体 只在未被占用的点中搜索
+        available = np.ones(len(points), dtype=bool)
+        available[assign[tracked][assign[tracked] >= 0]] = False
+        for i in np.nonzero(~tracked)[0]:
+            assign[i] = -1
+            self.search_count += 1
+            result = self.search(i, points, available)
+            if result is not None:
+                assign[i] = result
+                available[result[result >= 0]] = False
+        # 3. 批量求位姿
+        counts = (assign >= 0).sum(axis=1)
+        fit_ids = np.nonzero(counts >= self.min_markers)[0]
+        poses = []
+        self.poses = [None] * body_num
+        if len(fit_ids):
+            mask = assign[fit_ids] >= 0
+            observed = points[np.maximum(assign[fit_ids], 0)]
+            R, t, rms = kabsch(self.model[fit_ids], observed, mask)
+            for j, i in enumerate(fit_ids):
+                if rms[j] > self.max_rms[i]:
+                    continue
+                self.poses[i] = (R[j], t[j])
+                poses.append({"name": self.bodies[i].name, "body": int(i), "R": R[j], "t": t[j],
+                              "rms": float(rms[j]), "markers": int(counts[i]),
+                              "points": assign[i, :len(self.bodies[i].markers)].copy(), "tracked": bool(tracked[i])})
+        self.frame_count += 1
+        self.tracked_count += sum(pose["tracked"] for pose in poses)
+        self.found_count += len(poses)
+        self.update_time += time.perf_counter() - start
+        return poses
+
+    # 在可用点中搜索刚体i 返回各marker对应的点索引(K,) 找不到返回None
+    def search(self, i, points, available):
+        body = self.bodies[i]
+        index = np.nonzero(available)[0]
+        if len(index) < self.min_markers:
+            return None
+        candidates = points[index]
+        D = np.linalg.norm(candidates[:, None] - candidates[None], axis=2)
+        for anchors, anchor_distances in body.anchor_sets:
+            result = self.search_anchors(i, anchors, anchor_distances, candidates, D)
+            if result is not None:
+                result[result >= 0] = index[result[result >= 0]]
+                return result
+        return None
+
+    # 以一组锚点搜索 D: 候选点距离矩阵 返回各marker对应的候选点索引(K,) 找不到返回None
+    def search_anchors(self, i, anchors, anchor_distances, candidates, D):
+        body = self.bodies[i]
+        tolerance = self.tolerance[i]
+        d01, d02, d12 = anchor_distances
+        # 锚点0/1的候选点对 再找同时满足另两条边的锚点2
+        first, second = np.nonzero(np.abs(D - d01) < tolerance)
+        third_ok = (np.abs(D[first] - d02) < tolerance) & (np.abs(D[second] - d12) < tolerance)
+        pair, third = np.nonzero(third_ok)
+        triples = np.stack([first[pair], second[pair], third], axis=1)[:MAX_CANDIDATES]
+        if len(triples) == 0:
+            return None
+        model = np.broadcast_to(body.markers[anchors], (len(triples), 3, 3))
+        R, t, _rms = kabsch(model, candidates[triples])
+        # 用其余marker验证 (T, K, M)
+        predicted = np.einsum("bij,kj->bki", R, body.markers) + t[:, None]
+        distance = np.linalg.norm(predicted[:, :, None, :] - candidates[None, None], axis=3)
+        nearest = distance.argmin(axis=2)
+        nearest_distance = np.take_along_axis(distance, nearest[..., None], axis=2)[..., 0]
+        matched = nearest_distance < tolerance
+        count = matched.sum(axis=1)
+        error = np.where(matched, nearest_distance, 0.0).sum(axis=1) / np.maximum(count, 1)
+        best = np.lexsort((error, -count))[0]
+        if count[best] < self.min_markers:
+            return None
+        result = np.full(self.model_mask.shape[1], -1, dtype=np.int64)
+        k = np.nonzero(matched[best])[0]
+        keep = unique_points(nearest[best, k], nearest_distance[best, k])
+        result[k[keep]] = nearest[best, k[keep]]
+        return result
+
+    def get_stats(self):
+        return {
+            "frames": self.frame_count,
+            "found": self.found_count,
+            "tracked": self.tracked_count,
+            "searches": self.search_count,
+            "update_us": self.update_time / max(self.frame_count, 1) * 1e6,
+        }
+
+
+# 轴角 -> 旋转矩阵 rvec: (N, 3)
+def rotation_from_vector(rvec):
+    rvec = np.asarray(rvec, dtype=np.float64).reshape(-1, 3)
+    angle = np.linalg.norm(rvec, axis=1)
+    axis = rvec / np.maximum(angle, 1e-12)[:, None]
+    K = np.zeros((len(rvec), 3, 3))
+    K[:, 0, 1], K[:, 0, 2], K[:, 1, 2] = -axis[:, 2], axis[:, 1], -axis[:, 0]
+    K -= K.transpose(0, 2, 1)
+    s, c = np.sin(angle)[:, None, None], np.cos(angle)[:, None, None]
+    return np.eye(3) + s * K + (1 - c) * K @ K
+
+
+# 生成随机刚体布局 marker间距 spacing 以上
+def make_random_bodies(body_num, marker_num=4, size=0.2, spacing=0.04, seed=0):
+    rng = np.random.default_rng(seed)
+    bodies = []
+    while len(bodies) < body_num:
+        markers = rng.uniform(-size / 2, size / 2, (marker_num, 3))
+        distance = np.linalg.norm(markers[:, None] - markers[None], axis=2)[np.triu_indices(marker_num, 1)]
+        # 两两距离足够大且互不相同 避免对称布局
+        if distance.min() < spacing or np.diff(np.sort(distance)).min() < spacing / 4:
+            continue
+        bodies.append(RigidBody(f"body{len(bodies)}", markers - markers.mean(axis=0)))
+    return bodies
+
+
+# 模拟: 多个刚体平移旋转运动 点集随机打乱 带噪声、偶发遮挡和杂散点
+# 对比 跟踪(复用上一帧对应) 与 每帧全部重新搜索 的耗时与精度
+if __name__ == "__main__":
+    body_num = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    frame_num = 600
+    rng = np.random.default_rng(1)
+    bodies = make_random_bodies(body_num)
+    centers = rng.uniform(-1, 1, (body_num, 3))
+    spin = rng.normal(0, 1, (body_num, 3))
+    frames = []
+    for f in range(frame_num):
+        t = f / 100.0
+        R = rotation_from_vector(spin * t)
+        T = centers + 0.3 * np.stack([np.sin(t + centers[:, 0]), np.cos(t + centers[:, 1]), np.sin(2 * t + centers[:, 2])], axis=1)
+        points = np.einsum("bij,bkj->bki", R, np.stack([body.markers for body in bodies])) + T[:, None]
+        points = points + rng.normal(0, 0.001, points.shape)
+        visible = rng.random(points.shape[:2]) > 0.05  # 5%遮挡
+        clutter = rng.uniform(-1.5, 1.5, (rng.integers(0, 4), 3))
+        cloud = np.concatenate([points[visible], clutter])
+        frames.append((rng.permutation(cloud), R, T))
+
+    for name, tracking in (("tracking", True), ("search only", False)):
+        tracker = RigidBodyTracker(bodies, tolerance=0.01)
+        rotation_errors, translation_errors = [], []
+        for cloud, R, T in frames:
+            if not tracking:
+                tracker.reset()
+            for pose in tracker.update(cloud):
+                i = pose["body"]
+                cos = (np.trace(pose["R"].T @ R[i]) - 1) / 2
+                rotation_errors.append(np.degrees(np.arccos(np.clip(cos, -1, 1))))
+                translation_errors.append(np.linalg.norm(pose["t"] - T[i]) * 1000)
+        stats = tracker.get_stats()
+        print(f"{name:12s}: {stats['update_us']:7.0f} us/frame, identified {stats['found'] / (frame_num * body_num):.1%}, "
+              f"tracked {stats['tracked']}, searches {stats['searches']}, "
+              f"rotation err {np.median(rotation_errors):.2f} deg, translation err {np.median(translation_errors):.2f} mm")
@@ -0,0 +1,66 @@
+import time
+import importlib
+import threading
+
+# 启动计时模块
+# 记录各启动阶段耗时 以及重型模块的懒加载耗时
+START_TIME = time.perf_counter()
+_marks = []  # [(阶段名, 距启动时间(秒))]
+_import_times = {}  # 模块名 -> 导入耗时(秒)
+_import_lock = threading.Lock()
+
+
+# 记录启动阶段时间点
+def mark(stage):
+    _marks.append((stage, time.perf_counter() - START_TIME))
+
+
+# 获取某阶段距启动的时间(秒) 未记录返回None
+def elapsed(stage):
+    for name, t in _marks:
+        if name == stage:
+            return t
+    return None
+
+
+# 导入模块并记录耗时 已导入的模块直接返回
+def load_module(name):
+    with _import_lock:
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        if name not in _import_times:
+            _import_times[name] = time.perf_counter() - start
+    return module
+
+
+# 懒加载模块代理 首次访问属性时才真正导入
+# 用法: cv = LazyModule("cv2") 之后与 import cv2 as cv 相同
+class LazyModule:
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = load_module(self._name)
+        return getattr(self._module, attr)
+
+
+# 在后台线程中预加载模块 避免首次使用时卡顿GUI线程
+def warm_up(*names):
+    def _run():
+        for name in names:
+            load_module(name)
+    thread = threading.Thread(target=_run, daemon=True)
+    thread.start()
+    return thread
+
+
+# 生成启动耗时报告
+def report():
+    lines = ["Startup Report:"]
+    for name, t in _marks:
+        lines.append(f"  {name}: {t * 1000:.1f} ms")
+    for name, t in _import_times.items():
+        lines.append(f"  import {name}: {t * 1000:.1f} ms")
+    return "\n".join(lines)
@@ -0,0 +1,175 @@
+import threading
+import time
+import numpy as np
+
+
+# 定长滑动窗口 预分配环形数组 更新为O(1)
+# 均值/标准差由累加和维护 分位数在查询时计算
+class RollingWindow:
+    def __init__(self, size):
+        self.size = size
+        self.data = np.zeros(size, dtype=np.float64)
+        self.count = 0  # 累计写入数量
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def clear(self):
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def append(self, value):
+        index = self.count % self.size
+        if self.count >= self.size:
+            old = self.data[index]
+            self.total -= old
+            self.total_sq -= old * old
+        self.data[index] = value
+        self.total += value
+        self.total_sq += value * value
+        self.count += 1
+
+    def mean(self):
+        n = len(self)
+        return float(self.total / n) if n > 0 else 0.0
+
+    def std(self):
+        n = len(self)
+        if n < 2:
+            return 0.0
+        mean = self.total / n
+        return float(np.sqrt(max(self.total_sq / n - mean * mean, 0.0)))
+
+    def percentile(self, q):
+        n = len(self)
+        if n == 0:
+            return 0.0
+        return float(np.percentile(self.data[:n], q))
+
+
+# 按时间分桶的速率计数器 window秒内的速率 更新为O(1)
+class RateCounter:
+    def __init__(self, window=5.0, bucket_num=10):
+        self.bucket_time = window / bucket_num
+        self.buckets = np.zeros(bucket_num, dtype=np.float64)
+        self.current = None  # 当前桶编号
+        self.start_time = None
+
+    def clear(self):
+        self.buckets[:] = 0
+        self.current = None
+        self.start_time = None
+
+    # 前进到now所在的桶 清空跳过的桶
+    def advance(self, now):
+        index = int(now / self.bucket_time)
+        if self.current is None:
+            self.current = index
+            self.start_time = now
+        elif index != self.current:
+            skipped = min(index - self.current, len(self.buckets))
+            for i in range(1, skipped + 1):
+                self.buckets[(self.current + i) % len(self.buckets)] = 0
+            self.current = index
+
+    def add(self, now, amount=1.0):
+        self.advance(now)
+        self.buckets[self.current % len(self.buckets)] += amount
+
+    def rate(self, now):
+        if self.current is None:
+            return 0.0
+        self.advance(now)
+        window = (len(self.buckets) - 1) * self.bucket_time + (now - self.current * self.bucket_time)
+        window = min(window, now - self.start_time)
+        if window <= 0:
+            return 0.0
+        return float(self.buckets.sum()) / window
+
+
+# 单个相机数据流健康状态
+# 每个数据包/每帧调用一次 开销为常数 可在GUI或无界面端随时查询get_stats()
+class StreamHealth:
+    def __init__(self, window_size=256, rate_window=5.0):
+        self.lock = threading.Lock()
+        self.intervals = RollingWindow(window_size)  # 帧到达间隔(秒)
+        self.frame_rate = RateCounter(rate_window)
+        self.byte_rate = RateCounter(rate_window)
+        self.last_frame_time = None
+        self.frames = 0
+        self.packets = 0
+        self.bytes = 0
+        self.broken_count = 0  # JPEG头尾校验失败
+        self.oversize_count = 0  # 单包数据过大
+        self.timeout_count = 0  # 接收超时次数
+
+    def clear(self):
+        with self.lock:
+            self.intervals.clear()
+            self.frame_rate.clear()
+            self.byte_rate.clear()
+            self.last_frame_time = None
+            self.frames = 0
+            self.packets = 0
+            self.bytes = 0
+            self.broken_count = 0
+            self.oversize_count = 0
+            self.timeout_count = 0
+
+    # 收到一个UDP包
+    def on_packet(self, nbytes, now=None):
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            self.packets += 1
+            self.bytes += nbytes
+            self.byte_rate.add(now, nbytes)
+
+    # 收到一个完整有效帧
+    def on_frame(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            self.frames += 1
+            self.frame_rate.add(now)
+            if self.last_frame_time is not None:
+                self.intervals.append(now - self.last_frame_time)
+            self.last_frame_time = now
+
+    def on_broken(self):
+        with self.lock:
+            self.broken_count += 1
+
+    def on_oversize(self):
+        with self.lock:
+            self.oversize_count += 1
+
+    # 接收超时 超时后的第一帧不计入到达间隔
+    def on_timeout(self):
+        with self.lock:
+            self.timeout_count += 1
+            self.last_frame_time = None
+
+    # 获取健康统计 时间单位为毫秒
+    def get_stats(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            return {
+                "fps": self.frame_rate.rate(now),
+                "bytes_per_second": self.byte_rate.rate(now),
+                "interval_mean_ms": self.intervals.mean() * 1000,
+                "jitter_std_ms": self.intervals.std() * 1000,
+                "interval_p50_ms": self.intervals.percentile(50) * 1000,
+                "interval_p95_ms": self.intervals.percentile(95) * 1000,
+                "interval_p99_ms": self.intervals.percentile(99) * 1000,
+                "frames": self.frames,
+                "packets": self.packets,
+                "bytes": self.bytes,
+                "broken": self.broken_count,
+                "oversize": self.oversize_count,
+                "timeouts": self.timeout_count,
+            }
@@ -0,0 +1,119 @@
+import os
+import queue
+import threading
+import numpy as np
+
+# 相机原始数据流记录 用于离线重新处理
+# 每个相机一个目录:
+#   frames.bin 所有JPEG帧首尾相接
+#   index.bin  每帧一条定长记录 见INDEX_DTYPE
+# 索引在帧数据写入后追加 读取时以索引为准 进程中断时最后一帧不完整也不会读错
+# 写盘在后台线程 接收线程只把帧放入有界队列 磁盘慢时丢弃记录帧并计数 不阻塞recvfrom
+INDEX_DTYPE = np.dtype([
+    ("arrival", "<f8"),  # 接收时间 time.monotonic()
+    ("capture", "<i8"),  # 相机端采集时间戳(us) 旧协议为0
+    ("offset", "<i8"),  # 在frames.bin中的起始位置
+    ("length", "<i4"),  # JPEG字节数
+])
+FRAMES_FILE = "frames.bin"
+INDEX_FILE = "index.bin"
+
+
+# 记录单个相机的数据流 由接收线程调用append jpeg须为不再修改的bytes
+# queue_frames: 待写盘帧数上限 blocking: 队列满时等待而不是丢帧(离线生成记录时使用)
+class StreamRecorder:
+    def __init__(self, path, queue_frames=256, blocking=False):
+        self.path = path
+        self.blocking = blocking
+        os.makedirs(path, exist_ok=True)
+        self.lock = threading.Lock()
+        self.frames_file = open(os.path.join(path, FRAMES_FILE), "ab")
+        self.index_file = open(os.path.join(path, INDEX_FILE), "ab")
+        self.offset = self.frames_file.tell()
+        self.record = np.zeros(1, dtype=INDEX_DTYPE)
+        self.queue = queue.Queue(maxsize=queue_frames)
+        # 统计
+        self.frame_count = 0  # 已写盘帧数
+        self.dropped_count = 0  # 队列满而未记录的帧数
+        self.closed = False
+        self.thread = threading.Thread(target=self.write_loop, daemon=True)
+        self.thread.start()
+
+    def append(self, jpeg, arrival, capture_timestamp=None):
+        if self.closed:
+            return
+        item = (jpeg, arrival, capture_timestamp or 0)
+        if self.blocking:
+            self.queue.put(item)
+            return
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped_count += 1
+
+    # 写完队列中的帧后关闭文件
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+        self.frames_file.close()
+        self.index_file.close()
+
+    # 写盘线程 队列取空时刷新文件缓冲
+    def write_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            jpeg, arrival, capture_timestamp = item
+            self.frames_file.write(jpeg)
+            self.record[0] = (arrival, capture_timestamp, self.offset, len(jpeg))
+            self.index_file.write(self.record.tobytes())
+            self.offset += len(jpeg)
+            self.frame_count += 1
+            if self.queue.empty():
+                self.frames_file.flush()
+                self.index_file.flush()
+
+
+# 读取单个相机的记录 索引与帧数据均为memmap
+class StreamRecording:
+    def __init__(self, path):
+        self.path = path
+        index_path = os.path.join(path, INDEX_FILE)
+        frames_path = os.path.join(path, FRAMES_FILE)
+        count = os.path.getsize(index_path) // INDEX_DTYPE.itemsize
+        data_size = os.path.getsize(frames_path)
+        if count == 0 or data_size == 0:
+            self.index = np.zeros(0, dtype=INDEX_DTYPE)
+            self.data = np.zeros(0, dtype=np.uint8)
+            return
+        index = np.memmap(index_path, dtype=INDEX_DTYPE, mode="r", shape=(count,))
+        # 丢弃帧数据未写完整的索引
+        complete = np.searchsorted(index["offset"] + index["length"], data_size, side="right")
+        self.index = index[:complete]
+        self.data = np.memmap(frames_path, dtype=np.uint8, mode="r")
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def arrival(self):
+        return self.index["arrival"]
+
+    @property
+    def capture(self):
+        return self.index["capture"]
+
+    # 第i帧JPEG数据(memmap视图 不拷贝)
+    def frame(self, i):
+        offset = int(self.index["offset"][i])
+        return self.data[offset:offset + int(self.index["length"][i])]
+
+    # 接收时间在[start, stop)内的帧序号范围
+    def time_range(self, start, stop):
+        arrival = self.index["arrival"]
+        return int(np.searchsorted(arrival, start)), int(np.searchsorted(arrival, stop))
@@ -0,0 +1,238 @@
+import numpy as np
+from collections import deque
+
+# 相机时间同步
+# ESP32CAM之间没有硬件同步 各相机按各自的帧周期与相位采集
+# 1. FramePhaseEstimator: 由到达时间流估计每个相机的帧周期与相位 用线性模型 t = a + b*k 平滑网络抖动
+#    若相机提供采集时间戳(分包帧协议) 先用最小延迟滤波估计相机时钟与主机时钟的偏差
+# 2. TrackInterpolator: 将每个相机的2D质心轨迹按估计的采集时间插值到统一的查询时刻
+# 3. TimeSync: 管理多个相机 按任意输出频率在同一时刻取出各相机的插值点 用于三角化
+
+
+# 单个相机的帧周期/相位/时钟偏差估计 时间单位为秒(主机time.monotonic())
+class FramePhaseEstimator:
+    def __init__(self, window=64):
+        self.times = deque(maxlen=window)  # 观测时间(主机时钟)
+        self.indices = deque(maxlen=window)  # 推算的帧序号
+        self.offsets = deque(maxlen=window)  # 到达时间 - 相机采集时间
+        self.frame_index = -1
+        self.last_time = None
+        self.period = None  # 帧周期估计
+        self.intercept = None  # t = intercept + period * k
+        self.residual = 0.0  # 拟合残差标准差 即剩余的时间不确定度
+
+    def clear(self):
+        self.times.clear()
+        self.indices.clear()
+        self.offsets.clear()
+        self.frame_index = -1
+        self.last_time = None
+        self.period = None
+        self.intercept = None
+        self.residual = 0.0
+
+    # 相机时钟到主机时钟的偏差 取窗口内最小延迟 没有采集时间戳时为None
+    def clock_offset(self):
+        return min(self.offsets) if self.offsets else None
+
+    # 输入一帧 arrival: 主机到达时间 capture_timestamp: 相机端采集时间戳(us) 可为None
+    # 返回该帧的估计采集时间(主机时钟)
+    def add(self, arrival, capture_timestamp=None):
+        observed = arrival
+        if capture_timestamp:
+            capture = capture_timestamp / 1e6
+            self.offsets.append(arrival - capture)
+            observed = capture + self.clock_offset()
+        # 按估计周期推算帧序号 中间丢帧时序号跳跃
+        if self.last_time is None:
+            self.frame_index = 0
+        elif self.period:
+            self.frame_index += max(1, int(round((observed - self.last_time) / self.period)))
+        else:
+            self.frame_index += 1
+        self.last_time = observed
+        self.times.append(observed)
+        self.indices.append(self.frame_index)
+        self.fit()
+        return self.frame_time(self.frame_index) if self.period else observed
+
+    # 最小二乘拟合 t = intercept + period * k
+    def fit(self):
+        if len(self.times) < 3:
+            return
+        k = np.array(self.indices, dtype=np.float64)
+        t = np.array(self.times)
+        k_mean = k.mean()
+        t_mean = t.mean()
+        var = np.sum((k - k_mean) ** 2)
+        if var == 0:
+            return
+        self.period = float(np.sum((k - k_mean) * (t - t_mean)) / var)
+        self.intercept = float(t_mean - self.period * k_mean)
+        self.residual = float(np.std(t - (self.intercept + self.period * k)))
+
+    def frame_time(self, frame_index):
+        return self.intercept + self.period * frame_index
+
+    # 帧相位: 采集时刻在周期内的位置(秒) 相位差即两相机之间的采集偏移
+    def phase(self):
+        if self.period is None:
+            return None
+        return self.intercept % self.period
+
+
+# 单个相机的2D轨迹插值
+class TrackInterpolator:
+    def __init__(self, capacity=64):
+        self.samples = deque(maxlen=capacity)  # (时间, x, y) 时间递增
+
+    def clear(self):
+        self.samples.clear()
+
+    def add(self, stamp, point):
+        if self.samples and stamp <= self.samples[-1][0]:
+            return
+        self.samples.append((stamp, point[0], point[1]))
+
+    # 线性插值到query时刻 max_gap: 允许插值的最大相邻样本间隔 max_extrapolation: 允许外推的最长时间
+    # 返回((x, y), 距最近样本的时间) 无法插值返回(None, None)
+    def interpolate(self, query, max_gap, max_extrapolation=0.0):
+        if len(self.samples) == 0:
+            return None, None
+        # 查询时刻一般靠近最新样本 从后向前查找
+        later = None
+        for sample in reversed(self.samples):
+            if sample[0] <= query:
+                if later is None:
+                    if query - sample[0] > max_extrapolation or len(self.samples) < 2:
+                        return None, None
+                    # 用最新两个样本外推
+                    t0, x0, y0 = self.samples[-2]
+                    t1, x1, y1 = sample
+                elif later[0] - sample[0] > max_gap:
+                    return None, None
+                else:
+                    t0, x0, y0 = sample
+                    t1, x1, y1 = later
+                ratio = (query - t0) / (t1 - t0)
+                nearest = min(abs(query - t0), abs(t1 - query))
+                return (x0 + (x1 - x0) * ratio, y0 + (y1 - y0) * ratio), nearest
+            later = sample
+        return None, None
+
+
+# 多相机时间同步
+class TimeSync:
+    def __init__(self, cam_num):
+        self.estimators = [FramePhaseEstimator() for _ in range(cam_num)]
+        self.tracks = [TrackInterpolator() for _ in range(cam_num)]
+        self.last_skew = None  # 最近一次查询的剩余时间偏差(秒)
+        self.last_gap = None  # 最近一次查询距最近真实样本的最大时间(秒)
+
+    def clear(self):
+        for estimator, track in zip(self.estimators, self.tracks):
+            estimator.clear()
+            track.clear()
+        self.last_skew = None
+        self.last_gap = None
+
+    # 记录一帧的到达 point为该帧唯一有效点 无有效点时为None(仍用于周期估计)
+    def add_observation(self, cam_index, arrival, point, capture_timestamp=None):
+        stamp = self.estimators[cam_index].add(arrival, capture_timestamp)
+        if point is not None:
+            self.tracks[cam_index].add(stamp, point)
+
+    # 建议的查询延迟: 保证各相机在查询时刻之后已有样本 可以内插而不是外推
+    def query_delay(self):
+        periods = [estimator.period for estimator in self.estimators if estimator.period]
+        if not periods:
+            return 0.1
+        return max(periods) * 1.5
+
+    # 取出各相机在query时刻的插值点 任一相机无法插值时返回None
+    def sample(self, query):
+        points = []
+        skew = 0.0
+        gap = 0.0
+        for estimator, track in zip(self.estimators, self.tracks):
+            if not estimator.period:
+                return None
+            point, nearest = track.interpolate(query, estimator.period * 2.5)
+            if point is None:
+                return None
+            points.append(point)
+            # 剩余偏差: 各相机采集时间估计的不确定度 插值消除了相位差 剩下的是时间戳本身的误差
+            skew = max(skew, estimator.residual)
+            gap = max(gap, nearest)
+        self.last_skew = skew
+        self.last_gap = gap
+        return points
+
+    # 获取同步统计 时间单位为毫秒
+    def get_stats(self):
+        stats = []
+        for estimator in self.estimators:
+            offset = estimator.clock_offset()
+            stats.append({
+                "fps": 1.0 / estimator.period if estimator.period else 0.0,
+                "period_ms": estimator.period * 1000 if estimator.period else None,
+                "phase_ms": estimator.phase() * 1000 if estimator.period else None,
+                "clock_offset_s": offset,
+                "residual_ms": estimator.residual * 1000,
+            })
+        return {
+            "cameras": stats,
+            "residual_skew_ms": self.last_skew * 1000 if self.last_skew is not None else None,
+            "interpolation_gap_ms": self.last_gap * 1000 if self.last_gap is not None else None,
+        }
+
+
+# main test: 两个不同帧率/相位的相机观测同一匀速圆周运动的点 到达时间带网络抖动
+# 对比 直接取各相机最新帧 与 插值到统一时刻 的2D位置误差
+# 用法: python time_sync.py [抖动ms]
+if __name__ == "__main__":
+    import sys
+
+    jitter = (float(sys.argv[1]) if len(sys.argv) > 1 else 3.0) / 1000
+    rng = np.random.default_rng(0)
+
+    def position(t):
+        return 320 + 200 * np.cos(2 * np.pi * t), 240 + 200 * np.sin(2 * np.pi * t)
+
+    # (帧周期, 相位, 相机时钟偏差)
+    cameras = [(1 / 30.0, 0.000, 100.0), (1 / 29.7, 0.013, -50.0)]
+    for use_capture in (False, True):
+        sync = TimeSync(len(cameras))
+        events = []
+        for index, (period, phase, clock) in enumerate(cameras):
+            for k in range(600):
+                capture = phase + k * period
+                if rng.random() < 0.05:  # 丢帧
+                    continue
+                arrival = capture + 0.005 + rng.exponential(jitter)
+                events.append((arrival, index, capture, int((capture + clock) * 1e6)))
+        events.sort()
+        latest = [None] * len(cameras)
+        naive_errors = []
+        sync_errors = []
+        for arrival, index, capture, capture_us in events:
+            sync.add_observation(index, arrival, position(capture), capture_us if use_capture else None)
+            latest[index] = position(capture)
+            if arrival < 2.0 or index != 0 or None in latest:
+                continue
+            # 朴素方法: 相机1新帧到达时直接与相机2最新帧配对 真值取相机1采集时刻
+            truth = position(capture)
+            naive_errors.append(np.hypot(latest[1][0] - truth[0], latest[1][1] - truth[1]))
+            query = arrival - sync.query_delay()
+            points = sync.sample(query)
+            if points is not None:
+                truth = position(query - 0.005)  # 估计的时间基准含各相机共同的固定网络延迟 不影响相机间同步
+                sync_errors.append(max(np.hypot(p[0] - truth[0], p[1] - truth[1]) for p in points))
+        stats = sync.get_stats()
+        print(f"capture timestamps: {use_capture}  jitter: {jitter * 1000:.1f} ms")
+        for index, cam in enumerate(stats["cameras"]):
+            print(f"  cam{index + 1}: fps {cam['fps']:.3f} phase {cam['phase_ms']:.2f} ms "
+                  f"residual {cam['residual_ms']:.2f} ms")
+        print(f"  latest-frame pairing error: mean {np.mean(naive_errors):.2f} px, p95 {np.percentile(naive_errors, 95):.2f} px")
+        print(f"  interpolated error:         mean {np.mean(sync_errors):.2f} px, p95 {np.percentile(sync_errors, 95):.2f} px")
+        print(f"  residual skew {stats['residual_skew_ms']:.2f} ms, samples {len(sync_errors)}/{len(naive_errors)}")
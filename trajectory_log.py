@@ -0,0 +1,275 @@
+import os
+import sys
+import json
+import time
+import queue
+import threading
+import numpy as np
+
+# 三角化轨迹流式记录
+# 记录目录结构:
+#   schema.json            列名/数据类型/时间基准
+#   segment_0000/<列名>.bin 每列一个定长小端二进制文件 按批追加
+#   segment_0001/...       单段超过segment_rows行后换下一段
+# 每行记录: 时间戳(time.monotonic()) 标记点ID 三维坐标 重投影误差(像素) 参与三角化的相机(位掩码)
+# 写入端在调用线程只做数组拷贝 满一批后交给后台线程写盘 内存占用有上限
+# 没有新点到达(目标丢失/空闲)时 写盘线程按flush_interval超时检查 把未满的一批写盘
+# 行数由各列文件长度取最小值得到 进程中断时最多丢失未写盘的一批 不会产生错位
+COLUMNS = [
+    ("timestamp", "<f8"),
+    ("marker_id", "<i4"),
+    ("x", "<f4"),
+    ("y", "<f4"),
+    ("z", "<f4"),
+    ("error", "<f4"),
+    ("cameras", "<u4"),
+]
+SCHEMA_FILE = "schema.json"
+SEGMENT_FORMAT = "segment_{:04d}"
+
+
+# 流式写入 batch_rows: 每批行数 flush_interval: 未满一批时最长缓存时间(秒)
+# queue_batches: 待写盘批次上限 写盘跟不上时丢弃新批次并计数 不阻塞调用线程
+class TrajectoryWriter:
+    def __init__(self, path, batch_rows=1024, flush_interval=1.0, segment_rows=1 << 22, queue_batches=64):
+        self.path = path
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.segment_rows = segment_rows
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, SCHEMA_FILE), "w") as f:
+            json.dump({
+                "columns": COLUMNS,
+                "segment_rows": segment_rows,
+                "monotonic_to_epoch": time.time() - time.monotonic(),  # 时间戳加此值为Unix时间
+            }, f, indent=2)
+        self.lock = threading.Lock()
+        self.buffer = self.new_buffer()
+        self.buffer_rows = 0
+        self.buffer_time = time.monotonic()
+        self.queue = queue.Queue(maxsize=queue_batches)
+        # 写盘线程状态
+        self.segment_index = 0
+        self.segment_written = 0
+        self.files = None
+        # 统计
+        self.appended_rows = 0
+        self.written_rows = 0
+        self.dropped_rows = 0
+        self.closed = False
+        self.thread = threading.Thread(target=self.write_loop, daemon=True)
+        self.thread.start()
+
+    def new_buffer(self):
+        return {name: np.empty(self.batch_rows, dtype=dtype) for name, dtype in COLUMNS}
+
+    # 追加单个点 xyz: (x, y, z) cameras: 相机位掩码 第i位表示相机i+1参与
+    def append(self, timestamp, marker_id, xyz, error=np.nan, cameras=0):
+        with self.lock:
+            i = self.buffer_rows
+            if i == 0:
+                self.buffer_time = time.monotonic()
+            buffer = self.buffer
+            buffer["timestamp"][i] = timestamp
+            buffer["marker_id"][i] = marker_id
+            buffer["x"][i] = xyz[0]
+            buffer["y"][i] = xyz[1]
+            buffer["z"][i] = xyz[2]
+            buffer["error"][i] = error
+            buffer["cameras"][i] = cameras
+            self.buffer_rows += 1
+            self.appended_rows += 1
+            if self.buffer_rows == self.batch_rows or time.monotonic() - self.buffer_time > self.flush_interval:
+                self.submit_buffer()
+
+    # 批量追加 各参数为等长数组 xyz: (N, 3) error/cameras可为标量
+    def append_batch(self, timestamps, marker_ids, xyz, errors=np.nan, cameras=0):
+        xyz = np.asarray(xyz).reshape(-1, 3)
+        num = len(xyz)
+        columns = {
+            "timestamp": np.broadcast_to(timestamps, num),
+            "marker_id": np.broadcast_to(marker_ids, num),
+            "x": xyz[:, 0],
+            "y": xyz[:, 1],
+            "z": xyz[:, 2],
+            "error": np.broadcast_to(errors, num),
+            "cameras": np.broadcast_to(cameras, num),
+        }
+        with self.lock:
+            if self.buffer_rows == 0:
+                self.buffer_time = time.monotonic()
+            start = 0
+            while start < num:
+                count = min(num - start, self.batch_rows - self.buffer_rows)
+                for name, _dtype in COLUMNS:
+                    self.buffer[name][self.buffer_rows:self.buffer_rows + count] = columns[name][start:start + count]
+                self.buffer_rows += count
+                self.appended_rows += count
+                start += count
+                if self.buffer_rows == self.batch_rows:
+                    self.submit_buffer()
+
+    # 将当前缓存交给写盘线程 需持有self.lock
+    def submit_buffer(self):
+        if self.buffer_rows == 0:
+            return
+        try:
+            self.queue.put_nowait((self.buffer, self.buffer_rows))
+        except queue.Full:
+            self.dropped_rows += self.buffer_rows
+        self.buffer = self.new_buffer()
+        self.buffer_rows = 0
+        self.buffer_time = time.monotonic()
+
+    # 提交未满的缓存 并等待全部写盘
+    def flush(self):
+        with self.lock:
+            self.submit_buffer()
+        self.queue.join()
+
+    def close(self):
+        if self.closed:
+            return
+        self.flush()
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+
+    def open_segment(self):
+        folder = os.path.join(self.path, SEGMENT_FORMAT.format(self.segment_index))
+        os.makedirs(folder, exist_ok=True)
+        self.files = {name: open(os.path.join(folder, name + ".bin"), "ab") for name, _dtype in COLUMNS}
+        self.segment_written = 0
+
+    def close_segment(self):
+        for f in self.files.values():
+            f.close()
+        self.files = None
+
+    # 写盘线程 等待超时时提交缓存时间超过flush_interval的未满批次
+    def write_loop(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                with self.lock:
+                    if self.buffer_rows and time.monotonic() - self.buffer_time >= self.flush_interval:
+                        self.submit_buffer()
+                continue
+            if item is None:
+                self.queue.task_done()
+                break
+            buffer, rows = item
+            start = 0
+            while start < rows:
+                if self.files is None:
+                    self.open_segment()
+                count = min(rows - start, self.segment_rows - self.segment_written)
+                for name, _dtype in COLUMNS:
+                    self.files[name].write(buffer[name][start:start + count].tobytes())
+                for f in self.files.values():
+                    f.flush()
+                self.segment_written += count
+                self.written_rows += count
+                start += count
+                if self.segment_written == self.segment_rows:
+                    self.close_segment()
+                    self.segment_index += 1
+                    self.segment_written = 0
+            self.queue.task_done()
+        if self.files is not None:
+            self.close_segment()
+
+    def get_stats(self):
+        return {
+            "appended": self.appended_rows,
+            "written": self.written_rows,
+            "dropped": self.dropped_rows,
+            "pending_batches": self.queue.qsize(),
+            "segments": self.segment_index + (self.segment_written > 0),
+        }
+
+
+# 读取记录 各列以np.memmap方式映射 不解析文本 不整体读入内存
+class TrajectoryReader:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, SCHEMA_FILE)) as f:
+            self.schema = json.load(f)
+        self.columns = [(name, np.dtype(dtype)) for name, dtype in self.schema["columns"]]
+        self.segments = []  # 每段为 {列名: memmap}
+        index = 0
+        while True:
+            folder = os.path.join(path, SEGMENT_FORMAT.format(index))
+            if not os.path.isdir(folder):
+                break
+            files = {name: os.path.join(folder, name + ".bin") for name, _dtype in self.columns}
+            rows = min(os.path.getsize(files[name]) // dtype.itemsize for name, dtype in self.columns)
+            if rows > 0:
+                self.segments.append({name: np.memmap(files[name], dtype=dtype, mode="r", shape=(rows,))
+                                      for name, dtype in self.columns})
+            index += 1
+
+    def __len__(self):
+        return sum(len(segment["timestamp"]) for segment in self.segments)
+
+    # 单列数据 只有一段时直接返回memmap 多段时拼接
+    def column(self, name):
+        if len(self.segments) == 1:
+            return self.segments[0][name]
+        if not self.segments:
+            return np.empty(0, dtype=dict(self.columns)[name])
+        return np.concatenate([segment[name] for segment in self.segments])
+
+    # 三维坐标 (N, 3)
+    def points(self):
+        return np.stack([self.column("x"), self.column("y"), self.column("z")], axis=1)
+
+    # Unix时间戳
+    def epoch_timestamps(self):
+        return self.column("timestamp") + self.schema["monotonic_to_epoch"]
+
+    # 单个标记点的全部记录
+    def marker(self, marker_id):
+        mask = self.column("marker_id") == marker_id
+        return {name: self.column(name)[mask] for name, _dtype in self.columns}
+
+
+# main test: 模拟100Hz x 多个标记点记录 测试写入开销/吞吐与读取
+# 用法: python trajectory_log.py [目录] [小时数]
+if __name__ == "__main__":
+    import shutil
+    import tempfile
+
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(tempfile.gettempdir(), "trajectory_test")
+    hours = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    shutil.rmtree(path, ignore_errors=True)
+    marker_num = 4
+    rows = int(hours * 3600 * 100)
+    rng = np.random.default_rng(0)
+
+    writer = TrajectoryWriter(path)
+    start = time.perf_counter()
+    t0 = time.monotonic()
+    for i in range(min(rows, 100000)):  # 逐点追加的调用开销
+        writer.append(t0 + i / 100, i % marker_num, (0.1, 0.2, 0.3), 0.5, 0b11)
+    single = (time.perf_counter() - start) / min(rows, 100000) * 1e6
+    start = time.perf_counter()
+    done = min(rows, 100000)
+    while done < rows:  # 其余按每帧一批追加
+        count = min(marker_num * 100, rows - done)
+        stamps = t0 + (done + np.arange(count)) / 100
+        writer.append_batch(stamps, np.arange(count) % marker_num, rng.normal(size=(count, 3)), 0.5, 0b11)
+        done += count
+    batch_cost = time.perf_counter() - start
+    writer.close()
+    print(f"{rows} rows ({hours} h @ 100 Hz)")
+    print(f"append: {single:.2f} us/row, batch append total {batch_cost:.2f} s, stats {writer.get_stats()}")
+
+    start = time.perf_counter()
+    reader = TrajectoryReader(path)
+    xyz = reader.points()
+    print(f"open + load xyz: {(time.perf_counter() - start) * 1000:.1f} ms, rows {len(reader)}, "
+          f"segments {len(reader.segments)}, marker 1 rows {len(reader.marker(1)['x'])}")
+    size = sum(os.path.getsize(os.path.join(root, name)) for root, _dirs, names in os.walk(path) for name in names)
+    print(f"disk: {size / 2 ** 20:.1f} MB ({size / max(len(reader), 1):.1f} bytes/row)")
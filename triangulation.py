@@ -0,0 +1,203 @@
+import sys
+import time
+import numpy as np
+
+# 向量化双目三角化
+# 输入为归一化相机坐标(Z=1平面) x1, x2: (N, 2)
+# 相机投影矩阵 P = [R|t] (3x4) 世界点X满足 x ~ R X + t
+# 所有函数一次处理N对点 不含Python循环
+
+
+def to_homogeneous(x):
+    return np.concatenate([x, np.ones((len(x), 1))], axis=1)
+
+
+# 线性DLT三角化 每对点构造4x4方程组 A [X, 1]^T = 0
+# 令齐次坐标w=1后按最小二乘求解 3x3法方程用伴随矩阵(叉积)显式求逆 避免逐点调用LAPACK
+def triangulate_dlt(P1, P2, x1, x2):
+    A = np.empty((len(x1), 4, 4))
+    A[:, 0] = x1[:, 0:1] * P1[2] - P1[0]
+    A[:, 1] = x1[:, 1:2] * P1[2] - P1[1]
+    A[:, 2] = x2[:, 0:1] * P2[2] - P2[0]
+    A[:, 3] = x2[:, 1:2] * P2[2] - P2[1]
+    M = np.einsum("nki,nkj->nij", A[:, :, :3], A[:, :, :3])
+    b = -np.einsum("nki,nk->ni", A[:, :, :3], A[:, :, 3])
+    # M对称 逆矩阵各行为另两行的叉积除以行列式
+    adj = np.stack([np.cross(M[:, 1], M[:, 2]), np.cross(M[:, 2], M[:, 0]), np.cross(M[:, 0], M[:, 1])], axis=1)
+    det = np.einsum("ni,ni->n", M[:, 0], adj[:, 0])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.einsum("nij,nj->ni", adj, b) / det[:, None]
+
+
+# 中点法三角化 两条视线最近点连线的中点
+def triangulate_midpoint(P1, P2, x1, x2):
+    R1, t1 = P1[:, :3], P1[:, 3]
+    R2, t2 = P2[:, :3], P2[:, 3]
+    c1 = -R1.T @ t1  # 相机光心(世界坐标)
+    c2 = -R2.T @ t2
+    d1 = to_homogeneous(x1) @ R1  # 视线方向 R^T x
+    d2 = to_homogeneous(x2) @ R2
+    w0 = c1 - c2
+    a = np.einsum("ij,ij->i", d1, d1)
+    b = np.einsum("ij,ij->i", d1, d2)
+    c = np.einsum("ij,ij->i", d2, d2)
+    d = d1 @ w0
+    e = d2 @ w0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denom = a * c - b * b  # 视线平行时为0 结果为nan
+        s = (b * e - c * d) / denom
+        t = (a * e - b * d) / denom
+    return (c1 + s[:, None] * d1 + c2 + t[:, None] * d2) / 2
+
+
+# 两相机之间的本质矩阵 x2^T E x1 = 0
+def essential_from_projections(P1, P2):
+    R1, t1 = P1[:, :3], P1[:, 3]
+    R2, t2 = P2[:, :3], P2[:, 3]
+    R = R2 @ R1.T
+    t = t2 - R @ t1
+    tx = np.array([[0, -t[2], t[1]],
+                   [t[2], 0, -t[0]],
+                   [-t[1], t[0], 0]])
+    return tx @ R
+
+
+# Sampson一阶修正 将观测点移动到满足对极约束的位置(最优三角化的一阶近似)
+def sampson_correct(E, x1, x2):
+    x1h = to_homogeneous(x1)
+    x2h = to_homogeneous(x2)
+    Ex1 = x1h @ E.T
+    Etx2 = x2h @ E
+    err = np.einsum("ij,ij->i", x2h, Ex1)
+    denom = Ex1[:, 0] ** 2 + Ex1[:, 1] ** 2 + Etx2[:, 0] ** 2 + Etx2[:, 1] ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scale = np.where(denom > 0, err / denom, 0.0)[:, None]
+    return x1 - scale * Etx2[:, :2], x2 - scale * Ex1[:, :2]
+
+
+# 两相机所有点对的Sampson对极距离(归一化坐标单位) 返回(N1, N2)
+def epipolar_distances(E, x1, x2):
+    Ex1 = to_homogeneous(x1) @ E.T
+    Etx2 = to_homogeneous(x2) @ E
+    err = Ex1 @ to_homogeneous(x2).T
+    denom = (Ex1[:, 0] ** 2 + Ex1[:, 1] ** 2)[:, None] + (Etx2[:, 0] ** 2 + Etx2[:, 1] ** 2)[None, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.abs(err) / np.sqrt(denom)
+
+
+# 逐对Sampson对极距离(归一化坐标单位) x1[i]与x2[i]对应 返回(N,)
+def sampson_distance(E, x1, x2):
+    Ex1 = to_homogeneous(x1) @ E.T
+    Etx2 = to_homogeneous(x2) @ E
+    err = np.einsum("ij,ij->i", to_homogeneous(x2), Ex1)
+    denom = Ex1[:, 0] ** 2 + Ex1[:, 1] ** 2 + Etx2[:, 0] ** 2 + Etx2[:, 1] ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.abs(err) / np.sqrt(denom)
+
+
+# 多点对应: 按对极距离从小到大贪心匹配 每个点最多使用一次 返回(idx1, idx2)
+# 多个点落在同一条对极线附近时可能误配 由上层(如刚体识别)的几何约束剔除
+def match_epipolar(E, x1, x2, threshold):
+    distances = epipolar_distances(E, x1, x2)
+    rows, cols = np.nonzero(distances < threshold)
+    order = np.argsort(distances[rows, cols], kind="stable")
+    used1 = np.zeros(len(x1), dtype=bool)
+    used2 = np.zeros(len(x2), dtype=bool)
+    idx1, idx2 = [], []
+    for i, j in zip(rows[order], cols[order]):
+        if not used1[i] and not used2[j]:
+            used1[i] = used2[j] = True
+            idx1.append(i)
+            idx2.append(j)
+    return np.array(idx1, dtype=np.int64), np.array(idx2, dtype=np.int64)
+
+
+# Sampson修正后的DLT三角化 iterations为修正次数
+def triangulate_optimal(P1, P2, x1, x2, iterations=2):
+    E = essential_from_projections(P1, P2)
+    c1, c2 = x1, x2
+    for _ in range(iterations):
+        c1, c2 = sampson_correct(E, c1, c2)
+    return triangulate_dlt(P1, P2, c1, c2)
+
+
+# 三维点在相机坐标系下的深度
+def depths(P, X):
+    return X @ P[2, :3] + P[2, 3]
+
+
+# 重投影误差(归一化坐标单位) 返回(N,)
+def reprojection_error(P, X, x):
+    proj = X @ P[:, :3].T + P[:, 3]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.linalg.norm(proj[:, :2] / proj[:, 2:3] - x, axis=1)
+
+
+METHODS = {
+    "dlt": triangulate_dlt,
+    "midpoint": triangulate_midpoint,
+    "optimal": triangulate_optimal,
+}
+
+
+# 三角化入口
+# 返回(X (N,3), errors (N,2) 两个相机的重投影误差(归一化坐标), valid (N,) 点在两相机前方且深度合理)
+def triangulate(P1, P2, x1, x2, method="dlt", min_depth=0.0, max_depth=np.inf):
+    P1 = np.asarray(P1, dtype=np.float64)
+    P2 = np.asarray(P2, dtype=np.float64)
+    x1 = np.asarray(x1, dtype=np.float64).reshape(-1, 2)
+    x2 = np.asarray(x2, dtype=np.float64).reshape(-1, 2)
+    X = METHODS[method](P1, P2, x1, x2)
+    errors = np.stack([reprojection_error(P1, X, x1), reprojection_error(P2, X, x2)], axis=1)
+    depth1 = depths(P1, X)
+    depth2 = depths(P2, X)
+    valid = (np.isfinite(X).all(axis=1) & (depth1 > min_depth) & (depth2 > min_depth)
+             & (depth1 < max_depth) & (depth2 < max_depth))
+    return X, errors, valid
+
+
+# main test: 与OpenCV triangulatePoints对比精度与耗时
+# 用法: python triangulation.py [点数]
+if __name__ == "__main__":
+    import cv2 as cv
+
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rng = np.random.default_rng(0)
+    angle = 0.3
+    R2 = np.array([[np.cos(angle), 0, np.sin(angle)], [0, 1, 0], [-np.sin(angle), 0, np.cos(angle)]])
+    P1 = np.hstack([np.eye(3), np.zeros((3, 1))])
+    P2 = np.hstack([R2, np.array([[-1.0], [0.0], [0.1]])])
+    X_true = rng.uniform([-1, -1, 2], [1, 1, 5], (num, 3))
+    noise = 0.5 / 204.5  # 约0.5像素噪声
+    x1 = (X_true @ P1[:, :3].T + P1[:, 3])
+    x1 = x1[:, :2] / x1[:, 2:3] + rng.normal(0, noise, (num, 2))
+    x2 = (X_true @ P2[:, :3].T + P2[:, 3])
+    x2 = x2[:, :2] / x2[:, 2:3] + rng.normal(0, noise, (num, 2))
+
+    def report(name, func, repeat=5):
+        X = func()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        cost = (time.perf_counter() - start) / repeat * 1000
+        err = np.linalg.norm(X - X_true, axis=1)
+        print(f"{name:22s} {cost:8.2f} ms  mean 3D error: {np.nanmean(err):.5f}")
+
+    def cv_batch():
+        h = cv.triangulatePoints(P1, P2, x1.T, x2.T)
+        return (h[:3] / h[3]).T
+
+    def cv_loop():
+        X = np.empty((num, 3))
+        for i in range(num):
+            h = cv.triangulatePoints(P1, P2, x1[i].reshape(2, 1), x2[i].reshape(2, 1))
+            X[i] = h[:3, 0] / h[3, 0]
+        return X
+
+    print(f"{num} points")
+    report("opencv per point", cv_loop, 1)
+    report("opencv batch", cv_batch)
+    for method in METHODS:
+        report(f"numpy {method}", lambda: triangulate(P1, P2, x1, x2, method)[0])
+    X, errors, valid = triangulate(P1, P2, x1, x2, "optimal")
+    print(f"optimal: mean reprojection error {errors.mean() * 204.5:.3f} px, valid {valid.sum()}/{num}")
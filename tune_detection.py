@@ -0,0 +1,208 @@
+import os
+import time
+import argparse
+import itertools
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from startup import LazyModule
+from stream_record import StreamRecording
+from dot_detect import DEFAULT_DETECT_PARAMS, blur_grey, decode_grey
+from camera_config import save_detect_params, CONFIG_FILE
+
+cv = LazyModule("cv2")
+
+# 检测参数自动调优
+# 在记录的帧上扫描 阈值/模糊/面积范围/圆度 组合 按 单点检测率 与 质心稳定性 评分
+# 最优参数写入camera_config.json 由UDP_RX(下次Start Listening时)/边缘节点(启动时)读取
+# 解码与运行时检测共用dot_detect.decode_grey 阈值含义一致
+# 加速: 每帧只解码一次; 轮廓只依赖(模糊, 阈值) 面积与圆度条件在轮廓属性数组上向量化筛选
+# 记录按连续帧的块切分 块在进程池中并行处理 稳定性在块内相邻帧之间计算
+DEFAULT_GRID = {
+    "threshold": [150.0, 180.0, 200.0, DEFAULT_DETECT_PARAMS["threshold"]],
+    "blur": [0, 3, 5],
+    "min_area": [0.0, 3.0, 8.0],
+    "max_area": [0.0, 200.0, 800.0],
+    "min_circularity": [0.0, 0.5, 0.7],
+}
+
+
+# 参数组合列表 每项为完整的检测参数字典
+def make_combos(grid):
+    keys = list(DEFAULT_DETECT_PARAMS)
+    values = [grid.get(key, [DEFAULT_DETECT_PARAMS[key]]) for key in keys]
+    return [dict(zip(keys, combo)) for combo in itertools.product(*values)]
+
+
+# 轮廓属性 返回(面积, 圆度, 质心x, 质心y) 四个数组 面积为0的轮廓已去除
+def contour_features(binary):
+    contours, _ = cv.findContours(binary, cv.RETR_TREE, cv.CHAIN_APPROX_SIMPLE)
+    features = []
+    for contour in contours:
+        moments = cv.moments(contour)
+        area = moments["m00"]
+        if area == 0:
+            continue
+        perimeter = cv.arcLength(contour, True)
+        circularity = 4 * np.pi * area / (perimeter * perimeter) if perimeter > 0 else 0.0
+        features.append((area, circularity, moments["m10"] / area, moments["m01"] / area))
+    return np.array(features, dtype=np.float64).reshape(-1, 4).T
+
+
+# 进程池任务: 一块连续帧在所有参数组合下的检测结果
+# 返回 num (组合数, 帧数) 检测到的点数 解码失败为-1; xy (组合数, 帧数, 2) 单点时的质心 否则nan
+def evaluate_block(task):
+    recording = StreamRecording(task["path"])
+    combos = task["combos"]
+    first, last = task["range"]
+    frame_num = last - first
+    num = np.full((len(combos), frame_num), -1, dtype=np.int64)
+    xy = np.full((len(combos), frame_num, 2), np.nan)
+    # 按(模糊, 阈值)分组 组内共用同一组轮廓
+    groups = {}
+    for i, combo in enumerate(combos):
+        groups.setdefault((combo["blur"], combo["threshold"]), []).append(i)
+    min_area = np.array([combo["min_area"] for combo in combos])
+    max_area = np.array([combo["max_area"] for combo in combos])
+    min_circularity = np.array([combo["min_circularity"] for combo in combos])
+    for frame in range(frame_num):
+        img = decode_grey(recording.frame(first + frame))
+        if img is None:
+            continue
+        blurred = {}
+        for (blur, threshold), members in groups.items():
+            if blur not in blurred:
+                blurred[blur] = blur_grey(img, blur)
+            binary = cv.threshold(blurred[blur], threshold, 255, cv.THRESH_BINARY)[1]
+            area, circularity, cx, cy = contour_features(binary)
+            members = np.array(members)
+            # (组内组合数, 轮廓数) 是否通过筛选
+            passes = ((area >= min_area[members, None])
+                      & ((max_area[members, None] <= 0) | (area <= max_area[members, None]))
+                      & (circularity >= min_circularity[members, None]))
+            counts = passes.sum(axis=1)
+            num[members, frame] = counts
+            single = np.nonzero(counts == 1)[0]
+            if len(single):
+                which = passes[single].argmax(axis=1)
+                xy[members[single], frame, 0] = cx[which]
+                xy[members[single], frame, 1] = cy[which]
+    return num, xy
+
+
+# 评分: 单点检测率 质心抖动(相邻三帧的二阶差分中位数 像素)
+def score_results(num, xy, block_sizes):
+    single_rate = (num == 1).mean(axis=1)
+    jitters = []
+    start = 0
+    for size in block_sizes:
+        block = xy[:, start:start + size]
+        if size >= 3:
+            jitters.append(np.linalg.norm(block[:, 2:] - 2 * block[:, 1:-1] + block[:, :-2], axis=2))
+        start += size
+    jitter = np.full(len(num), np.inf)
+    if jitters:
+        second = np.concatenate(jitters, axis=1)
+        # 没有连续三帧单点的组合抖动记为inf
+        valid = np.isfinite(second).any(axis=1)
+        jitter[valid] = np.nanmedian(second[valid], axis=1)
+    return single_rate, jitter
+
+
+# 调优单个相机的记录 返回(按得分排序的[(参数, 单点率, 抖动)], 统计)
+def tune(path, grid=None, frame_num=600, block_size=30, workers=None):
+    combos = make_combos(grid or DEFAULT_GRID)
+    if DEFAULT_DETECT_PARAMS not in combos:
+        combos.append(dict(DEFAULT_DETECT_PARAMS))
+    total = len(StreamRecording(path))
+    # 在整个记录上均匀取block_num块连续帧
+    block_num = max(1, min(frame_num // block_size, total // block_size))
+    starts = np.linspace(0, max(total - block_size, 0), block_num).astype(np.int64)
+    tasks = [{"path": path, "combos": combos, "range": (int(s), int(min(s + block_size, total)))} for s in starts]
+    begin = time.perf_counter()
+    if workers is not None and workers <= 1:
+        results = [evaluate_block(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+            results = list(pool.map(evaluate_block, tasks))
+    num = np.concatenate([result[0] for result in results], axis=1)
+    xy = np.concatenate([result[1] for result in results], axis=1)
+    single_rate, jitter = score_results(num, xy, [last - first for first, last in (t["range"] for t in tasks)])
+    # 单点率优先(按0.5%分档) 同档内抖动小的优先
+    order = sorted(range(len(combos)), key=lambda i: (-round(single_rate[i] * 200), jitter[i]))
+    ranking = [(combos[i], float(single_rate[i]), float(jitter[i])) for i in order]
+    default_index = combos.index(DEFAULT_DETECT_PARAMS)
+    stats = {
+        "frames": num.shape[1],
+        "combos": len(combos),
+        "wall": time.perf_counter() - begin,
+        "default_single_rate": float(single_rate[default_index]),
+        "default_jitter": float(jitter[default_index]),
+    }
+    return ranking, stats
+
+
+# 生成带反光干扰的合成记录: 光点沿已知轨迹运动 另有细长反光条纹与小噪点
+def make_synthetic_recording(path, frame_num=600, fps=30.0, seed=0):
+    from cam_simulator import DotPath, SimCamera, DotRenderer
+    from stream_record import StreamRecorder
+
+    rng = np.random.default_rng(seed)
+    dot_path = DotPath()
+    camera = SimCamera(0, 4)
+    renderer = DotRenderer(dot_radius=3.0, seed=seed)
+    recorder = StreamRecorder(path, blocking=True)
+    for k in range(frame_num):
+        t = k / fps
+        pixels, visible = camera.project(dot_path.positions(t))
+        jpeg = renderer.render(pixels[visible])
+        img = cv.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv.IMREAD_GRAYSCALE)
+        # 反光条纹 位置缓慢变化
+        x = int(100 + 20 * np.sin(t))
+        cv.line(img, (x, 50), (x + 120, 90), 255, 2)
+        # 随机亮噪点
+        for _ in range(rng.integers(0, 4)):
+            cv.circle(img, (int(rng.integers(0, 640)), int(rng.integers(0, 480))), 1, 255, -1)
+        img = cv.cvtColor(img, cv.COLOR_GRAY2BGR)
+        recorder.append(cv.imencode(".jpg", img, [cv.IMWRITE_JPEG_QUALITY, 50])[1].tobytes(), t, int(t * 1e6) + 1)
+    recorder.close()
+
+
+# 用法:
+#   python tune_detection.py <相机记录目录 如recordings/xxx/cam1> --camera 1 [--workers N] [--dry-run]
+#   python tune_detection.py --synthetic   生成带反光的合成记录并调优(不写入配置)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="detection parameter auto-tuning over recorded frames")
+    parser.add_argument("recording", nargs="?", help="单个相机的记录目录")
+    parser.add_argument("--camera", type=int, help="相机号 结果写入camera_config.json对应项")
+    parser.add_argument("--frames", type=int, default=600, help="参与调优的帧数")
+    parser.add_argument("--block", type=int, default=30, help="连续帧块长度")
+    parser.add_argument("--workers", type=int, default=None, help="进程数 默认CPU核数 1为串行")
+    parser.add_argument("--config", default=CONFIG_FILE, help="配置文件")
+    parser.add_argument("--dry-run", action="store_true", help="只输出结果 不写入配置")
+    parser.add_argument("--synthetic", action="store_true", help="使用合成记录测试")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        import tempfile
+        import shutil
+
+        args.recording = os.path.join(tempfile.gettempdir(), "tune_detection_test")
+        shutil.rmtree(args.recording, ignore_errors=True)
+        make_synthetic_recording(args.recording, args.frames)
+        args.dry_run = True
+    if not args.recording:
+        parser.error("recording is required")
+    if not args.dry_run and args.camera is None:
+        parser.error("--camera is required unless --dry-run")
+
+    ranking, stats = tune(args.recording, frame_num=args.frames, block_size=args.block, workers=args.workers)
+    print(f"{stats['frames']} frames x {stats['combos']} settings in {stats['wall']:.1f} s")
+    print(f"default: single-dot rate {stats['default_single_rate']:.1%}, jitter {stats['default_jitter']:.3f} px")
+    for params, single_rate, jitter in ranking[:5]:
+        print(f"  single-dot rate {single_rate:.1%}, jitter {jitter:.3f} px  {params}")
+    best = ranking[0][0]
+    if not args.dry_run:
+        save_detect_params(args.camera, best, args.config)
+        print(f"camera {args.camera} detection settings written to {args.config}, "
+              f"applied on the next Start Listening (edge_node.py: restart)")
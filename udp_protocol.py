@@ -0,0 +1,243 @@
+import struct
+import time
+
+# 分包帧协议
+# 每个UDP包 = 包头 + JPEG片段 单帧可分为多个包发送 突破单包60KB限制
+# 包头: magic(2) version(1) reserved(1) frame_id(4) frag_index(2) frag_count(2) frame_size(4) timestamp_us(8)
+# 除最后一片外 所有分片负载长度相同 接收端据此计算分片在帧内的偏移
+# 旧版相机直接发送以0xFFD8开头的整帧JPEG 与分包帧通过magic区分
+FRAME_HEADER = struct.Struct("<2sBBIHHIQ")
+FRAME_MAGIC = b"WK"
+FRAME_VERSION = 1
+MAX_FRAME_SIZE = 1 << 20  # 单帧最大字节数
+MAX_FRAGMENTS = 1024  # 单帧最大分片数
+DEFAULT_FRAGMENT_PAYLOAD = 1400  # 默认分片负载长度 不超过以太网MTU
+
+
+# 判断数据包是否为分包帧协议
+def is_framed_packet(data):
+    return len(data) >= FRAME_HEADER.size and data[0:2] == FRAME_MAGIC
+
+
+# 发送端: 将JPEG数据打包为分包帧协议的UDP包列表
+def pack_frame(jpeg, frame_id, timestamp_us, payload_size=DEFAULT_FRAGMENT_PAYLOAD):
+    frame_size = len(jpeg)
+    frag_count = max(1, -(-frame_size // payload_size))
+    packets = []
+    for frag_index in range(frag_count):
+        header = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, 0, frame_id & 0xffffffff,
+                                   frag_index, frag_count, frame_size, timestamp_us)
+        packets.append(header + jpeg[frag_index * payload_size:(frag_index + 1) * payload_size])
+    return packets
+
+
+# 帧重组槽位 缓冲区预分配 重复使用
+class FrameSlot:
+    def __init__(self, max_frame_size, max_fragments):
+        self.buffer = bytearray(max_frame_size)
+        self.view = memoryview(self.buffer)
+        self.received = bytearray(max_fragments)  # 各分片是否已收到
+        self.active = False
+        self.frame_id = 0
+        self.frag_count = 0
+        self.received_count = 0
+        self.received_bytes = 0  # 已收到的负载字节数 完成时必须等于frame_size
+        self.payload_size = 0  # 非最后分片的负载长度 0为尚未收到
+        self.frame_size = 0
+        self.timestamp_us = 0
+        self.first_time = 0.0  # 第一个分片到达时间
+
+    def reset(self):
+        self.received[:self.frag_count] = bytes(self.frag_count)
+        self.active = False
+        self.frag_count = 0
+        self.received_count = 0
+        self.received_bytes = 0
+        self.payload_size = 0
+
+
+# 分包帧重组器 每个相机(接收线程)一个
+# slot_num: 同时重组的帧数 timeout: 未完成帧的最长等待时间(秒)
+class FrameAssembler:
+    def __init__(self, slot_num=4, timeout=0.2, max_frame_size=MAX_FRAME_SIZE, max_fragments=MAX_FRAGMENTS):
+        self.slots = [FrameSlot(max_frame_size, max_fragments) for _ in range(slot_num)]
+        self.timeout = timeout
+        self.max_frame_size = max_frame_size
+        self.max_fragments = max_fragments
+        self.last_frame_id = None  # 最近完成的帧号 更旧的帧不再交付
+        # 统计
+        self.frames_completed = 0
+        self.frames_dropped = 0  # 超时/被挤占而丢弃的未完成帧
+        self.fragments_received = 0
+        self.fragments_lost = 0  # 丢弃帧中缺失的分片数
+        self.fragments_duplicate = 0
+        self.fragments_late = 0  # 属于已过期帧的分片
+        self.fragments_malformed = 0
+
+    def clear(self):
+        for slot in self.slots:
+            if slot.active:
+                slot.reset()
+        self.last_frame_id = None
+
+    # frame_id是否比最近交付的帧更新(考虑32位回绕)
+    def is_newer(self, frame_id):
+        if self.last_frame_id is None:
+            return True
+        diff = (frame_id - self.last_frame_id) & 0xffffffff
+        return 0 < diff < 0x80000000
+
+    def drop_slot(self, slot):
+        self.frames_dropped += 1
+        self.fragments_lost += slot.frag_count - slot.received_count
+        slot.reset()
+
+    # 丢弃超时的未完成帧
+    def evict_expired(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        for slot in self.slots:
+            if slot.active and now - slot.first_time > self.timeout:
+                self.drop_slot(slot)
+
+    # 为新帧分配槽位 无空闲槽位时挤占最旧的未完成帧
+    def alloc_slot(self):
+        oldest = None
+        for slot in self.slots:
+            if not slot.active:
+                return slot
+            if oldest is None or slot.first_time < oldest.first_time:
+                oldest = slot
+        self.drop_slot(oldest)
+        return oldest
+
+    # 输入一个分包帧数据包 帧完整时返回(jpeg_bytes, timestamp_us) 否则返回None
+    def push(self, packet, now=None):
+        if now is None:
+            now = time.monotonic()
+        magic, version, _, frame_id, frag_index, frag_count, frame_size, timestamp_us = \
+            FRAME_HEADER.unpack_from(packet)
+        payload = packet[FRAME_HEADER.size:]
+        payload_len = len(payload)
+        if frag_index < frag_count - 1:
+            offset = frag_index * payload_len
+        else:
+            offset = frame_size - payload_len
+        if (magic != FRAME_MAGIC or version != FRAME_VERSION or frag_index >= frag_count
+                or frag_count > self.max_fragments or frame_size > self.max_frame_size
+                or offset < 0 or offset + payload_len > frame_size
+                or (frag_count == 1 and payload_len != frame_size)):
+            self.fragments_malformed += 1
+            return None
+        if not self.is_newer(frame_id):
+            self.fragments_late += 1
+            return None
+        self.fragments_received += 1
+
+        slot = None
+        for candidate in self.slots:
+            if candidate.active and candidate.frame_id == frame_id:
+                slot = candidate
+                break
+        if slot is None:
+            slot = self.alloc_slot()
+            slot.active = True
+            slot.frame_id = frame_id
+            slot.frag_count = frag_count
+            slot.frame_size = frame_size
+            slot.timestamp_us = timestamp_us
+            slot.first_time = now
+        elif slot.frag_count != frag_count or slot.frame_size != frame_size:
+            self.fragments_malformed += 1
+            return None
+        if slot.received[frag_index]:
+            self.fragments_duplicate += 1
+            return None
+        # 非最后分片的负载长度必须一致 否则偏移计算错误 帧中会留下空洞
+        if frag_index < frag_count - 1:
+            if slot.payload_size and slot.payload_size != payload_len:
+                self.fragments_malformed += 1
+                return None
+            slot.payload_size = payload_len
+        slot.view[offset:offset + payload_len] = payload
+        slot.received[frag_index] = 1
+        slot.received_count += 1
+        slot.received_bytes += payload_len
+        if slot.received_count < slot.frag_count:
+            return None
+        if slot.received_bytes != slot.frame_size:
+            # 分片齐全但长度之和不等于帧长 空洞处为旧帧残留数据 丢弃整帧
+            self.fragments_malformed += 1
+            self.frames_dropped += 1
+            slot.reset()
+            return None
+
+        # 帧完整 交付并丢弃所有更旧的未完成帧
+        frame = bytes(slot.view[:slot.frame_size]), slot.timestamp_us
+        self.last_frame_id = frame_id
+        self.frames_completed += 1
+        slot.reset()
+        for other in self.slots:
+            if other.active and not self.is_newer(other.frame_id):
+                self.drop_slot(other)
+        return frame
+
+    # 获取分片统计
+    def get_stats(self):
+        total = self.fragments_received + self.fragments_lost
+        return {
+            "frames_completed": self.frames_completed,
+            "frames_dropped": self.frames_dropped,
+            "fragments_received": self.fragments_received,
+            "fragments_lost": self.fragments_lost,
+            "fragments_duplicate": self.fragments_duplicate,
+            "fragments_late": self.fragments_late,
+            "fragments_malformed": self.fragments_malformed,
+            "fragment_loss_rate": self.fragments_lost / total if total > 0 else 0.0,
+        }
+
+
+# 质心包协议 边缘检测节点(edge_node.py)只发送检测结果 不发送JPEG
+# 包头: magic(2) version(1) camera(1) frame_id(4) num_points(2 有符号 -1为解码失败) reserved(2)
+#       capture_us(8 相机端采集时间戳 旧协议为0) delay_us(4 边缘节点从收到整帧到发出的耗时)
+# 之后为num_points个(x, y) float32
+CENTROID_HEADER = struct.Struct("<2sBBIhHQI")
+CENTROID_MAGIC = b"WC"
+CENTROID_VERSION = 1
+CENTROID_POINT = struct.Struct("<ff")
+MAX_CENTROIDS = 64
+
+
+# 判断数据包是否为质心包
+def is_centroid_packet(data):
+    return len(data) >= CENTROID_HEADER.size and data[0:2] == CENTROID_MAGIC
+
+
+# 发送端: 打包一帧的检测结果 points为None或[[x, y], ...]
+def pack_centroids(camera, frame_id, points, num_points, capture_us=0, delay_us=0):
+    points = points[:MAX_CENTROIDS] if points else []
+    count = len(points) if num_points >= 0 else -1
+    header = CENTROID_HEADER.pack(CENTROID_MAGIC, CENTROID_VERSION, camera & 0xff, frame_id & 0xffffffff,
+                                  count, 0, capture_us or 0, min(max(int(delay_us), 0), 0xffffffff))
+    return header + b"".join(CENTROID_POINT.pack(x, y) for x, y in points)
+
+
+# 接收端: 解析质心包 返回字典 格式错误返回None
+def unpack_centroids(data):
+    if not is_centroid_packet(data):
+        return None
+    _magic, version, camera, frame_id, count, _reserved, capture_us, delay_us = CENTROID_HEADER.unpack_from(data)
+    if version != CENTROID_VERSION or count > MAX_CENTROIDS:
+        return None
+    if len(data) < CENTROID_HEADER.size + max(count, 0) * CENTROID_POINT.size:
+        return None
+    points = [list(CENTROID_POINT.unpack_from(data, CENTROID_HEADER.size + i * CENTROID_POINT.size))
+              for i in range(max(count, 0))]
+    return {
+        "camera": camera,
+        "frame_id": frame_id,
+        "points": points or None,
+        "num_points": count,
+        "capture_timestamp": capture_us,
+        "delay_us": delay_us,
+    }
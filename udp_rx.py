@@ -1,42 +1,81 @@
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QLabel,
                              QPushButton, QHBoxLayout, QLineEdit, QSpinBox,
-                             QGridLayout, QSizePolicy, QFrame)
+                             QGridLayout, QSizePolicy, QFrame, QCheckBox)
 from PyQt5.QtGui import QFont, QPixmap
-from PyQt5.QtCore import QThread, pyqtSignal, QByteArray, QBuffer
+from PyQt5.QtCore import QThread, pyqtSignal, QByteArray, QBuffer, QTimer
 from PyQt5.QtCore import pyqtSignal, QObject
 import numpy as np
-import cv2 as cv
 import socket
 import select
+import time
 import re
+from collections import deque
+from startup import LazyModule
+from udp_protocol import FrameAssembler, is_framed_packet, is_centroid_packet, unpack_centroids
+from dot_detect import blur_grey, contour_passes, decode_grey, jpeg_size
+from camera_config import load_detect_params
+from frame_mailbox import FrameMailbox, DROP_OLDEST
+from stream_health import StreamHealth
+from detect_worker import DetectWorker
+from stream_record import StreamRecorder
+from frame_skip import FrameSkipper
+
+cv = LazyModule("cv2")  # OpenCV在首次解码时才加载
 
 # UDP单包最大数量(bytes)
 UDP_BUFFER_SIZE = 60000
-
-# 滑动均值滤波器 用于FPS平滑
+# Socket内核接收缓冲大小(bytes)
+UDP_RCVBUF_SIZE = 4 * 1024 * 1024
+# 图像显示最小间隔(秒) 只解码需要显示的帧 多进程检测模式下GUI线程不再逐帧解码
+DISPLAY_INTERVAL = 1 / 30
+IMAGE_SIZE = (640, 480)  # 相机图像尺寸(宽, 高) 尺寸不符的帧在检测前丢弃
+
+# 本机默认监听IP缓存
+_host_ip_cache = None
+
+
+# 获取本机默认出口网卡IP 结果缓存
+# 对UDP socket调用connect只做路由查询 不发送数据也不做DNS解析 不会阻塞
+def get_default_host_ip():
+    global _host_ip_cache
+    if _host_ip_cache is None:
+        probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            probe.connect(("10.255.255.255", 1))
+            _host_ip_cache = probe.getsockname()[0]
+        except OSError:
+            _host_ip_cache = "127.0.0.1"
+        finally:
+            probe.close()
+    return _host_ip_cache
+
+
+# 滑动均值滤波器 用于FPS平滑 维护累加和 每次更新O(1)
 class MovingAverageFilter:
     def __init__(self, window_size):
         self.window_size = window_size
-        self.data_window = []
+        self.data_window = deque(maxlen=window_size)
+        self.data_sum = 0.0
 
     def apply(self, new_data_point):
+        if len(self.data_window) == self.window_size:
+            self.data_sum -= self.data_window[0]
         self.data_window.append(new_data_point)
-        if len(self.data_window) > self.window_size:
-            self.data_window.pop(0)
-        return sum(self.data_window) / len(self.data_window)
+        self.data_sum += new_data_point
+        return self.data_sum / len(self.data_window)
 
 
 class ReceiveThread(QThread):
     udp_state_signal = pyqtSignal(bool)  # 报告是否超时
-    image_update_signal = pyqtSignal(bool, bytes)
+    frame_ready_signal = pyqtSignal()  # 信箱由空变为非空时通知处理端
     fps_update_signal = pyqtSignal(float)
+    centroid_signal = pyqtSignal(object)  # 收到边缘检测节点发来的质心包
 
     def __init__(self, udp_socket):
         super().__init__()
         # Timer
-        self.sys_tick_freq = cv.getTickFrequency()
-        self.last_tick = cv.getTickCount()
-        self.curr_tick = cv.getTickCount()
+        self.last_tick = time.perf_counter()
+        self.curr_tick = time.perf_counter()
         self.avr_fps = 0.00  # 平均帧率
         # Threading
         self.running = False  # 线程是否正在运行
@@ -45,10 +84,20 @@ class ReceiveThread(QThread):
         self.socket_rx_addr = None  # 接收到的信息来源地址
         # Image Data
         self.raw_udp_data = None  # 原始UDP接收数据
+        self.rx_buffer = bytearray(UDP_BUFFER_SIZE)  # 预分配接收缓冲
+        self.rx_view = memoryview(self.rx_buffer)
+        self.assembler = FrameAssembler()  # 分包帧重组
+        self.last_capture_timestamp = None  # 最新帧相机端采集时间戳(us) 旧版单包相机为None
+        # 帧交接信箱 元素为(JPEG数据, 采集时间戳us, 接收时间time.monotonic())
+        self.mailbox = FrameMailbox(1, DROP_OLDEST)
+        self.detect_worker = None  # 多进程检测模式下的工作进程
+        self.recorder = None  # 原始数据流记录 用于离线重新处理
         # self.cv_image = None  # 解码后OpenCV图像
         self.success_image_count = 0  # 总解码成功图像数量
         self.success_time = 0.00  # 接收连续计时
         self.fps_filter = MovingAverageFilter(window_size=100)
+        self.health = StreamHealth()  # 数据流健康统计
+        self.expected_size = None  # 图像尺寸(宽, 高) 设置后每帧交付前由JPEG帧头校验 不需解码
 
     # 返回图像信息是否有效
     def is_data_valid(self):
@@ -59,8 +108,8 @@ class ReceiveThread(QThread):
 
     # 获取距离上一次获取图像的时间间隔 用于计算FPS
     def get_dt(self):
-        self.curr_tick = cv.getTickCount()
-        dt = (self.curr_tick - self.last_tick) / self.sys_tick_freq
+        self.curr_tick = time.perf_counter()
+        dt = self.curr_tick - self.last_tick
         self.last_tick = self.curr_tick
         return dt
 
@@ -71,19 +120,38 @@ class ReceiveThread(QThread):
         while self.running:
             if self.udp_socket:
                 ready = select.select([self.udp_socket], [], [], 1.0)
+                self.assembler.evict_expired()
                 if ready[0]:
-                    self.raw_udp_data, self.socket_rx_addr = self.udp_socket.recvfrom(UDP_BUFFER_SIZE)
-                    if len(self.raw_udp_data) > 0:
-                        if len(self.raw_udp_data) == UDP_BUFFER_SIZE:
-                            print("the Image Data is too Large!")
+                    rx_len, self.socket_rx_addr = self.udp_socket.recvfrom_into(self.rx_buffer)
+                    self.raw_udp_data = self.rx_view[:rx_len]
+                    self.health.on_packet(rx_len)
+                    if rx_len > 0:
+                        if is_centroid_packet(self.raw_udp_data):
+                            # 边缘节点已完成解码与检测 直接转发结果
+                            result = unpack_centroids(self.raw_udp_data)
+                            if result is None:
+                                self.health.on_broken()
+                                continue
+                            # 扣除边缘节点的处理耗时 近似为整帧到达边缘节点的时刻
+                            result["arrival_ns"] = time.monotonic_ns() - result["delay_us"] * 1000
+                            self.centroid_signal.emit(result)
+                            self.frame_received()
                             continue
-                        if self.raw_udp_data[0] == 0xff and self.raw_udp_data[1] == 0xd8 and self.raw_udp_data[-2] == 0xff and self.raw_udp_data[-1] == 0xd9:
-                            self.image_update_signal.emit(self.running, self.raw_udp_data)
-                            self.success_image_count += 1
-                            self.avr_fps = self.fps_filter.apply(1.0 / self.get_dt())
-                            self.fps_update_signal.emit(self.avr_fps)
-                            self.udp_state_signal.emit(True)
+                        if is_framed_packet(self.raw_udp_data):
+                            # 分包帧 重组完成后才得到整帧
+                            frame = self.assembler.push(self.raw_udp_data)
+                            if frame is None:
+                                continue
+                            image_data, self.last_capture_timestamp = frame
                         else:
+                            # 旧版单包整帧
+                            if rx_len == UDP_BUFFER_SIZE:
+                                self.health.on_oversize()
+                                print("the Image Data is too Large!")
+                                continue
+                            image_data = bytes(self.raw_udp_data)
+                            self.last_capture_timestamp = None
+                        if not self.deliver_frame(image_data, self.last_capture_timestamp):
                             print("UDP Receive Lost! Data is Broken!")
                             continue
                     else:
@@ -94,18 +162,76 @@ class ReceiveThread(QThread):
                     # print("UDP Timeout!")
                     self.success_image_count = 0
                     self.success_time = 0
+                    self.health.on_timeout()
                     self.udp_state_signal.emit(False)
                     continue
             else:
                 print("Socket is None!")
                 continue
 
+    # 校验整帧JPEG并交给处理端(信箱/记录/检测工作进程) 返回是否有效
+    # 其他数据源(如HTTP MJPEG)收到整帧后也走这里
+    def deliver_frame(self, image_data, capture_timestamp):
+        if not (len(image_data) >= 4 and image_data[0] == 0xff and image_data[1] == 0xd8
+                and image_data[-2] == 0xff and image_data[-1] == 0xd9):
+            self.health.on_broken()
+            return False
+        if self.expected_size is not None and jpeg_size(image_data) != self.expected_size:
+            self.health.on_broken()
+            print("The Image Size is Error!")
+            return False
+        arrival = time.monotonic()
+        if self.mailbox.put((image_data, capture_timestamp, arrival)):
+            self.frame_ready_signal.emit()
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.append(image_data, arrival, capture_timestamp)
+        if self.detect_worker is not None:
+            self.detect_worker.submit(image_data, capture_timestamp)
+        self.frame_received()
+        return True
+
+    # 收到一个有效帧(JPEG或质心包) 更新统计与帧率
+    def frame_received(self):
+        self.health.on_frame()
+        self.success_image_count += 1
+        self.avr_fps = self.fps_filter.apply(1.0 / self.get_dt())
+        self.fps_update_signal.emit(self.avr_fps)
+        self.udp_state_signal.emit(True)
+
+    # 获取数据流健康统计 可在任意线程调用
+    def get_health(self):
+        stats = self.health.get_stats()
+        stats.update(self.assembler.get_stats())
+        stats["mailbox_dropped"] = self.mailbox.drop_count
+        return stats
+
     # 线程停止函数
     def stop(self):
         print("Thread Stop!")
         self.running = False
 
 
+# 多进程检测结果接收线程 等待工作进程的新结果并转发到GUI线程
+class DetectResultThread(QThread):
+    result_signal = pyqtSignal(object)
+
+    def __init__(self, detect_worker):
+        super().__init__()
+        self.detect_worker = detect_worker
+        self.running = False
+
+    def run(self):
+        while self.running:
+            if self.detect_worker.wait_result(0.5):
+                result = self.detect_worker.latest_result()
+                if result is not None:
+                    self.result_signal.emit(result)
+
+    def stop(self):
+        self.running = False
+
+
 class ImageLabel(QLabel):
     def __init__(self):
         super().__init__()
@@ -137,8 +263,19 @@ class UDP_RX(QWidget):
         self.listening_socket = None
         self.udp_is_listening = False
         self.cv_image = None
+        self.last_display_time = 0.0  # 上一次解码显示的时间(time.monotonic())
+        self.current_frame_stamp = None  # 最新处理帧的接收时间(time.monotonic())
+        self.current_capture_timestamp = None  # 最新处理帧的相机端采集时间戳(us) 旧协议为None
+        # 多进程检测模式 解码与检测在独立进程中进行 GUI线程只负责显示
+        self.process_detect = False
+        self.detect_worker = None
+        self.detect_result_thread = None
+        # 静止场景跳帧 JPEG字节与上一次检测的帧完全相同时复用检测结果 只作用于本进程内检测
+        self.skip_static = False
+        self.frame_skipper = FrameSkipper()
         # Camera Info
         self.index = index
+        self.detect_params = load_detect_params(index)  # 检测参数 见camera_config.json
         # self.setWindowTitle(name)
         # self.setGeometry(100, 100, 400, 300)
         # Layout
@@ -153,9 +290,7 @@ class UDP_RX(QWidget):
         self.udp_listening_ipaddr_label = QLabel("Listening IP:")
         self.udp_listening_ipaddr_lineedit = QLineEdit()
         #     Set the default listening ip address
-        hostname = socket.gethostname()
-        ip_addr = socket.gethostbyname(hostname)
-        self.udp_listening_ipaddr_lineedit.setText(ip_addr)
+        self.udp_listening_ipaddr_lineedit.setText(get_default_host_ip())
         self.udp_listening_ipaddr_lineedit.textChanged.connect(self.validate_ip)
 
         self.udp_listening_port_label = QLabel("Listening Port:")
@@ -164,6 +299,10 @@ class UDP_RX(QWidget):
         self.udp_listening_port_spinbox.setValue(6666)
         self.udp_receive_from_label = QLabel("Receive from:")
         self.udp_receive_addr_label = QLabel("   .   .   .   ")
+        # HTTP MJPEG地址 填写后改用HTTP接收(如ESP32CAM官方固件 http://<ip>:81/stream) 为空时使用UDP
+        self.mjpeg_url_label = QLabel("MJPEG URL:")
+        self.mjpeg_url_lineedit = QLineEdit()
+        self.mjpeg_url_lineedit.setPlaceholderText("empty: UDP")
         self.udp_listening_button = QPushButton()
         self.udp_listening_button.setEnabled(False)
         self.validate_ip()
@@ -175,6 +314,8 @@ class UDP_RX(QWidget):
         self.udp_info_glayout.addWidget(self.udp_listening_port_spinbox, 1, 1)
         self.udp_info_glayout.addWidget(self.udp_receive_from_label, 2, 0)
         self.udp_info_glayout.addWidget(self.udp_receive_addr_label, 2, 1)
+        self.udp_info_glayout.addWidget(self.mjpeg_url_label, 3, 0)
+        self.udp_info_glayout.addWidget(self.mjpeg_url_lineedit, 3, 1)
         self.udp_info_glayout.addWidget(self.udp_listening_button)
 
         self.udp_info_frame.setLayout(self.udp_info_glayout)
@@ -202,6 +343,18 @@ class UDP_RX(QWidget):
         self.points_value_label = QLabel()
         self.state_label = QLabel("Detect State:")
         self.state_value_label = QLabel()
+        self.frag_loss_label = QLabel("Frag Loss:")
+        self.frag_loss_value_label = QLabel()
+        self.dropped_label = QLabel("Dropped:")
+        self.dropped_value_label = QLabel()
+        self.stream_label = QLabel("Stream:")
+        self.stream_value_label = QLabel()
+        self.skipped_label = QLabel("Skipped:")
+        self.skipped_value_label = QLabel()
+        self.process_detect_checkbox = QCheckBox("Worker Process Detect")
+        self.process_detect_checkbox.toggled.connect(self.set_process_detect)
+        self.skip_static_checkbox = QCheckBox("Skip Identical Frames")
+        self.skip_static_checkbox.toggled.connect(self.set_skip_static)
 
         self.image_info_grid_layout.addWidget(self.fps_label, 0, 0)
         self.image_info_grid_layout.addWidget(self.fps_value_label, 0, 1)
@@ -209,6 +362,16 @@ class UDP_RX(QWidget):
         self.image_info_grid_layout.addWidget(self.points_value_label, 1, 1)
         self.image_info_grid_layout.addWidget(self.state_label, 2, 0)
         self.image_info_grid_layout.addWidget(self.state_value_label, 2, 1)
+        self.image_info_grid_layout.addWidget(self.frag_loss_label, 3, 0)
+        self.image_info_grid_layout.addWidget(self.frag_loss_value_label, 3, 1)
+        self.image_info_grid_layout.addWidget(self.dropped_label, 4, 0)
+        self.image_info_grid_layout.addWidget(self.dropped_value_label, 4, 1)
+        self.image_info_grid_layout.addWidget(self.stream_label, 5, 0)
+        self.image_info_grid_layout.addWidget(self.stream_value_label, 5, 1)
+        self.image_info_grid_layout.addWidget(self.skipped_label, 6, 0)
+        self.image_info_grid_layout.addWidget(self.skipped_value_label, 6, 1)
+        self.image_info_grid_layout.addWidget(self.process_detect_checkbox, 7, 0, 1, 2)
+        self.image_info_grid_layout.addWidget(self.skip_static_checkbox, 8, 0, 1, 2)
 
         self.image_info_frame.setLayout(self.image_info_grid_layout)
         self.info_vbox_layout.addWidget(self.image_info_frame)
@@ -237,14 +400,26 @@ class UDP_RX(QWidget):
         self.main_hbox_layout.setStretch(0, 2)
         self.main_hbox_layout.setStretch(1, 1)
         # Thread
-        self.rx_thread = ReceiveThread(None)
+        self.rx_thread = None
+        self.use_rx_thread(ReceiveThread(None))
         # Signal Connect
-        self.rx_thread.image_update_signal.connect(self.image_update)
-        self.rx_thread.fps_update_signal.connect(self.fps_update)
-        self.rx_thread.udp_state_signal.connect(self.is_udp_timeout)
         self.udp_start_listening_signal.connect(self.udp_start_listening)
         self.udp_listening_button.clicked.connect(self.udp_start_listening)
 
+    # 切换接收线程(UDP/HTTP MJPEG) 保留信箱设置与记录器 需在线程停止时调用
+    def use_rx_thread(self, rx_thread):
+        old_thread = self.rx_thread
+        if old_thread is not None:
+            old_thread.disconnect()
+            rx_thread.mailbox = old_thread.mailbox
+            rx_thread.recorder = old_thread.recorder
+        self.rx_thread = rx_thread
+        self.rx_thread.expected_size = IMAGE_SIZE  # 本地检测与工作进程检测前都经过尺寸校验
+        self.rx_thread.frame_ready_signal.connect(self.process_pending_frames)
+        self.rx_thread.fps_update_signal.connect(self.fps_update)
+        self.rx_thread.udp_state_signal.connect(self.is_udp_timeout)
+        self.rx_thread.centroid_signal.connect(self.detect_result_update)  # 边缘节点结果与工作进程结果格式相同
+
     # UDP超时或者收到新图像时执行此回调函数
     def is_udp_timeout(self, udp_state):
         if udp_state:
@@ -270,6 +445,12 @@ class UDP_RX(QWidget):
                 return None
         return None
 
+    # 获取当前全部检测点 超时或没有点时返回None
+    def get_current_valid_points(self):
+        if not self.udp_timeout and self.detect_points > 0:
+            return self.current_points
+        return None
+
     # 更新检测状态显示
     def update_detect_state(self):
         if not self.udp_timeout:
@@ -304,26 +485,26 @@ class UDP_RX(QWidget):
                 show_str += f"({x:.2f}, {y:.2f})\n"
         self.points_value_label.setText(show_str)
 
-    # 图像检测点函数
+    # 图像检测点函数 img为decode_grey解码的灰度图 与参数调优使用相同的灰度
     def find_dot_from_image(self, img):
-        # img = cv.GaussianBlur(img,(5,5),0)
-        grey = cv.cvtColor(img, cv.COLOR_RGB2GRAY)
-        grey = cv.threshold(grey, 255 * 0.9, 255, cv.THRESH_BINARY)[1]
+        params = self.detect_params
+        grey = blur_grey(img, params["blur"])
+        grey = cv.threshold(grey, params["threshold"], 255, cv.THRESH_BINARY)[1]
         contours, _ = cv.findContours(grey, cv.RETR_TREE, cv.CHAIN_APPROX_SIMPLE)
-        img = cv.drawContours(img, contours, -1, (0, 255, 0), 1)
+        img = cv.drawContours(img, contours, -1, 128, 1)
 
         image_points = []
         for contour in contours:
             moments = cv.moments(contour)
-            if moments["m00"] != 0:
+            if contour_passes(contour, moments, params["min_area"], params["max_area"], params["min_circularity"]):
                 center_x = moments["m10"] / moments["m00"]
                 center_y = moments["m01"] / moments["m00"]
                 image_points.append([center_x, center_y])
                 center_x = int(center_x)
                 center_y = int(center_y)
                 cv.putText(img, f'({center_x}, {center_y})', (center_x, center_y - 15), cv.FONT_HERSHEY_SIMPLEX, 0.3,
-                           (100, 255, 100), 1)
-                cv.circle(img, (center_x, center_y), 1, (100, 255, 100), -1)
+                           128, 1)
+                cv.circle(img, (center_x, center_y), 1, 128, -1)
 
         num_points = len(image_points)
         if num_points == 0:
@@ -335,6 +516,20 @@ class UDP_RX(QWidget):
     def fps_update(self, fps):
         formatted_str = "{:.2f}".format(fps)
         self.fps_value_label.setText(formatted_str)
+        # 分包帧分片丢失率 旧版单包相机不显示
+        frag_stats = self.rx_thread.assembler.get_stats()
+        if frag_stats["frames_completed"] > 0:
+            self.frag_loss_value_label.setText("{:.2%}".format(frag_stats["fragment_loss_rate"]))
+        # 处理跟不上接收时丢弃的帧数
+        self.dropped_value_label.setText(str(self.rx_thread.mailbox.drop_count))
+        # 码率与到达间隔抖动
+        health = self.rx_thread.health.get_stats()
+        self.stream_value_label.setText("{:.0f}KB/s p95:{:.1f}ms".format(health["bytes_per_second"] / 1024,
+                                                                         health["interval_p95_ms"]))
+        # 静止跳帧比例
+        if self.skip_static:
+            skip_stats = self.frame_skipper.get_stats()
+            self.skipped_value_label.setText("{:.1%} ({})".format(skip_stats["skip_rate"], skip_stats["skipped"]))
 
     # UDP开始监听回调函数
     def udp_start_listening(self):
@@ -343,53 +538,174 @@ class UDP_RX(QWidget):
             self.rx_thread.running = False
             self.rx_thread.stop()
             self.rx_thread.wait()
-            print("CLose the Socket!")
-            self.rx_thread.udp_socket.close()
+            self.rx_thread.mailbox.clear()
+            self.stop_detect_worker()
+            if self.rx_thread.udp_socket is not None:
+                print("CLose the Socket!")
+                self.rx_thread.udp_socket.close()
+                self.rx_thread.udp_socket = None
             self.udp_listening_port_spinbox.setEnabled(True)
             self.udp_listening_ipaddr_lineedit.setEnabled(True)
+            self.mjpeg_url_lineedit.setEnabled(True)
+            self.process_detect_checkbox.setEnabled(True)
             self.udp_listening_button.setText("Start Listening")
             self.show_no_video()
 
         else:
+            from mjpeg_rx import MjpegReceiveThread  # mjpeg_rx依赖本模块 在此导入避免循环导入
             self.udp_is_listening = True
-            # Socket Bind
-            # Socket
-            self.listening_socket = (self.udp_listening_ipaddr_lineedit.text(), self.udp_listening_port_spinbox.value())
-            self.rx_thread.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            self.rx_thread.udp_socket.bind(self.listening_socket)
-            print(f"Listening on {self.listening_socket}")
-            self.rx_thread.udp_socket = self.rx_thread.udp_socket  # 更新线程Socket
+            mjpeg_url = self.mjpeg_url_lineedit.text().strip()
+            if mjpeg_url:
+                # HTTP MJPEG 每次开始时新建线程 连接在线程中建立
+                self.use_rx_thread(MjpegReceiveThread(mjpeg_url))
+                print(f"Connecting to {mjpeg_url}")
+            else:
+                if isinstance(self.rx_thread, MjpegReceiveThread):
+                    self.use_rx_thread(ReceiveThread(None))
+                # Socket Bind
+                # Socket
+                self.listening_socket = (self.udp_listening_ipaddr_lineedit.text(), self.udp_listening_port_spinbox.value())
+                self.rx_thread.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.rx_thread.udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_RCVBUF_SIZE)  # 容纳分包帧突发
+                self.rx_thread.udp_socket.bind(self.listening_socket)
+                self.rx_thread.assembler.clear()
+                print(f"Listening on {self.listening_socket}")
+            self.rx_thread.health.clear()
+            self.frame_skipper.clear()
+            self.detect_params = load_detect_params(self.index)  # 重新读取 tune_detection.py写入的参数在此生效
+            if self.process_detect:
+                self.start_detect_worker()
             self.rx_thread.running = True
             self.rx_thread.start()
 
             self.udp_listening_port_spinbox.setEnabled(False)
             self.udp_listening_ipaddr_lineedit.setEnabled(False)
+            self.mjpeg_url_lineedit.setEnabled(False)
+            self.process_detect_checkbox.setEnabled(False)
             self.udp_listening_button.setText("Stop Listening")
 
+    # 切换静止场景跳帧 重新开始统计
+    def set_skip_static(self, enabled):
+        self.skip_static = enabled
+        self.frame_skipper = FrameSkipper()
+        self.skipped_value_label.setText("" if not enabled else "0.0% (0)")
+
+    # 切换多进程检测模式 在下次开始监听时生效
+    def set_process_detect(self, enabled):
+        self.process_detect = enabled
+
+    # 启动检测工作进程
+    def start_detect_worker(self):
+        self.detect_worker = DetectWorker(detect_params=self.detect_params)
+        self.detect_worker.start()
+        self.detect_result_thread = DetectResultThread(self.detect_worker)
+        self.detect_result_thread.result_signal.connect(self.detect_result_update)
+        self.detect_result_thread.running = True
+        self.detect_result_thread.start()
+        self.rx_thread.detect_worker = self.detect_worker
+
+    # 停止检测工作进程
+    def stop_detect_worker(self):
+        if self.detect_worker is None:
+            return
+        self.rx_thread.detect_worker = None
+        self.detect_result_thread.stop()
+        self.detect_result_thread.wait()
+        self.detect_worker.stop()
+        self.detect_result_thread = None
+        self.detect_worker = None
+
+    # 工作进程/边缘检测节点检测结果回调函数
+    def detect_result_update(self, result):
+        if not self.rx_thread.running:
+            return
+        self.current_frame_stamp = result["arrival_ns"] / 1e9
+        self.current_capture_timestamp = result["capture_timestamp"] or None
+        if result["num_points"] >= 0:
+            self.apply_detection(result["points"], result["num_points"])
+        else:
+            print("opencv decode failed")
+
+    # 更新检测结果并通知上层
+    def apply_detection(self, points, num_points):
+        self.current_points = points
+        self.label_show_points(points)
+        self.detect_points = num_points
+        self.update_detect_state()
+        self.update_signal.emit()  # 发送图像更新信号
+
+    # 解码JPEG并检测点 返回(点集, 点数量) 解码失败时点数量为-1
+    # 开启静止跳帧时先与参考帧比较字节签名 完全相同则复用参考帧结果
+    def detect_from_jpeg(self, image_data):
+        if self.skip_static:
+            return self.frame_skipper.detect(image_data, self.detect_full)
+        return self.detect_full(image_data)
+
+    # 完整解码并检测
+    def detect_full(self, image_data):
+        self.cv_image = decode_grey(image_data)
+        if self.cv_image is None:
+            return None, -1
+        _img, _points, _num_points = self.find_dot_from_image(self.cv_image)
+        return _points, _num_points
+
+    # 开始记录原始数据流到path目录
+    def start_stream_recording(self, path):
+        self.stop_stream_recording()
+        self.rx_thread.recorder = StreamRecorder(path)
+
+    # 停止记录原始数据流 返回记录的帧数
+    def stop_stream_recording(self):
+        recorder = self.rx_thread.recorder
+        if recorder is None:
+            return 0
+        self.rx_thread.recorder = None
+        recorder.close()
+        if recorder.dropped_count:
+            print(f"Stream recorder dropped {recorder.dropped_count} frames (disk too slow)")
+        return recorder.frame_count
+
+    # 设置接收与处理之间的交接方式 capacity=1为只保留最新帧 policy: DROP_OLDEST / DROP_NEWEST
+    # 需在开始监听前调用 接收线程运行时替换信箱会丢失生产者正在放入的帧
+    def set_backpressure(self, capacity, policy=DROP_OLDEST):
+        if self.rx_thread.isRunning():
+            raise RuntimeError("set_backpressure must be called before Start Listening")
+        self.rx_thread.mailbox = FrameMailbox(capacity, policy)
+
+    # 接收线程通知有新帧 只处理通知时已在信箱中的帧 然后回到事件循环
+    # 过载时接收线程会在每次解码期间补充信箱 一直取到空会使GUI线程无法重绘与响应
+    # 处理完后信箱仍非空则重新排队(生产者只在信箱由空变为非空时通知)
+    def process_pending_frames(self):
+        mailbox = self.rx_thread.mailbox
+        for _ in range(len(mailbox)):
+            frame = mailbox.take()
+            if frame is None:
+                return
+            image_data, self.current_capture_timestamp, self.current_frame_stamp = frame
+            self.image_update(self.rx_thread.running, image_data)
+        if len(mailbox) > 0:
+            QTimer.singleShot(0, self.process_pending_frames)
+
     # 新图像获取回调函数
     def image_update(self, running, image_data):
         # 不知为什 必须添加对运行的状态检测 否则在停止时会有多余刷新
         if running:
-            pixmap = QPixmap()
-            byte_array = QByteArray(image_data)
-            buffer = QBuffer(byte_array)
-            buffer.open(QBuffer.ReadOnly)
-            pixmap.loadFromData(buffer.data(), "JPEG")
-            self.image_label.setPixmap(pixmap)
-            if pixmap.width() != 640 or pixmap.height() != 480:
-                print("The Image Size is Error!")
+            now = time.monotonic()
+            if now - self.last_display_time >= DISPLAY_INTERVAL:
+                self.last_display_time = now
+                pixmap = QPixmap()
+                byte_array = QByteArray(image_data)
+                buffer = QBuffer(byte_array)
+                buffer.open(QBuffer.ReadOnly)
+                pixmap.loadFromData(buffer.data(), "JPEG")
+                self.image_label.setPixmap(pixmap)
+
+            if self.detect_worker is not None:  # 多进程检测模式 检测结果由detect_result_update更新
                 return
-
-            np_data = np.frombuffer(image_data, dtype=np.uint8)
-            self.cv_image = cv.imdecode(np_data, cv.IMREAD_COLOR)
-            if self.cv_image is not None:
+            _points, _num_points = self.detect_from_jpeg(image_data)
+            if _num_points >= 0:
                 # 图像解码成功
-                _img, _points, _num_points = self.find_dot_from_image(self.cv_image)
-                self.current_points = _points
-                self.label_show_points(_points)
-                self.detect_points = _num_points
-                self.update_detect_state()
-                self.update_signal.emit()  # 发送图像更新信号
+                self.apply_detection(_points, _num_points)
                 # cv.imshow("decode img", self.cv_image)
                 # cv.waitKey(1)
             else:
@@ -417,6 +733,7 @@ class UDP_RX(QWidget):
     def closeEvent(self, event):
         self.rx_thread.stop()
         self.rx_thread.wait()
+        self.stop_detect_worker()
         super().closeEvent(event)
 
 
@@ -0,0 +1,259 @@
+import sys
+import json
+import time
+import numpy as np
+
+# 三维区域(地理围栏)事件
+# 区域类型: 轴对齐长方体(box) 以及 多边形沿竖直轴拉伸的棱柱(prism)
+# 空间索引: 均匀网格 每个区域按包围盒登记到覆盖的网格单元 单元内的区域列表以CSR数组存储
+# 查询: 一批点 -> 所在单元 -> 候选(点, 区域)对 -> 向量化精确判断
+# 每个点只与所在单元内的区域比较 区域数量增加时单点开销基本不变
+BOX = "box"
+PRISM = "prism"
+MAX_CELLS = 1 << 21  # 网格单元数上限 区域很小而分布很广时自动增大单元边长
+
+
+# 单个区域 prism: polygon为水平面内多边形顶点 [[u, v], ...] min/max为竖直方向范围
+# axis: 竖直轴 (0=x 1=y 2=z) 多边形坐标为另外两个轴
+class Zone:
+    def __init__(self, name, kind, lower, upper, polygon=None, axis=1):
+        self.name = name
+        self.kind = kind
+        self.axis = axis
+        self.polygon = None if polygon is None else np.asarray(polygon, dtype=np.float64)
+        if kind == PRISM:
+            plane = [i for i in range(3) if i != axis]
+            self.lower = np.zeros(3)
+            self.upper = np.zeros(3)
+            self.lower[plane] = self.polygon.min(axis=0)
+            self.upper[plane] = self.polygon.max(axis=0)
+            self.lower[axis] = lower
+            self.upper[axis] = upper
+        else:
+            self.lower = np.asarray(lower, dtype=np.float64)
+            self.upper = np.asarray(upper, dtype=np.float64)
+
+    @staticmethod
+    def box(name, lower, upper):
+        return Zone(name, BOX, lower, upper)
+
+    @staticmethod
+    def prism(name, polygon, lower, upper, axis=1):
+        return Zone(name, PRISM, lower, upper, polygon, axis)
+
+
+# 从JSON读取区域列表
+# [{"name": "a", "type": "box", "min": [x, y, z], "max": [x, y, z]},
+#  {"name": "b", "type": "prism", "polygon": [[u, v], ...], "min": h0, "max": h1, "axis": 1}]
+def load_zones(path):
+    with open(path) as f:
+        items = json.load(f)
+    zones = []
+    for item in items:
+        if item.get("type", BOX) == PRISM:
+            zones.append(Zone.prism(item["name"], item["polygon"], item["min"], item["max"], item.get("axis", 1)))
+        else:
+            zones.append(Zone.box(item["name"], item["min"], item["max"]))
+    return zones
+
+
+# 区域空间索引
+class ZoneIndex:
+    def __init__(self, zones, cell_size=None):
+        self.zones = list(zones)
+        zone_num = len(self.zones)
+        self.lower = np.array([zone.lower for zone in self.zones]).reshape(-1, 3)
+        self.upper = np.array([zone.upper for zone in self.zones]).reshape(-1, 3)
+        # 棱柱多边形补齐为相同顶点数(重复最后一个顶点 不影响射线法结果)
+        self.is_prism = np.array([zone.kind == PRISM for zone in self.zones], dtype=bool)
+        self.axis = np.array([zone.axis for zone in self.zones], dtype=np.int64)
+        vertex_num = max([len(zone.polygon) for zone in self.zones if zone.kind == PRISM], default=1)
+        self.polygons = np.zeros((zone_num, vertex_num, 2))
+        for i, zone in enumerate(self.zones):
+            if zone.kind == PRISM:
+                poly = zone.polygon
+                self.polygons[i, :len(poly)] = poly
+                self.polygons[i, len(poly):] = poly[-1]
+        self.build_grid(cell_size)
+
+    # 建立均匀网格 默认单元边长取区域包围盒边长的中位数
+    def build_grid(self, cell_size):
+        if len(self.zones) == 0:
+            self.origin = np.zeros(3)
+            self.cell_size = 1.0
+            self.shape = np.ones(3, dtype=np.int64)
+            self.cell_start = np.zeros(2, dtype=np.int64)
+            self.cell_zones = np.zeros(0, dtype=np.int64)
+            return
+        if cell_size is None:
+            cell_size = float(np.median(self.upper - self.lower))
+            cell_size = cell_size if cell_size > 0 else 1.0
+        self.origin = self.lower.min(axis=0)
+        extent = np.maximum(self.upper.max(axis=0) - self.origin, 1e-9)
+        cell_size = max(cell_size, float(np.cbrt(np.prod(extent) / MAX_CELLS)))
+        self.cell_size = cell_size
+        self.shape = np.maximum(np.ceil((self.upper.max(axis=0) - self.origin) / cell_size).astype(np.int64), 1)
+        first = np.clip(np.floor((self.lower - self.origin) / cell_size).astype(np.int64), 0, self.shape - 1)
+        last = np.clip(np.floor((self.upper - self.origin) / cell_size).astype(np.int64), 0, self.shape - 1)
+        cells = []
+        owners = []
+        for zone, (a, b) in enumerate(zip(first, last)):
+            grid = np.mgrid[a[0]:b[0] + 1, a[1]:b[1] + 1, a[2]:b[2] + 1].reshape(3, -1).T
+            cells.append(self.flat_cell(grid))
+            owners.append(np.full(len(grid), zone, dtype=np.int64))
+        cells = np.concatenate(cells)
+        owners = np.concatenate(owners)
+        order = np.argsort(cells, kind="stable")
+        self.cell_zones = owners[order]
+        counts = np.bincount(cells, minlength=int(np.prod(self.shape)))
+        self.cell_start = np.concatenate([[0], np.cumsum(counts)])
+
+    def flat_cell(self, grid):
+        return (grid[:, 0] * self.shape[1] + grid[:, 1]) * self.shape[2] + grid[:, 2]
+
+    # 查询一批点所在的区域 返回(点序号, 区域序号) 两个等长数组
+    def query(self, points):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        grid = np.floor((points - self.origin) / self.cell_size).astype(np.int64)
+        # 范围为单元边长整数倍时 上表面/最大角上的点落在shape处 归入最后一个单元(登记区域时上界同样按闭区间处理)
+        inside = np.all((grid >= 0) & (grid <= self.shape), axis=1)
+        point_ids = np.nonzero(inside)[0]
+        cells = self.flat_cell(np.minimum(grid[inside], self.shape - 1))
+        starts = self.cell_start[cells]
+        counts = self.cell_start[cells + 1] - starts
+        # 展开为候选对
+        pair_points = np.repeat(point_ids, counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        pair_zones = self.cell_zones[np.repeat(starts, counts) + offsets]
+        keep = self.contains(points[pair_points], pair_zones)
+        return pair_points[keep], pair_zones[keep]
+
+    # 精确判断 points[i]是否在zones[i]内
+    def contains(self, points, zones):
+        result = np.all((points >= self.lower[zones]) & (points <= self.upper[zones]), axis=1)
+        prism = np.nonzero(result & self.is_prism[zones])[0]
+        if len(prism):
+            axis = self.axis[zones[prism]]
+            u_axis = np.where(axis == 0, 1, 0)
+            v_axis = np.where(axis == 2, 1, 2)
+            u = points[prism, u_axis][:, None]
+            v = points[prism, v_axis][:, None]
+            poly = self.polygons[zones[prism]]
+            u0, v0 = poly[:, :, 0], poly[:, :, 1]
+            u1, v1 = np.roll(u0, -1, axis=1), np.roll(v0, -1, axis=1)
+            # 射线法: 向+u方向的射线与多边形边的交点个数为奇数时在内部
+            with np.errstate(divide="ignore", invalid="ignore"):
+                crossing = ((v0 > v) != (v1 > v)) & (u < (u1 - u0) * (v - v0) / (v1 - v0) + u0)
+            result[prism] = np.count_nonzero(crossing, axis=1) % 2 == 1
+        return result
+
+    # 逐区域暴力判断 用于验证与对比
+    def query_brute(self, points):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        pair_points = np.repeat(np.arange(len(points)), len(self.zones))
+        pair_zones = np.tile(np.arange(len(self.zones)), len(points))
+        keep = self.contains(points[pair_points], pair_zones)
+        return pair_points[keep], pair_zones[keep]
+
+
+# 区域事件引擎 维护每个标记点当前所在的区域
+# 事件为字典: time marker zone type(enter/leave/dwell) duration(已在区域内的时间)
+# dwell: 进入后连续停留达到dwell_time时发出一次
+class ZoneEngine:
+    def __init__(self, zones, cell_size=None, dwell_time=1.0):
+        self.index = ZoneIndex(zones, cell_size)
+        self.dwell_time = dwell_time
+        self.inside = {}  # marker -> {zone序号: [进入时间, 是否已发出dwell]}
+        self.event_count = 0
+
+    def clear(self):
+        self.inside = {}
+
+    # 输入一批按时间排序的点 返回事件列表
+    def update(self, timestamps, marker_ids, points):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        timestamps = np.broadcast_to(np.asarray(timestamps, dtype=np.float64), len(points))
+        marker_ids = np.broadcast_to(np.asarray(marker_ids, dtype=np.int64), len(points))
+        pair_points, pair_zones = self.index.query(points)
+        # 按点分组 每个点所在的区域集合
+        bounds = np.searchsorted(pair_points, np.arange(len(points) + 1))
+        events = []
+        zones = self.index.zones
+        for i in range(len(points)):
+            stamp = float(timestamps[i])
+            marker = int(marker_ids[i])
+            current = set(pair_zones[bounds[i]:bounds[i + 1]].tolist())
+            state = self.inside.setdefault(marker, {})
+            for zone in list(state):
+                if zone not in current:
+                    enter_time, _dwelled = state.pop(zone)
+                    events.append({"time": stamp, "marker": marker, "zone": zones[zone].name, "type": "leave",
+                                   "duration": stamp - enter_time})
+            for zone in current:
+                if zone not in state:
+                    state[zone] = [stamp, False]
+                    events.append({"time": stamp, "marker": marker, "zone": zones[zone].name, "type": "enter",
+                                   "duration": 0.0})
+                elif not state[zone][1] and stamp - state[zone][0] >= self.dwell_time:
+                    state[zone][1] = True
+                    events.append({"time": stamp, "marker": marker, "zone": zones[zone].name, "type": "dwell",
+                                   "duration": stamp - state[zone][0]})
+        self.event_count += len(events)
+        return events
+
+
+# 随机生成区域 一半长方体 一半六边形棱柱 分布在space^3空间内
+def make_random_zones(num, space=10.0, size=0.5, seed=0):
+    rng = np.random.default_rng(seed)
+    zones = []
+    for i in range(num):
+        center = rng.uniform(0, space, 3)
+        half = rng.uniform(0.5, 1.0, 3) * size
+        if i % 2 == 0:
+            zones.append(Zone.box(f"box{i}", center - half, center + half))
+        else:
+            angles = np.linspace(0, 2 * np.pi, 6, endpoint=False) + rng.uniform(0, np.pi)
+            polygon = np.stack([center[0] + half[0] * np.cos(angles), center[2] + half[2] * np.sin(angles)], axis=1)
+            zones.append(Zone.prism(f"prism{i}", polygon, center[1] - half[1], center[1] + half[1]))
+    return zones
+
+
+# main test: 区域数量增加时 网格索引与暴力判断的单点耗时 并验证结果一致
+# 用法: python zones.py [点数]
+if __name__ == "__main__":
+    point_num = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rng = np.random.default_rng(1)
+    points = rng.uniform(0, 10, (point_num, 3))
+    for zone_num in (10, 100, 1000):
+        index = ZoneIndex(make_random_zones(zone_num))
+        start = time.perf_counter()
+        grid_result = index.query(points)
+        grid_cost = (time.perf_counter() - start) / point_num * 1e9
+        brute_points = points[:max(point_num // zone_num, 1000)]
+        start = time.perf_counter()
+        brute_result = index.query_brute(brute_points)
+        brute_cost = (time.perf_counter() - start) / len(brute_points) * 1e9
+        check = index.query(brute_points)
+        same = (sorted(zip(*[a.tolist() for a in check])) == sorted(zip(*[a.tolist() for a in brute_result])))
+        # 区域的角点都在边界上
+        corners = np.concatenate([index.lower, index.upper])
+        same = same and (sorted(zip(*[a.tolist() for a in index.query(corners)]))
+                         == sorted(zip(*[a.tolist() for a in index.query_brute(corners)])))
+        print(f"{zone_num:5d} zones: grid {grid_cost:7.0f} ns/point, brute {brute_cost:8.0f} ns/point, "
+              f"hits {len(grid_result[0])}, same as brute: {same}")
+
+    # 边界: 范围恰为单元边长整数倍 上表面与最大角上的点
+    index = ZoneIndex([Zone.box("unit", [0, 0, 0], [1, 1, 1]), Zone.box("pair", [1, 0, 0], [2, 1, 1])], cell_size=1.0)
+    edge_points = [[0.5, 0.5, 0.5], [0.5, 0.5, 1.0], [1, 1, 1], [0, 0, 0], [2, 1, 1], [2, 0.5, 0.5], [2.0001, 1, 1]]
+    grid_pairs = sorted(zip(*[a.tolist() for a in index.query(edge_points)]))
+    brute_pairs = sorted(zip(*[a.tolist() for a in index.query_brute(edge_points)]))
+    print(f"boundary: grid {len(grid_pairs)} hits, brute {len(brute_pairs)} hits, same: {grid_pairs == brute_pairs}")
+
+    engine = ZoneEngine(make_random_zones(200), dwell_time=0.1)
+    t = np.arange(2000) / 100.0
+    path = np.stack([5 + 4 * np.cos(t), 5 + np.sin(3 * t), 5 + 4 * np.sin(t)], axis=1)
+    start = time.perf_counter()
+    events = engine.update(t, 0, path)
+    cost = (time.perf_counter() - start) / len(t) * 1e6
+    kinds = {kind: sum(event["type"] == kind for event in events) for kind in ("enter", "leave", "dwell")}
+    print(f"engine: {cost:.1f} us/point, events {kinds}")